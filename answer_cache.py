@@ -0,0 +1,160 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from query_analysis import analyze_query
+from financial_facts import concepts_in
+from tracing import span
+
+# Time-to-live per kind of answer: IR PDFs are static, web results go stale quickly
+RAG_TTL_SECONDS = 7 * 24 * 3600
+WEB_TTL_SECONDS = 30 * 60
+DEFAULT_TTL_SECONDS = 24 * 3600
+SIMILARITY_THRESHOLD = 0.92
+MAX_ENTRIES = 2000
+
+# Follow-ups only make sense together with the conversation history, never serve them from cache
+FOLLOWUP_PATTERN = re.compile(r"^(and|what about|how about|und|was ist mit|und wie)\b", re.IGNORECASE)
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.lower()).strip()
+    return question.strip(" ?!.,;:")
+
+def question_entities(question: str) -> tuple:
+    # Embeddings of "Apple revenue 2022" and "Microsoft revenue 2022" (or "... 2023") are nearly identical,
+    # so a semantic hit must name the same companies, metrics and numbers
+    key = normalize_question(question)
+    return (frozenset(analyze_query(question)["companies"]), frozenset(concepts_in(question)),
+            frozenset(re.findall(r"\d+", key)))
+
+def ttl_for_source(source: str) -> int:
+    source = (source or "").lower()
+    if source.startswith("http") or "web" in source or "source unknown" in source:
+        return WEB_TTL_SECONDS
+    if source.startswith("rag-agent") and "general_chat" not in source:
+        return RAG_TTL_SECONDS
+    return DEFAULT_TTL_SECONDS
+
+class CachedAnswer:
+    def __init__(self, question, answer, source, qa, ttl):
+        self.question = question
+        self.answer = answer
+        self.source = source
+        self.qa = qa
+        self.created = time.time()
+        self.expires = self.created + ttl
+        self.hits = 0
+        self.vector = None
+        self.entities = question_entities(question)
+
+    def expired(self, now=None) -> bool:
+        return (now or time.time()) >= self.expires
+
+
+# === Two-level answer cache: exact normalized question, then nearest question embedding ===
+class AnswerCache:
+    def __init__(self, embed_fn=None, similarity_threshold: float = SIMILARITY_THRESHOLD,
+                 max_entries: int = MAX_ENTRIES, ttl_fn=ttl_for_source):
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_fn = ttl_fn
+        self._entries = OrderedDict()  # normalized question -> CachedAnswer, in LRU order
+        self._matrix = None            # stacked unit vectors of the entries (rebuilt lazily)
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stored": 0, "rejected": 0}
+
+    def cacheable(self, question: str) -> bool:
+        return bool(question.strip()) and not FOLLOWUP_PATTERN.match(question.strip())
+
+    def _embed(self, question):
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def get(self, question: str, semantic: bool = True):
+        # semantic=False: exact matches only, the embedding model is not touched (e.g. smalltalk)
+        with span("answer_cache") as current:
+            entry = self._lookup(question, semantic)
+            current.set(cache_hit=entry is not None)
+            return entry
+
+    def _lookup(self, question: str, semantic: bool = True):
+        if not self.cacheable(question):
+            return None
+        key = normalize_question(question)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expired(now):
+                self._drop(key)
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                self.stats["exact_hits"] += 1
+                return entry
+            if self.embed_fn is None or not semantic or not self._entries:
+                self.stats["misses"] += 1
+                return None
+
+        vector = self._embed(question)
+        entities = question_entities(question)
+
+        with self._lock:
+            if self._matrix is None:
+                self._matrix_keys = [k for k, e in self._entries.items() if e.vector is not None]
+                self._matrix = (np.stack([self._entries[k].vector for k in self._matrix_keys])
+                                if self._matrix_keys else np.zeros((0, len(vector)), dtype=np.float32))
+            scores = self._matrix @ vector if len(self._matrix_keys) else np.zeros(0)
+            for idx in np.argsort(-scores):
+                if scores[idx] < self.similarity_threshold:
+                    break
+                candidate_key = self._matrix_keys[idx]
+                entry = self._entries.get(candidate_key)
+                if entry is None or entry.expired(now):
+                    continue
+                if entry.entities != entities:
+                    continue
+                self._entries.move_to_end(candidate_key)
+                entry.hits += 1
+                self.stats["semantic_hits"] += 1
+                return entry
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, question: str, answer: str, source: str, qa: str = "", insufficient: bool = False,
+            semantic: bool = True):
+        # Insufficient answers would otherwise pin a bad answer for the whole TTL
+        if insufficient or not answer or not self.cacheable(question):
+            with self._lock:
+                self.stats["rejected"] += 1
+            return None
+        key = normalize_question(question)
+        entry = CachedAnswer(question, answer, source, qa, self.ttl_fn(source))
+        if self.embed_fn is not None and semantic:
+            entry.vector = self._embed(question)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+            self.stats["stored"] += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def __len__(self):
+        return len(self._entries)
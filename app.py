@@ -2,83 +2,191 @@
 import gradio as gr
 import os
 import re
-from pathlib import Path
+import time
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from supervisor_main import (
-    rag_agent, tools, ask_question_and_save_answer,
-    qa_ethics_agent, is_smalltalk, is_insufficient,
-    adjust_temporal_phrasing, log_to_file
+    registry, analysis_answer,
+    start_warm_up, ask_question_and_save_answer,
+    qa_ethics_agent, is_insufficient,
+    adjust_temporal_phrasing, log_to_file, answer_cache,
+    speculative_answer, rag_answer, general_chat_answer,
+    stream_rag_answer, stream_general_chat_answer, supervisor_answer,
+    RAG_MODE, plan_route,
 )
-from data_analysis_agent import agent as data_analysis_agent
-
-
-history = []
-
-# === Funktion: Erkenne Analyseaufträge ===
-def is_data_analysis_request(user_input: str) -> bool:
-    chart_keywords = [
-        "analysiere", "analyse", "plot", "diagramm", "visualisiere",
-        "statistik", "vergleich", "vergleiche", "csv", "datenanalyse",
-        "korrelation", "trend", "zeitreihe", "daten", "tabelle"
-    ]
-    finance_keywords = [
-        "umsatz", "gewinn", "einnahmen", "ausgaben", "cash", "kapital",
-        "verbindlichkeit", "kosten", "aktien", "bilanz", "umsätze"
-    ]
-    return any(a in user_input.lower() for a in chart_keywords) and any(f in user_input.lower() for f in finance_keywords)
-
-
-# === Neu: Suche nach neuestem Diagramm im Ordner ===
-def get_latest_figure():
-    figures_path = Path("figures")
-    if not figures_path.exists():
-        return None
-    figures = list(figures_path.glob("*.png"))
-    return str(max(figures, key=os.path.getctime)) if figures else None
-
+from conversation_memory import ConversationMemory
+from router import is_data_analysis_request  # kept importable from app for existing callers
+from streaming import FirstTokenTimer
+from tracing import start_span, run_in_span, start_metrics_server, debug
+
+
+# === Async serving: blocking agent calls run in a worker pool, with timeouts ===
+MAX_CONCURRENT_CHATS = 32
+RAG_TIMEOUT = 90
+WEB_TIMEOUT = 30
+ANALYSIS_TIMEOUT = 180
+CHAT_TIMEOUT = 30
+# Stream the final LLM tokens of the RAG/general_chat answers (CHAT_STREAMING=0 turns it off)
+STREAM_ANSWERS = os.getenv("CHAT_STREAMING", "1") != "0"
+SESSION_IDLE_SECONDS = 3600
+
+agent_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CHATS, thread_name_prefix="agent")
+async def run_blocking(fn, *args, timeout=None, trace=None, **kwargs):
+    loop = asyncio.get_running_loop()
+    # The worker thread does not inherit the request's context: spans are attached to `trace` explicitly
+    call = functools.partial(run_in_span, trace, fn, *args, **kwargs)
+    return await asyncio.wait_for(loop.run_in_executor(agent_executor, call), timeout)
+
+# === Per-session conversation state (keyed by the Gradio session) ===
+sessions = {}
+sessions_lock = threading.Lock()
+
+def get_session(request):
+    key = getattr(request, "session_hash", None) or "default"
+    now = time.time()
+    with sessions_lock:
+        # Forget sessions that have been idle for too long
+        for stale in [k for k, v in sessions.items() if now - v["last_seen"] > SESSION_IDLE_SECONDS]:
+            del sessions[stale]
+        session = sessions.setdefault(key, {"id": key, "memory": ConversationMemory(), "last_seen": now})
+        session["last_seen"] = now
+    return session
 
 # === Hauptlogik ===
-def chat_supervisor(message, chat_history):
-    global history
-    user_input = message.strip()
-    adjusted_input = adjust_temporal_phrasing(user_input)
-    history.append({"role": "user", "content": user_input})
-
-    image_path = None
-
-    if is_data_analysis_request(user_input):
-        try:
-            answer = data_analysis_agent.run(user_input)
+async def stream_answer(stream, timer, result: dict):
+    # Re-yields the growing answer text; the complete answer ends up in result["answer"]
+    shown = ""
+    async for kind, text in stream:
+        if kind == "token":
+            timer.mark_token()
+            shown += text
+            yield shown
+        else:
+            result["answer"] = text
+
+async def chat_supervisor(message, chat_history, request: gr.Request = None):
+    timer = FirstTokenTimer()
+    session = get_session(request)
+    # Root span of this request; not a `with` block because the generator yields in between
+    trace = start_span("request", session=session["id"])
+    try:
+        memory = session["memory"]
+        trace.set(history_tokens=memory.tokens())
+        # "and in 2024?" gets the company and metric of the earlier questions, so it stands alone
+        user_input = memory.expand_followup(message.strip())
+        adjusted_input = adjust_temporal_phrasing(user_input)
+
+        image_path = None
+        # Same decision as the CLI: cache → facts → router → speculation → recent year → RAG
+        route, _, hit = await run_blocking(plan_route, user_input, trace=trace)
+        cached = hit if route == "Cache" else None
+        facts_answer = hit if route == "Facts-Store" else None
+
+        # Routing decision first, so the user sees right away what is happening
+        yield f"🔀 Route: {route} …", None
+
+        if route == "Cache":
+            answer, source = cached.answer, cached.source
+
+        elif route == "Data-Analysis-Agent":
             source = "Data-Analysis-Agent"
-            image_path = get_latest_figure()
-        except Exception as e:
-            answer = f"Fehler beim Data-Analysis-Agent: {e}"
-            source = "Data-Analysis-Agent"
-
-    elif is_smalltalk(user_input):
-        general_chat_tool = tools[0]
-        answer = general_chat_tool.run(user_input)
-        source = "RAG-Agent (general_chat)"
-
-    else:
-        try:
-            result = rag_agent.invoke({"input": adjusted_input, "history": history})
-            answer = result.get("output") if isinstance(result, dict) else str(result)
-            source = "RAG-Agent"
-
-            if is_insufficient(answer, adjusted_input):
-                answer, source = ask_question_and_save_answer(user_input)
-
-        except Exception:
-            answer, source = ask_question_and_save_answer(user_input)
-
-    history.append({"role": "assistant", "content": answer})
-    qa = qa_ethics_agent.run(answer, [source])
-    annotated = f"{answer}\n\n📚 Quelle: {source}\n⚖️ QA/Ethikprüfung: {qa}"
-    log_to_file(user_input, answer, source)
-
-    return (annotated, image_path)
+            try:
+                # Direct chart requests come from the figure cache; the agent reports the charts it drew
+                answer, source, image_path = await run_blocking(analysis_answer, user_input,
+                                                                timeout=ANALYSIS_TIMEOUT, trace=trace)
+            except asyncio.TimeoutError:
+                answer = f"Der Data-Analysis-Agent hat nicht innerhalb von {ANALYSIS_TIMEOUT}s geantwortet."
+            except Exception as e:
+                answer = f"Fehler beim Data-Analysis-Agent: {e}"
+
+        elif route == "Facts-Store":
+            # Direct metric lookup from the financial facts store, no LLM involved
+            answer, source = facts_answer
+
+        elif route == "general_chat":
+            if STREAM_ANSWERS:
+                result = {}
+                stream = stream_general_chat_answer(user_input, CHAT_TIMEOUT, parent=trace)
+                async for partial in stream_answer(stream, timer, result):
+                    yield partial, None
+                answer, source = result["answer"], "RAG-Agent (general_chat)"
+            else:
+                answer, source = await run_blocking(general_chat_answer, user_input, timeout=CHAT_TIMEOUT, trace=trace)
+
+        elif route == "Supervisor":
+            # Router was unsure: one supervisor LLM call picks the agent
+            try:
+                answer, source = await run_blocking(supervisor_answer, adjusted_input, memory.as_messages(),
+                                                    timeout=RAG_TIMEOUT, trace=trace)
+            except Exception:
+                answer, source = await web_answer(user_input, trace)
+
+        elif route == "Web-Agent":
+            answer, source = await web_answer(user_input, trace)
+
+        elif route == "RAG + Websuche":
+            # Likely needs the web: RAG and web search start together, first good answer wins
+            try:
+                answer, source = await run_blocking(speculative_answer, adjusted_input, user_input, memory.as_prompt(),
+                                                    RAG_TIMEOUT, timeout=RAG_TIMEOUT + 5, trace=trace)
+            except Exception:
+                answer, source = await web_answer(user_input, trace)
+
+        else:
+            try:
+                # The direct mode is a single short generation (plus a possible escalation): not streamed
+                if STREAM_ANSWERS and RAG_MODE != "direct":
+                    result = {}
+                    stream = stream_rag_answer(adjusted_input, memory.as_prompt(), RAG_TIMEOUT, parent=trace)
+                    async for partial in stream_answer(stream, timer, result):
+                        yield partial, None
+                    answer, source = result["answer"], "RAG-Agent"
+                else:
+                    answer, source = await run_blocking(rag_answer, adjusted_input, memory.as_prompt(),
+                                                        timeout=RAG_TIMEOUT, trace=trace)
+
+                if is_insufficient(answer, adjusted_input):
+                    yield f"{answer}\n\n🔎 Keine ausreichende Antwort in den Dokumenten, Websuche läuft …", None
+                    answer, source = await web_answer(user_input, trace)
+
+            except Exception:
+                # Includes the RAG timeout
+                answer, source = await web_answer(user_input, trace)
+
+        # Answers that were not streamed become visible only now
+        timer.mark_token()
+        memory.add_turn(user_input, answer)
+        if cached:
+            qa = cached.qa
+        else:
+            yield f"{answer}\n\n📚 Quelle: {source}\n⚖️ QA/Ethikprüfung läuft …", image_path
+            qa = await run_blocking(qa_ethics_agent.run, answer, [source], trace=trace)
+        annotated = f"{answer}\n\n📚 Quelle: {source}\n⚖️ QA/Ethikprüfung: {qa}"
+        timer.finish()
+        yield annotated, image_path
+
+        trace.set(route=route, **timer.as_dict())
+        debug(f"[Latency] {route}: {timer.format()}")
+        insufficient = is_insufficient(answer, adjusted_input)
+        if not cached and source != "Data-Analysis-Agent" and not source.endswith("(Timeout)"):
+            await run_blocking(answer_cache.put, user_input, answer, source, qa, insufficient=insufficient,
+                               semantic=route != "general_chat")
+        log_to_file(user_input, answer, source, session=session["id"], route=route, timings=timer.as_dict(),
+                    qa=qa, insufficient=insufficient)
+
+    finally:
+        # Also ends abandoned requests (client disconnect) so their spans are exported
+        trace.end()
+
+async def web_answer(user_input, trace=None):
+    try:
+        return await run_blocking(ask_question_and_save_answer, user_input, timeout=WEB_TIMEOUT, trace=trace)
+    except asyncio.TimeoutError:
+        return f"Die Websuche hat nicht innerhalb von {WEB_TIMEOUT}s geantwortet.", "Web-Agent (Timeout)"
 
 
 # === Gradio UI ===
@@ -88,10 +196,19 @@ demo = gr.ChatInterface(
     description="Kombinierte KI mit RAG + Websuche + Statistik + QA. Stelle Fragen zu Umsatz, Firmen, Trends & mehr.",
     chatbot=gr.Chatbot(height=500),
     textbox=gr.Textbox(placeholder="Frage z.B. 'Zeige Apple Umsatz als Diagramm'", label="Frage"),
-    additional_outputs=[gr.Image(label="📈 Diagramm", visible=True)]
+    additional_outputs=[gr.Image(label="📈 Diagramm", visible=True)],
+    # Chats of different users run concurrently instead of one after another
+    concurrency_limit=MAX_CONCURRENT_CHATS
 )
 
 
 if __name__ == "__main__":
+    # Components are built on first use; WARMUP_COMPONENTS builds them in the background instead
+    start_warm_up(on_done=lambda: print(registry.startup_report()))
+    try:
+        # p50/p95/p99 per stage, tokens and cache hits: http://127.0.0.1:9464/metrics (METRICS_PORT)
+        start_metrics_server()
+    except OSError as e:
+        print(f"⚠️ Metrics endpoint not started: {e}")
     demo.launch()
 
@@ -0,0 +1,105 @@
+"""Chunk count, index size and recall@k: RecursiveCharacterTextSplitter vs. table_chunker.py.
+
+Both strategies chunk the same extraction records and are indexed the way data_chunkieren.py
+does it (Chroma + BM25), each in its own temporary directory. Recall@k is the share of labelled
+questions with a chunk from a target (file, page) among the first k hybrid-retrieval hits.
+
+    python benchmarks/retrieval_labels.py                    # labels from financial_facts.db
+    python benchmarks/bench_chunking.py --labels benchmarks/retrieval_labels.jsonl
+    python benchmarks/bench_chunking.py --sparse-only        # BM25 only, no encoder needed
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from data_chunkieren import DATA_PATH, load_structured_data, chunk_documents, chunk_ids
+from hybrid_retrieval import BM25Index, HybridRetriever
+from query_analysis import analyze_query, relaxed_filters
+from bench_vector_index import directory_mb
+
+STRATEGIES = ["recursive", "table"]
+K_VALUES = [1, 3, 5, 10]
+
+def build_index(chunks, directory: str, sparse_only: bool):
+    ids = chunk_ids("bench", chunks)
+    bm25 = BM25Index.build(ids, [c.page_content for c in chunks], [c.metadata for c in chunks])
+    bm25.save(os.path.join(directory, "bm25_index.json"))
+    if sparse_only:
+        return None, bm25
+    from langchain_chroma import Chroma
+    from embedding_cache import get_embeddings
+    vectorstore = Chroma(collection_name="bench", embedding_function=get_embeddings(),
+                         persist_directory=directory)
+    for start in range(0, len(chunks), 1000):
+        vectorstore.add_documents(chunks[start:start + 1000], ids=ids[start:start + 1000])
+    return vectorstore, bm25
+
+def retrieve(question: str, vectorstore, bm25, k: int) -> list:
+    if vectorstore is not None:
+        return HybridRetriever(vectorstore=vectorstore, bm25=bm25, top_n=k).invoke(question)
+    # Same filter relaxation as the hybrid retriever, sparse side only
+    for where in relaxed_filters(analyze_query(question)):
+        hits = [doc for doc, _ in bm25.search(question, k=k, where=where)]
+        if hits:
+            return hits
+    return []
+
+def recall(labels: list, vectorstore, bm25) -> dict:
+    hits = {k: 0 for k in K_VALUES}
+    for label in labels:
+        targets = {(file, page) for file, page in label["targets"]}
+        docs = retrieve(label["question"], vectorstore, bm25, max(K_VALUES))
+        found = [(doc.metadata.get("file"), doc.metadata.get("page")) in targets for doc in docs]
+        for k in K_VALUES:
+            hits[k] += any(found[:k])
+    return {k: hits[k] / len(labels) for k in K_VALUES}
+
+def main():
+    parser = argparse.ArgumentParser(description="Recursive splitter vs. table-aware chunking")
+    parser.add_argument("--data", default=os.path.join(ROOT, DATA_PATH))
+    parser.add_argument("--labels", default=None, help="retrieval_labels.jsonl for recall@k")
+    parser.add_argument("--sparse-only", action="store_true", help="BM25 only: no embeddings, no Chroma")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data):
+        sys.exit(f"❌ {args.data} not found: run `python \"data_ extract.py\"` first.")
+    documents = load_structured_data(args.data)
+    source_chars = sum(len(doc.page_content) for doc in documents)
+    labels = []
+    if args.labels:
+        from retrieval_labels import load_labels
+        labels = load_labels(args.labels)
+    print(f"{len(documents)} records ({source_chars / 1e6:.1f}M chars), {len(labels)} labelled questions")
+
+    workdir = tempfile.mkdtemp(prefix="bench_chunking_")
+    rows = []
+    for strategy in STRATEGIES:
+        started = time.perf_counter()
+        chunks = chunk_documents(documents, strategy=strategy)
+        chunk_seconds = time.perf_counter() - started
+        directory = os.path.join(workdir, strategy)
+        os.makedirs(directory)
+        started = time.perf_counter()
+        vectorstore, bm25 = build_index(chunks, directory, args.sparse_only)
+        index_seconds = time.perf_counter() - started
+        chunk_chars = sum(len(c.page_content) for c in chunks)
+        rows.append((strategy, len(chunks), chunk_chars / source_chars, directory_mb(directory), chunk_seconds,
+                     index_seconds, recall(labels, vectorstore, bm25) if labels else None))
+
+    recall_header = " ".join(f"{f'R@{k}':>6}" for k in K_VALUES) if labels else ""
+    print(f"\n{'strategy':<10} {'chunks':>8} {'text x':>7} {'index':>9} {'chunk':>7} {'index':>8} {recall_header}")
+    for strategy, count, blowup, size, chunk_seconds, index_seconds, recalls in rows:
+        recall_cells = " ".join(f"{recalls[k]:6.3f}" for k in K_VALUES) if recalls else ""
+        print(f"{strategy:<10} {count:8d} {blowup:7.2f} {size:7.1f}MB {chunk_seconds:6.1f}s {index_seconds:7.1f}s "
+              f"{recall_cells}")
+    if not labels:
+        print("ℹ️ recall@k skipped: pass --labels (python benchmarks/retrieval_labels.py builds them)")
+    print(f"  work directory: {workdir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Offline end-to-end benchmark of the supervisor pipeline (CPU only, no network).
+
+Gemini, Tavily and the HF InferenceClient are replaced by deterministic fakes with
+configurable latency (registry.override), so changes to routing, caching, retrieval
+or concurrency show up as numbers before deployment.
+
+    python benchmarks/bench_e2e.py --replay --synthetic 100 --users 8
+    python benchmarks/bench_e2e.py --target app --synthetic 200 --users 32 --llm-latency 0.2
+    python benchmarks/bench_e2e.py --vectorstore chroma --labels benchmarks/retrieval_labels.jsonl --k 5
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import warnings
+import tracemalloc
+from types import SimpleNamespace
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+COMPANIES = ["Apple", "Microsoft", "Alphabet", "Meta", "NVIDIA", "Amazon"]
+METRICS = ["revenue", "net income", "operating income", "cash and cash equivalents", "total assets"]
+YEARS = list(range(2020, 2025))
+
+
+# === 1. Workload: questions from the text logs plus a synthetic mix over all routes ===
+def replay_questions(chat_log: str, answers_log: str) -> list:
+    from interaction_log import parse_chat_log, parse_answers_log
+    questions = []
+    for path, parse in ((chat_log, parse_chat_log), (answers_log, parse_answers_log)):
+        if os.path.exists(path):
+            questions.extend(record["question"] for record in parse(path))
+    return questions
+
+def synthetic_questions(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    templates = [
+        (0.45, lambda: f"What was {rng.choice(COMPANIES)}'s {rng.choice(METRICS)} in {rng.choice(YEARS[:-1])}?"),
+        (0.15, lambda: f"What is {rng.choice(COMPANIES)}'s current {rng.choice(METRICS)}?"),
+        (0.15, lambda: rng.choice(["hello", "thanks!", "how are you?", "hi there"])),
+        (0.15, lambda: f"How did {rng.choice(COMPANIES)} describe its {rng.choice(METRICS)} outlook in {rng.choice(YEARS)}?"),
+        (0.10, lambda: f"Analysiere den Umsatz von {rng.choice(COMPANIES)} als Diagramm"),
+    ]
+    weights = [weight for weight, _ in templates]
+    return [rng.choices(templates, weights=weights)[0][1]() for _ in range(count)]
+
+
+# === 2. Offline backends injected through the component registry ===
+def synthetic_corpus():
+    # Table-like chunks with the same metadata keys as data_chunkieren.py writes
+    from langchain_core.documents import Document
+    docs = []
+    for company in COMPANIES:
+        for year in YEARS:
+            for page, metric in enumerate(METRICS, start=1):
+                value = (sum(map(ord, f"{company}{metric}{year}")) % 900) + 100
+                docs.append(Document(
+                    page_content=f"{company} | {metric} | fiscal {year} | {value}.{year % 100:02d} million",
+                    metadata={"company": company, "company_key": company.lower(), "year": year,
+                              "file": f"{company}_{year}_annual_report.pdf", "page": page, "type": "table"},
+                ))
+    return docs
+
+def setup_backends(args, workdir: str):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import supervisor_main
+    from supervisor_main import registry
+    from rag_agnet_brandnew import (setup_tools, create_agent, load_existing_vectorstore, build_retriever,
+                                    RETRIEVAL_K, DirectRAG)
+    from hybrid_retrieval import HybridRetriever, BM25Index, RecentQueryRetriever
+    from search_cache import WebSearch, SearchCache, StubBackend
+    from tracing import tracing_callback
+    from fakes import FakeGemini, make_fake_inference_model
+
+    llm = FakeGemini(latency=args.llm_latency, token_latency=args.token_latency, callbacks=[tracing_callback])
+    registry.override("llm", llm)
+
+    if args.vectorstore == "chroma":
+        # Real index and embedding model (must be available locally)
+        vectorstore = load_existing_vectorstore()
+        retriever = RecentQueryRetriever(retriever=build_retriever(vectorstore))
+        registry.override("retriever", retriever)
+        tools = setup_tools(vectorstore, llm=llm, retriever=retriever)
+        registry.override("direct_rag", DirectRAG(vectorstore, llm=llm, retriever=retriever))
+    else:
+        from langchain_chroma import Chroma
+        embeddings = DeterministicFakeEmbedding(size=384)
+        vectorstore = Chroma(collection_name=f"bench_{os.getpid()}", embedding_function=embeddings)
+        # Random fake vectors give L2 distances outside [0, 1]; the speculation check still ranks them
+        warnings.filterwarnings("ignore", message="Relevance scores must be between 0 and 1")
+        vectorstore.add_documents(synthetic_corpus())
+        retriever = RecentQueryRetriever(retriever=HybridRetriever(
+            vectorstore=vectorstore, bm25=BM25Index.from_vectorstore(vectorstore), top_n=RETRIEVAL_K))
+        registry.override("retriever", retriever)
+        tools = setup_tools(vectorstore, llm=llm, retriever=retriever)
+        # Fake vectors carry no relevance signal: only the answer check decides on escalation
+        registry.override("direct_rag", DirectRAG(vectorstore, llm=llm, retriever=retriever, min_relevance=None))
+        # The answer cache and the intent router embed questions too; keep them off the real model as well
+        supervisor_main.answer_cache.embed_fn = embeddings.embed_query
+        supervisor_main.router.embeddings = embeddings
+    registry.override("vectorstore", vectorstore)
+    registry.override("tools", tools)
+    registry.override("general_chat", setup_tools(None, llm=llm)[0])
+    rag_agent = create_agent(tools, llm=llm)
+    rag_agent.name = "rag_agent"
+    registry.override("rag_agent", rag_agent)
+
+    backend = StubBackend(latency=args.search_latency, jitter=args.search_latency * 0.2)
+    registry.override("web_search", WebSearch(backend, SearchCache(os.path.join(workdir, "search.db"))))
+
+    try:
+        from smolagents import CodeAgent
+        analysis_agent = CodeAgent(tools=[], model=make_fake_inference_model(args.analysis_latency),
+                                   additional_authorized_imports=["numpy", "pandas"], verbosity_level=0)
+        analysis_agent.name = "data_analysis_agent"
+        registry.override("data_analysis_agent", analysis_agent)
+    except ImportError:
+        print("⚠️ smolagents not installed: analysis requests will fail in the app target.")
+    return vectorstore, backend
+
+
+# === 3. Runners: supervisor_main.answer_question (threads) or app.chat_supervisor (asyncio) ===
+def run_supervisor(questions: list, users: int) -> list:
+    from supervisor_main import answer_question
+    from conversation_memory import ConversationMemory
+    results = []
+
+    def user(index, items):
+        memory = ConversationMemory()
+        for question in items:
+            started = time.perf_counter()
+            try:
+                _, _, _, route = answer_question(question, memory, session=f"bench-{index}")
+            except Exception as e:
+                route = f"error ({type(e).__name__})"
+            results.append({"route": route, "latency": time.perf_counter() - started, "ttft": None})
+
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(lambda index: user(index, questions[index::users]), range(users)))
+    return results
+
+def run_app(questions: list, users: int) -> list:
+    try:
+        import app
+    except ImportError as e:
+        sys.exit(f"❌ --target app needs the Gradio app dependencies ({e}).")
+    results = []
+
+    async def user(index, items):
+        request = SimpleNamespace(session_hash=f"bench-{index}")
+        for question in items:
+            started = time.perf_counter()
+            route, ttft = None, None
+            try:
+                async for text, _ in app.chat_supervisor(question, [], request):
+                    if route is None and text.startswith("🔀 Route: "):
+                        route = text[len("🔀 Route: "):].rstrip(" …")
+                    elif ttft is None:
+                        ttft = time.perf_counter() - started
+            except Exception as e:
+                route = f"error ({type(e).__name__})"
+            results.append({"route": route, "latency": time.perf_counter() - started, "ttft": ttft})
+
+    async def main():
+        await asyncio.gather(*(user(index, questions[index::users]) for index in range(users)))
+
+    asyncio.run(main())
+    return results
+
+
+# === 4. Retrieval recall@k against the labelled question → page set ===
+def recall_at_k(labels: list, vectorstore, k: int) -> float:
+    from rag_agnet_brandnew import build_retriever
+    retriever = build_retriever(vectorstore)
+    if hasattr(retriever, "top_n"):
+        retriever.top_n = k
+    else:
+        retriever.k = k
+    hits = 0
+    for label in labels:
+        targets = {(file, page) for file, page in label["targets"]}
+        docs = retriever.invoke(label["question"])[:k]
+        hits += any((doc.metadata.get("file"), doc.metadata.get("page")) in targets for doc in docs)
+    return hits / len(labels) if labels else 0.0
+
+
+# === 5. Report ===
+def percentile(values, q):
+    from tracing import Metrics
+    return Metrics.quantile(values, q)
+
+def report(results: list, wall: float, extra: dict) -> dict:
+    from tracing import metrics
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[result["route"] or "unknown"].append(result)
+    summary = {"questions": len(results), "wall_seconds": round(wall, 2),
+               "throughput_qps": round(len(results) / wall, 2) if wall else 0.0, "routes": {}, **extra}
+
+    print(f"\n📊 {len(results)} questions in {wall:.1f}s → {summary['throughput_qps']} questions/s")
+    print(f"  {'route':<24} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'ttft p50':>9}")
+    for route, items in sorted(by_route.items(), key=lambda item: -len(item[1])):
+        latencies = [r["latency"] for r in items]
+        ttfts = [r["ttft"] for r in items if r["ttft"] is not None]
+        stats = {"n": len(items), **{f"p{int(q * 100)}": round(percentile(latencies, q), 3) for q in (0.5, 0.95, 0.99)},
+                 "ttft_p50": round(percentile(ttfts, 0.5), 3) if ttfts else None}
+        summary["routes"][route] = stats
+        ttft = f"{stats['ttft_p50']:8.3f}s" if ttfts else f"{'-':>9}"
+        print(f"  {route:<24} {stats['n']:5d} {stats['p50']:7.3f}s {stats['p95']:7.3f}s {stats['p99']:7.3f}s {ttft}")
+    print(metrics.format_report())
+    summary["stages"] = metrics.snapshot()
+    for key, value in extra.items():
+        print(f"  {key}: {value}")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with fake LLM/search backends")
+    parser.add_argument("--target", choices=["supervisor", "app"], default="supervisor")
+    parser.add_argument("--replay", action="store_true", help="Replay questions from the text logs")
+    parser.add_argument("--chat-log", default=os.path.join(ROOT, "chat_log.txt"))
+    parser.add_argument("--answers-log", default=os.path.join(ROOT, "answers_and_sources.txt"))
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of synthetic questions")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent sessions")
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--search-latency", type=float, default=0.8)
+    parser.add_argument("--analysis-latency", type=float, default=1.5)
+    parser.add_argument("--vectorstore", choices=["synthetic", "chroma"], default="synthetic")
+    parser.add_argument("--labels", default=None, help="retrieval_labels.jsonl for recall@k")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rag-mode", choices=["agent", "direct"], default=None, help="RAG_MODE")
+    parser.add_argument("--tracemalloc", action="store_true", help="Track Python heap peak (slower)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Write the summary as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    # Logs and the plan cache of the run stay out of the repo; debug prints would distort the timings
+    os.environ.setdefault("INTERACTION_LOG", os.path.join(workdir, "interactions.jsonl"))
+    os.environ.setdefault("TRACE_LOG", os.path.join(workdir, "traces.jsonl"))
+    os.environ.setdefault("PLAN_CACHE_DB", os.path.join(workdir, "plan_cache.db"))
+    os.environ.setdefault("AGENT_DEBUG", "0")
+    os.environ.setdefault("WARMUP_COMPONENTS", "")
+    if args.rag_mode:
+        os.environ["RAG_MODE"] = args.rag_mode
+
+    questions = replay_questions(args.chat_log, args.answers_log) if args.replay else []
+    questions += synthetic_questions(args.synthetic, args.seed)
+    if not questions:
+        parser.error("no questions: use --replay and/or --synthetic N")
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    vectorstore, search_backend = setup_backends(args, workdir)
+
+    started = time.perf_counter()
+    results = run_app(questions, args.users) if args.target == "app" else run_supervisor(questions, args.users)
+    wall = time.perf_counter() - started
+
+    extra = {"search_backend_calls": search_backend.calls,
+             "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    if args.tracemalloc:
+        extra["python_heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+    if args.labels:
+        from retrieval_labels import load_labels
+        labels = load_labels(args.labels)
+        extra[f"recall@{args.k}"] = round(recall_at_k(labels, vectorstore, args.k), 3)
+        extra["labelled_questions"] = len(labels)
+    else:
+        print("ℹ️ recall@k skipped: pass --labels (python benchmarks/retrieval_labels.py builds them "
+              "from financial_facts.db) together with --vectorstore chroma.")
+
+    from router import router
+    from conversation_memory import format_usage
+    extra["router"] = router.format_stats()
+    extra["memory"] = format_usage()
+    from llm_pool import rag_call_stats
+    extra["llm_calls"] = rag_call_stats.format_stats()
+    summary = report(results, wall, extra)
+    print(f"  logs and traces: {workdir}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Accuracy, latency and memory of the query encoder: PyTorch mpnet vs. the int8 ONNX export.
+
+Accuracy is measured on our own chunks: for every question the top-k chunks found with the
+float model are compared with the top-k found (a) with ONNX query vectors against the existing
+float index and (b) with chunks and questions both re-embedded by ONNX. Each backend runs in
+its own process, so load time and RSS include the imports (torch vs. onnxruntime).
+
+    python onnx_encoder.py                                   # export once (needs optimum + torch)
+    python benchmarks/bench_encoder.py --chunks 2000 --questions 200
+    python benchmarks/bench_encoder.py --max-length 128      # shorter truncation, faster
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import numpy as np
+from bench_vector_index import peak_rss_mb
+
+def load_texts(args):
+    # Chunks from the Chroma DB, or chunked from structured_data.json when there is no DB yet
+    if os.path.exists(os.path.join(args.chroma_dir, "chroma.sqlite3")):
+        import chromadb
+        collection = chromadb.PersistentClient(path=args.chroma_dir).get_collection(args.collection)
+        chunks = collection.get(include=["documents"])["documents"]
+    else:
+        from data_chunkieren import DATA_PATH, load_structured_data, chunk_documents
+        if not os.path.exists(os.path.join(ROOT, DATA_PATH)):
+            sys.exit(f"❌ Neither {args.chroma_dir} nor {DATA_PATH}: no chunks to compare on.")
+        chunks = [c.page_content for c in chunk_documents(load_structured_data(os.path.join(ROOT, DATA_PATH)))]
+    rng = random.Random(args.seed)
+    chunks = rng.sample(chunks, min(args.chunks, len(chunks)))
+
+    from retrieval_labels import LABELS_PATH, load_labels
+    if os.path.exists(os.path.join(ROOT, LABELS_PATH)):
+        questions = [label["question"] for label in load_labels(os.path.join(ROOT, LABELS_PATH))]
+    else:
+        from bench_e2e import synthetic_questions
+        questions = synthetic_questions(args.questions, args.seed)
+    return chunks, questions[:args.questions]
+
+
+# === Worker: one encoder in a fresh process ===
+def worker(args):
+    with open(os.path.join(args.data, "texts.json"), "r", encoding="utf-8") as f:
+        texts = json.load(f)
+    started = time.perf_counter()
+    if args.worker == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        encoder = HuggingFaceEmbeddings(model_name=args.model)
+    else:
+        from onnx_encoder import OnnxEmbeddings, load_or_export
+        encoder = OnnxEmbeddings(load_or_export(args.model), max_length=args.max_length)
+    encoder.embed_query("warm up")
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chunks = np.asarray(encoder.embed_documents(texts["chunks"]), dtype=np.float32)
+    docs_per_second = len(texts["chunks"]) / (time.perf_counter() - started)
+
+    latencies, queries = [], []
+    for question in texts["questions"]:
+        started = time.perf_counter()
+        queries.append(encoder.embed_query(question))
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    # Concurrent sessions: the ONNX encoder batches these, torch encodes them one by one
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(encoder.embed_query, [f"{q} " for q in texts["questions"]]))
+    concurrent_qps = len(texts["questions"]) / (time.perf_counter() - started)
+
+    np.save(os.path.join(args.data, f"{args.worker}_chunks.npy"), chunks)
+    np.save(os.path.join(args.data, f"{args.worker}_queries.npy"), np.asarray(queries, dtype=np.float32))
+    print(json.dumps({"load_s": round(load_seconds, 2), "query_p50_ms": round(latencies[len(latencies) // 2] * 1e3, 2),
+                      "query_p99_ms": round(latencies[min(int(0.99 * len(latencies)), len(latencies) - 1)] * 1e3, 2),
+                      "concurrent_qps": round(concurrent_qps, 1), "docs_per_s": round(docs_per_second, 1),
+                      "rss_mb": round(peak_rss_mb(), 1)}))
+
+def run_worker(backend: str, args, workdir: str) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--worker", backend, "--data", workdir,
+               "--model", args.model, "--max-length", str(args.max_length), "--concurrency", str(args.concurrency)]
+    output = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    if output.returncode != 0:
+        sys.exit(f"❌ {backend} encoder failed:\n{output.stderr.strip()[-2000:]}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+# === Retrieval overlap against the float model ===
+def top_k(queries: np.ndarray, chunks: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(queries @ chunks.T), axis=1)[:, :k]
+
+def overlap(expected: np.ndarray, found: np.ndarray) -> float:
+    return float(np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(expected, found)]))
+
+def main():
+    from embedding_cache import EMBEDDING_MODEL
+    from onnx_encoder import ONNX_MAX_LENGTH
+    parser = argparse.ArgumentParser(description="PyTorch vs. int8 ONNX query encoder")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--max-length", type=int, default=ONNX_MAX_LENGTH)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chroma-dir", default=os.path.join(ROOT, "chroma_langchain_db"))
+    parser.add_argument("--collection", default="example_collection")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--data", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    chunks, questions = load_texts(args)
+    workdir = tempfile.mkdtemp(prefix="bench_encoder_")
+    with open(os.path.join(workdir, "texts.json"), "w", encoding="utf-8") as f:
+        json.dump({"chunks": chunks, "questions": questions}, f)
+    print(f"{len(chunks)} chunks, {len(questions)} questions, k={args.k}, ONNX max_length {args.max_length}")
+
+    results = {backend: run_worker(backend, args, workdir) for backend in ("torch", "onnx")}
+    vectors = {f"{backend}_{kind}": np.load(os.path.join(workdir, f"{backend}_{kind}.npy"))
+               for backend in results for kind in ("chunks", "queries")}
+
+    print(f"\n{'encoder':<10} {'load':>7} {'query p50':>10} {'p99':>9} {'8 users':>10} {'docs/s':>8} {'RSS':>9}")
+    for backend, r in results.items():
+        print(f"{backend:<10} {r['load_s']:6.1f}s {r['query_p50_ms']:8.2f}ms {r['query_p99_ms']:7.2f}ms "
+              f"{r['concurrent_qps']:6.1f} q/s {r['docs_per_s']:8.1f} {r['rss_mb']:7.1f}MB")
+
+    expected = top_k(vectors["torch_queries"], vectors["torch_chunks"], args.k)
+    query_only = top_k(vectors["onnx_queries"], vectors["torch_chunks"], args.k)
+    reembedded = top_k(vectors["onnx_queries"], vectors["onnx_chunks"], args.k)
+    for kind in ("queries", "chunks"):
+        cosines = np.sum(vectors[f"torch_{kind}"] * vectors[f"onnx_{kind}"], axis=1)
+        print(f"cosine(float, int8) {kind:<8} mean {cosines.mean():.4f}, min {cosines.min():.4f}")
+    print(f"overlap@{args.k} ONNX queries vs. float index:  {overlap(expected, query_only):.3f}")
+    print(f"overlap@{args.k} ONNX queries vs. ONNX index:   {overlap(expected, reembedded):.3f}")
+    print(f"  work directory: {workdir}")
+
+if __name__ == "__main__":
+    main()
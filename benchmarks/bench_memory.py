@@ -0,0 +1,81 @@
+"""History tokens per prompt over a long session: unbounded list vs. ConversationMemory.
+
+The ReAct prompt used to get the whole history list (`History: {history}`), so every turn
+paid for all earlier turns, long web answers included. With the memory the history part of
+the prompt should stay flat once the window is full.
+
+    python benchmarks/bench_memory.py --turns 60
+    python benchmarks/bench_memory.py --turns 60 --budget 800 --recent 2
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from conversation_memory import ConversationMemory, estimate_tokens, extractive_summary
+
+FOLLOWUPS = ["and in the year {year}?", "what about the profit?", "and {company}?", "und {year}?"]
+
+def session_questions(count: int, seed: int = 0) -> list:
+    # Synthetic questions with every third one a follow-up that only makes sense with the history
+    from bench_e2e import synthetic_questions
+    rng = random.Random(seed)
+    questions = []
+    for question in synthetic_questions(count, seed):
+        questions.append(question)
+        if len(questions) % 3 == 0:
+            template = rng.choice(FOLLOWUPS)
+            questions.append(template.format(year=rng.randint(2020, 2024),
+                                             company=rng.choice(["Microsoft", "NVIDIA", "Meta"])))
+    return questions[:count]
+
+def fake_answer(question: str, rng: random.Random) -> str:
+    # Web answers are long: 50-400 words with a figure in the first sentence
+    words = " ".join(rng.choice(["revenue", "growth", "segment", "quarter", "billion", "report", "the"])
+                     for _ in range(rng.randint(50, 400)))
+    return f"The figure asked for ({question[:40]}) is {rng.randint(10, 400)} billion USD. {words}"
+
+def main():
+    parser = argparse.ArgumentParser(description="History tokens per turn, list vs. ConversationMemory")
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--budget", type=int, default=None, help="MEMORY_TOKEN_BUDGET")
+    parser.add_argument("--recent", type=int, default=None, help="MEMORY_RECENT_TURNS")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    options = {k: v for k, v in (("budget_tokens", args.budget), ("recent_turns", args.recent)) if v}
+    # Extractive summaries: the same numbers without an LLM (the LLM summary is capped at the same size)
+    memory = ConversationMemory(summarizer=extractive_summary, **options)
+    history = []
+    rng = random.Random(args.seed)
+    rows, overhead = [], []
+    for turn, question in enumerate(session_questions(args.turns, args.seed), 1):
+        legacy_tokens = estimate_tokens(str(history))
+        started = time.perf_counter()
+        question = memory.expand_followup(question)
+        memory_tokens = estimate_tokens(memory.as_prompt())
+        answer = fake_answer(question, rng)
+        memory.add_turn(question, answer)
+        overhead.append(time.perf_counter() - started)
+        memory.flush()  # summaries run in the background; waiting keeps the numbers deterministic
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+        rows.append((turn, legacy_tokens, memory_tokens))
+
+    print(f"{'turn':>5} {'list':>8} {'memory':>8}")
+    for turn, legacy_tokens, memory_tokens in rows:
+        if turn in (1, 2, 5, 10, 20, 30, 40, 50) or turn == len(rows) or turn % 100 == 0:
+            print(f"{turn:5d} {legacy_tokens:8d} {memory_tokens:8d}")
+    total_legacy, total_memory = sum(r[1] for r in rows), sum(r[2] for r in rows)
+    print(f"total history tokens: list {total_legacy}, memory {total_memory} "
+          f"({1 - total_memory / max(total_legacy, 1):.0%} fewer)")
+    overhead.sort()
+    print(f"memory overhead per turn: p50 {overhead[len(overhead) // 2] * 1e3:.2f}ms, "
+          f"max {overhead[-1] * 1e3:.2f}ms")
+    print(memory.format_stats())
+
+if __name__ == "__main__":
+    main()
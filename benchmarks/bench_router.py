@@ -0,0 +1,107 @@
+"""Per-query overhead and accuracy of the intent router (router.py).
+
+Compares the old substring scans with the compiled keyword pass and the full router
+(keywords + prototype embeddings). The supervisor LLM call each confident route saves
+is 1-3 s with Gemini, so the router's overhead has to stay in the low milliseconds.
+
+    python benchmarks/bench_router.py --queries 2000
+    python benchmarks/bench_router.py --embeddings mpnet   # real encoder (local model needed)
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from router import IntentRouter, keyword_route
+
+# Hand-labelled questions (EN/DE); expected route per question
+LABELLED = [
+    ("hi", "general_chat"), ("Hallo, wie geht's?", "general_chat"), ("thank you!", "general_chat"),
+    ("who are you?", "general_chat"), ("Servus", "general_chat"), ("good evening", "general_chat"),
+    ("Is this history of Apple's revenue complete?", "rag"), ("What was Apple's revenue in 2022?", "rag"),
+    ("Wie hoch war der Gewinn von Microsoft 2023?", "rag"), ("What are NVIDIA's total liabilities?", "rag"),
+    ("What does the 10-K say about supply chain risks?", "rag"), ("Erkläre die Strategie von Meta", "rag"),
+    ("Plot Apple's profit over the last three years", "data_analysis"),
+    ("Vergleiche den Umsatz von Amazon und Google als Diagramm", "data_analysis"),
+    ("Compare the liabilities of Apple and Microsoft in 2024", "data_analysis"),
+    ("Vergleiche die Verbindlichkeiten von Apple und Microsoft 2024", "data_analysis"),
+    ("Compare Apple's revenue in 2024 vs 2023", "data_analysis"), ("Compare Apple's revenue in 2023", "rag"),
+    ("Show me Apple's revenue", "rag"),
+    ("Show Apple profit for the last 3 years", "data_analysis"),
+    ("Show the revenue trend of NVIDIA", "data_analysis"),
+    ("What is Apple's current stock price?", "web"), ("Latest news about Microsoft", "web"),
+    ("Wie ist der aktuelle Aktienkurs von Meta?", "web"), ("What did NVIDIA announce today?", "web"),
+]
+
+def legacy_route(question: str) -> str:
+    # The substring scans this replaces (supervisor_main.is_smalltalk, app.is_data_analysis_request)
+    q = question.lower()
+    smalltalk = ["hello", "hi", "how are", "good morning", "good evening", "servus", "greetings", "moin", "hey",
+                 "what's up", "how's it going", "all right", "what are you doing", "who are you", "what can you do"]
+    chart = ["analysiere", "analyse", "plot", "diagramm", "visualisiere", "statistik", "vergleich", "vergleiche",
+             "csv", "datenanalyse", "korrelation", "trend", "zeitreihe", "daten", "tabelle"]
+    finance = ["umsatz", "gewinn", "einnahmen", "ausgaben", "cash", "kapital", "verbindlichkeit", "kosten",
+               "aktien", "bilanz", "umsätze"]
+    if any(c in q for c in chart) and any(f in q for f in finance):
+        return "data_analysis"
+    if any(s in q for s in smalltalk):
+        return "general_chat"
+    return "supervisor"
+
+def make_queries(count: int, seed: int = 0):
+    from bench_e2e import synthetic_questions
+    rng = random.Random(seed)
+    questions = synthetic_questions(count, seed) + [q for q, _ in LABELLED] + ["tell me something interesting"]
+    rng.shuffle(questions)
+    return questions[:count]
+
+def time_per_query(fn, questions):
+    timings = []
+    for question in questions:
+        started = time.perf_counter()
+        fn(question)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(int(0.99 * len(timings)), len(timings) - 1)]
+
+def accuracy(fn):
+    return sum(fn(q) == expected for q, expected in LABELLED) / len(LABELLED)
+
+def main():
+    parser = argparse.ArgumentParser(description="Intent router overhead and accuracy")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--embeddings", choices=["fake", "mpnet"], default="fake",
+                        help="fake: deterministic vectors (overhead only), mpnet: the real encoder")
+    args = parser.parse_args()
+
+    if args.embeddings == "mpnet":
+        from embedding_cache import get_embeddings
+        embeddings = get_embeddings()
+    else:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=768)
+    router = IntentRouter(embeddings=embeddings)
+    started = time.perf_counter()
+    router.prototype_matrix()
+    print(f"Prototype vectors built in {(time.perf_counter() - started) * 1000:.1f}ms ({args.embeddings})")
+
+    questions = make_queries(args.queries)
+    router.route(questions[0])  # warm the query path once
+    print(f"{'variant':<22} {'p50':>10} {'p99':>10} {'accuracy':>9}")
+    for name, fn in (("legacy substrings", legacy_route),
+                     ("keywords (compiled)", lambda q: keyword_route(q).route),
+                     ("router (kw + embed)", lambda q: router.route(q).route)):
+        p50, p99 = time_per_query(fn, questions)
+        print(f"{name:<22} {p50 * 1e6:8.1f}µs {p99 * 1e6:8.1f}µs {accuracy(fn):9.0%}")
+    print(router.format_stats())
+    wrong = [(q, expected, legacy_route(q)) for q, expected in LABELLED if legacy_route(q) == "general_chat"
+             and expected != "general_chat"]
+    for question, expected, got in wrong:
+        print(f"  legacy misroute: {question!r} → {got} (expected {expected})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Query latency, recall@k and memory of the vector backends: Chroma vs. vector_index.py.
+
+Every backend runs in its own subprocess, so the RSS column is what that backend costs a
+fresh process (imports included). Recall is measured against an exact float32 search under
+the same metadata filter. Queries are stored vectors plus noise, so no encoder is needed.
+
+    python benchmarks/bench_vector_index.py --vectors 30000           # synthetic clustered corpus
+    python benchmarks/bench_vector_index.py --source chroma            # the real chroma_langchain_db
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import numpy as np
+
+COMPANIES = ["apple", "google", "meta", "microsoft", "nvidia", "amazon"]
+YEARS = list(range(2019, 2025))
+VARIANTS = [("float16", "exact"), ("float16", "ivf"), ("int8", "exact"), ("int8", "ivf"), ("float16", "hnsw")]
+CHROMA_BATCH = 5000
+
+
+# === 1. Corpus: synthetic clusters (topics) or the existing Chroma collection ===
+def synthetic_corpus(count: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, count // 150), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.6 * rng.normal(size=(count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"chunk-{i}" for i in range(count)]
+    texts = [f"Synthetic chunk {i}" for i in range(count)]
+    metadatas = [{"company_key": COMPANIES[i % len(COMPANIES)], "year": YEARS[(i // 7) % len(YEARS)],
+                  "type": "table" if i % 3 == 0 else "text", "page": i % 40} for i in range(count)]
+    return ids, texts, metadatas, vectors
+
+def write_chroma(directory: str, name: str, ids, texts, metadatas, vectors):
+    import chromadb
+    collection = chromadb.PersistentClient(path=directory).get_or_create_collection(name)
+    for start in range(0, len(ids), CHROMA_BATCH):
+        end = start + CHROMA_BATCH
+        collection.add(ids=ids[start:end], documents=texts[start:end], metadatas=metadatas[start:end],
+                       embeddings=vectors[start:end])
+
+def read_chroma(directory: str, name: str):
+    import chromadb
+    collection = chromadb.PersistentClient(path=directory).get_collection(name)
+    data = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    for offset in range(0, collection.count(), CHROMA_BATCH):
+        batch = collection.get(limit=CHROMA_BATCH, offset=offset, include=["embeddings", "documents", "metadatas"])
+        for key in data:
+            data[key].extend(batch[key])
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    return data["ids"], data["documents"], data["metadatas"], vectors
+
+
+# === 2. Workload: noisy copies of stored vectors, a third each unfiltered / company / company + year ===
+def make_workload(ids, metadatas, vectors, queries: int, k: int, seed: int = 0):
+    from vector_index import MetadataColumns
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(len(ids), size=queries)
+    matrix = vectors[picks] + 0.3 * rng.normal(size=(queries, vectors.shape[1])).astype(np.float32) / np.sqrt(
+        vectors.shape[1])
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    columns = MetadataColumns.build(metadatas)
+    filters, truth = [], []
+    for i, row in enumerate(picks):
+        metadata = metadatas[row]
+        where = None
+        if i % 3 == 1 and "company_key" in metadata:
+            where = {"company_key": {"$in": [metadata["company_key"]]}}
+        elif i % 3 == 2 and "company_key" in metadata and "year" in metadata:
+            where = {"$and": [{"company_key": {"$in": [metadata["company_key"]]}},
+                              {"year": {"$in": [metadata["year"], metadata["year"] + 1]}}]}
+        mask = columns.mask(where)
+        similarities = vectors @ matrix[i]
+        if mask is not None:
+            similarities[~mask] = -np.inf
+        best = np.argsort(-similarities)[:k]
+        filters.append(where)
+        truth.append([ids[j] for j in best if np.isfinite(similarities[j])])
+    return matrix, filters, truth
+
+
+# === 3. Worker: one backend in a fresh process ===
+def peak_rss_mb() -> float:
+    # VmHWM starts over at exec; ru_maxrss would include the parent's peak from before the fork
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def worker(args):
+    started = time.perf_counter()
+    if args.worker == "chroma":
+        from langchain_chroma import Chroma
+        store = Chroma(collection_name=args.collection, persist_directory=args.chroma_dir)
+    else:
+        from vector_index import VectorIndex, VectorIndexStore
+        store = VectorIndexStore(VectorIndex.load(args.worker), embedding=None)
+    load_seconds = time.perf_counter() - started
+    matrix = np.load(os.path.join(args.data, "queries.npy"))
+    with open(os.path.join(args.data, "workload.json"), "r", encoding="utf-8") as f:
+        workload = json.load(f)
+
+    store.similarity_search_by_vector(matrix[0].tolist(), k=args.k)  # first query opens files, builds caches
+    latencies, found = [], 0
+    for vector, where, expected in zip(matrix, workload["filters"], workload["truth"]):
+        started = time.perf_counter()
+        docs = store.similarity_search_by_vector(vector.tolist(), k=args.k, filter=where)
+        latencies.append(time.perf_counter() - started)
+        found += len({doc.id for doc in docs} & set(expected))
+    latencies.sort()
+    print(json.dumps({
+        "load_s": round(load_seconds, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1e3, 2),
+        "p99_ms": round(latencies[min(int(0.99 * len(latencies)), len(latencies) - 1)] * 1e3, 2),
+        "recall": round(found / max(1, sum(len(t) for t in workload["truth"])), 3),
+        "rss_mb": round(peak_rss_mb(), 1),
+    }))
+
+def run_worker(target: str, args, data_dir: str, chroma_dir: str, collection: str) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--worker", target, "--data", data_dir, "--k", str(args.k),
+               "--chroma-dir", chroma_dir, "--collection", collection]
+    output = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    if output.returncode != 0:
+        return {"error": output.stderr.strip().splitlines()[-1] if output.stderr.strip() else "failed"}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def directory_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(base, name)) for base, _, names in os.walk(path) for name in names) / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma vs. memory-mapped vector index")
+    parser.add_argument("--source", choices=["synthetic", "chroma"], default="synthetic")
+    parser.add_argument("--vectors", type=int, default=30000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chroma-dir", default=os.path.join(ROOT, "chroma_langchain_db"))
+    parser.add_argument("--collection", default="example_collection")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--data", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    workdir = tempfile.mkdtemp(prefix="bench_vector_index_")
+    if args.source == "chroma":
+        chroma_dir, collection = args.chroma_dir, args.collection
+        ids, texts, metadatas, vectors = read_chroma(chroma_dir, collection)
+    else:
+        chroma_dir, collection = os.path.join(workdir, "chroma"), "bench"
+        ids, texts, metadatas, vectors = synthetic_corpus(args.vectors, args.dim, args.seed)
+        started = time.perf_counter()
+        write_chroma(chroma_dir, collection, ids, texts, metadatas, vectors)
+        print(f"Chroma collection written in {time.perf_counter() - started:.1f}s")
+    print(f"{len(ids)} vectors, dim {vectors.shape[1]}, {args.queries} queries, k={args.k}")
+
+    matrix, filters, truth = make_workload(ids, metadatas, vectors, args.queries, args.k, args.seed)
+    np.save(os.path.join(workdir, "queries.npy"), matrix)
+    with open(os.path.join(workdir, "workload.json"), "w", encoding="utf-8") as f:
+        json.dump({"filters": filters, "truth": truth}, f)
+
+    from vector_index import VectorIndex
+    rows = [("chroma", run_worker("chroma", args, workdir, chroma_dir, collection), directory_mb(chroma_dir), None)]
+    for dtype, ann in VARIANTS:
+        directory = os.path.join(workdir, f"index_{dtype}_{ann}")
+        started = time.perf_counter()
+        index = VectorIndex.build(directory, ids, texts, metadatas, vectors, dtype=dtype, ann=ann)
+        build_seconds = time.perf_counter() - started
+        name = f"mmap {dtype} {index.meta['ann']}"
+        if index.meta["ann"] != ann:
+            name += f" (no {ann})"
+        rows.append((name, run_worker(directory, args, workdir, chroma_dir, collection), directory_mb(directory),
+                     build_seconds))
+
+    print(f"\n{'backend':<28} {'load':>7} {'p50':>9} {'p99':>9} {'recall':>7} {'RSS':>9} {'disk':>9} {'build':>7}")
+    for name, result, disk, build in rows:
+        if "error" in result:
+            print(f"{name:<28} error: {result['error']}")
+            continue
+        build = f"{build:6.1f}s" if build is not None else f"{'-':>7}"
+        print(f"{name:<28} {result['load_s']:6.2f}s {result['p50_ms']:7.2f}ms {result['p99_ms']:7.2f}ms "
+              f"{result['recall']:7.3f} {result['rss_mb']:7.1f}MB {disk:7.1f}MB {build}")
+    print(f"  work directory: {workdir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Offline benchmark of the web search layer (stub backend, no network).
+
+    python benchmarks/bench_web_search.py --queries 300 --users 16 --distinct 40 --latency 0.5
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search_cache import WebSearch, SearchCache, StubBackend
+
+COMPANIES = ["Apple", "Microsoft", "Alphabet", "Amazon", "Meta", "NVIDIA"]
+METRICS = ["revenue", "net income", "operating income", "cash", "total assets"]
+
+def make_queries(count: int, distinct: int, seed: int = 0):
+    # Zipf-like mix: a few popular questions, a long tail, plus casing/punctuation variants
+    rng = random.Random(seed)
+    pool = [f"{rng.choice(COMPANIES)} {rng.choice(METRICS)} {rng.randint(2019, 2025)}" for _ in range(distinct)]
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    queries = []
+    for query in rng.choices(pool, weights=weights, k=count):
+        queries.append(rng.choice([query, query.lower(), f"{query}?", f"  {query.upper()} "]))
+    return queries
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+def run(search_fn, queries, users):
+    latencies = []
+
+    def timed(query):
+        started = time.perf_counter()
+        search_fn(query)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(timed, queries))
+    return time.perf_counter() - started, latencies
+
+def report(name, wall, latencies, backend_calls):
+    print(f"{name:<22} wall {wall:6.2f}s  backend calls {backend_calls:4d}  "
+          f"p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  p95 {percentile(latencies, 0.95) * 1000:7.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Web search cache benchmark (offline stub backend)")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--distinct", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    args = parser.parse_args()
+    queries = make_queries(args.queries, args.distinct)
+
+    baseline = StubBackend(args.latency, args.jitter)
+    wall, latencies = run(baseline.search, queries, args.users)
+    report("no cache", wall, latencies, baseline.calls)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = StubBackend(args.latency, args.jitter)
+        search = WebSearch(backend, SearchCache(os.path.join(tmp, "search.db")))
+        wall, latencies = run(search.search, queries, args.users)
+        report("cache + single-flight", wall, latencies, backend.calls)
+        print(search.format_stats())
+
+        # Second run on the persisted cache (e.g. after an app restart)
+        restarted = WebSearch(StubBackend(args.latency, args.jitter), SearchCache(os.path.join(tmp, "search.db")))
+        wall, latencies = run(restarted.search, queries, args.users)
+        report("warm persistent cache", wall, latencies, restarted.backend.calls)
+
+if __name__ == "__main__":
+    main()
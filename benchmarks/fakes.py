@@ -0,0 +1,121 @@
+"""Deterministic offline stand-ins for Gemini, Tavily and the HF InferenceClient.
+
+Latencies are configurable, answers depend only on the prompt, so two runs of the
+same workload do the same work. Nothing here touches the network.
+"""
+import re
+import time
+import hashlib
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_SMALLTALK = re.compile(r"\b(hello|hi|hey|thanks|thank you|how are you|hallo|danke)\b", re.IGNORECASE)
+
+def estimate_tokens(text: str) -> int:
+    # Roughly what Gemini reports for English text
+    return max(1, int(len(text.split()) * 1.3))
+
+def _best_line(context: str, question: str) -> str:
+    # The context line sharing most words with the question, preferring lines with figures
+    words = set(re.findall(r"\w+", question.lower()))
+    lines = [line.strip() for line in context.splitlines() if line.strip()]
+    if not lines:
+        return ""
+    return max(lines, key=lambda line: (len(words & set(re.findall(r"\w+", line.lower()))),
+                                        bool(re.search(r"\d", line))))
+
+
+# === 1. Gemini: follows the ReAct format of rag_agnet_brandnew and answers "stuff" prompts ===
+class FakeGemini(BaseChatModel):
+    latency: float = 0.4        # seconds until the first token
+    token_latency: float = 0.01  # seconds per generated token
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def respond(self, prompt: str) -> str:
+        if "Final Answer:" in prompt and "Action Input:" in prompt:
+            # Only the scratchpad after the format instructions holds real observations
+            scratchpad = prompt.split("Final Answer: <Answer>", 1)[-1]
+            observations = re.findall(r"Observation: (.*?)(?:\nThought:|$)", scratchpad, re.DOTALL)
+            question = re.search(r"Question: (.*)", prompt)
+            question = question.group(1).strip() if question else ""
+            if observations and observations[-1].strip():
+                return f"Thought: I have enough information.\nFinal Answer: {observations[-1].strip()}"
+            if _SMALLTALK.search(question):
+                return "Thought: This is small talk.\nFinal Answer: Hello! How can I help you today?"
+            return f"Thought: I should search the reports.\nAction: document_search\nAction Input: {question}"
+        if prompt.startswith("Answer the question using only the numbered report excerpts"):
+            # Direct RAG prompt of rag_agnet_brandnew: numbered excerpts, then the question
+            excerpts = prompt.split("Excerpts:\n", 1)[-1]
+            context, _, question = excerpts.rpartition("\n\nQuestion: ")
+            blocks = re.findall(r"^\[(\d+)\][^\n]*\n(.*?)(?=^\[\d+\]|\Z)", context, re.MULTILINE | re.DOTALL)
+            line = _best_line("\n".join(text for _, text in blocks), question.replace("\nAnswer:", ""))
+            if not line:
+                return "Not available in the documents."
+            number = next((n for n, text in blocks if line in text), "1")
+            return f"According to the reports: {line} [{number}]"
+        if "Answer naturally to:" in prompt:
+            return "Hello! How can I help you today?"
+        if prompt.startswith("Use the following pieces of context"):
+            # RetrievalQA "stuff" chat prompt: system message with the chunks, then the question
+            context = prompt.split("----------------\n", 1)[-1]
+            context, question = context.rsplit("\n", 1) if "\n" in context else (context, "")
+            line = _best_line(context, question)
+            return f"According to the reports: {line}" if line else "I don't know."
+        return "OK."
+
+    def _prompt_text(self, messages: List[BaseMessage]) -> str:
+        return "\n".join(m.content if isinstance(m.content, str) else str(m.content) for m in messages)
+
+    def _usage(self, prompt: str, text: str) -> dict:
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        text = self.respond(prompt)
+        time.sleep(self.latency + self.token_latency * estimate_tokens(text))
+        message = AIMessage(content=text, usage_metadata=self._usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        prompt = self._prompt_text(messages)
+        text = self.respond(prompt)
+        time.sleep(self.latency)
+        words = re.findall(r"\S+\s*|\s+", text)
+        for index, word in enumerate(words):
+            time.sleep(self.token_latency)
+            usage = self._usage(prompt, text) if index == len(words) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+
+
+# === 2. HF InferenceClient model for the smolagents CodeAgent ===
+def make_fake_inference_model(latency: float = 1.5):
+    from smolagents import Model
+    from smolagents.models import ChatMessage, MessageRole
+    from smolagents.monitoring import TokenUsage
+
+    class FakeInferenceModel(Model):
+        """Returns one code step that finishes with a deterministic summary."""
+
+        def generate(self, messages, stop_sequences=None, response_format=None, tools_to_call_from=None,
+                     **kwargs):
+            prompt = str(messages[-1].content if hasattr(messages[-1], "content") else messages[-1])
+            digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:6]
+            time.sleep(latency)
+            code = f'final_answer("Analysis {digest}: the requested figures were compared.")'
+            return ChatMessage(role=MessageRole.ASSISTANT,
+                               content=f"Thought: The data is summarized directly.\n<code>\n{code}\n</code>",
+                               token_usage=TokenUsage(input_tokens=estimate_tokens(prompt), output_tokens=20))
+
+    return FakeInferenceModel(model_id="fake-inference")
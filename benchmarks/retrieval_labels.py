@@ -0,0 +1,58 @@
+"""Builds the labelled question → page set for retrieval recall@k from financial_facts.db.
+
+Every label comes from a fact that data_ extract.py found in a table on that PDF page,
+so recall@k measures whether retrieval brings back the page the figure is printed on.
+
+    python benchmarks/retrieval_labels.py --db financial_facts.db --output benchmarks/retrieval_labels.jsonl
+"""
+import os
+import sys
+import json
+import random
+import sqlite3
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from financial_facts import FACTS_DB, CONCEPT_NAMES
+
+LABELS_PATH = os.path.join("benchmarks", "retrieval_labels.jsonl")
+
+def build_labels(db_path: str = FACTS_DB, limit: int = 200, seed: int = 0) -> list:
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT company, concept, year, file, page FROM facts "
+        "WHERE origin = 'pdf' AND page IS NOT NULL AND year IS NOT NULL"
+    ).fetchall()
+    conn.close()
+
+    # The same figure is often printed on several pages (summary + statement): all of them count
+    targets = defaultdict(set)
+    for company, concept, year, file, page in rows:
+        targets[(company, concept, year)].add((file, page))
+    labels = [
+        {"question": f"What was {company}'s {CONCEPT_NAMES.get(concept, concept)} in {year}?",
+         "company": company, "concept": concept, "year": year, "targets": sorted(pages)}
+        for (company, concept, year), pages in sorted(targets.items())
+    ]
+    random.Random(seed).shuffle(labels)
+    return labels[:limit]
+
+def load_labels(path: str = LABELS_PATH) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build retrieval labels from the facts store provenance.")
+    parser.add_argument("--db", default=FACTS_DB)
+    parser.add_argument("--output", default=LABELS_PATH)
+    parser.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"❌ {args.db} not found. Build it first: python \"data_ extract.py\" (facts are on by default).")
+    labels = build_labels(args.db, args.limit)
+    with open(args.output, "w", encoding="utf-8") as f:
+        for label in labels:
+            f.write(json.dumps(label, ensure_ascii=False) + "\n")
+    print(f"✅ {len(labels)} labelled questions written to {args.output}")
@@ -0,0 +1,322 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from typing import Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from tracing import span, annotate
+
+FIGURES_DIR = "figures"
+CHART_CACHE_DIR = os.path.join(FIGURES_DIR, "cache")
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+MAX_FIGURES = int(os.getenv("CHART_CACHE_FILES", "500"))
+# A figure handed out this recently may still be on its way to the browser: it is never evicted,
+# even if the cache grows past MAX_FIGURES for a while
+EVICTION_GRACE_SECONDS = 300
+CHART_TYPES = ("bar", "line")
+
+_LINE_TERMS = re.compile(r"\b(trend|line|over time|time series|verlauf|entwicklung|zeitreihe)\b", re.IGNORECASE)
+_LAST_YEARS = re.compile(
+    r"\b(?:last|past|letzten|vergangenen)\s+(\d+|two|three|four|five|zwei|drei|vier|fünf)\s+(?:years|jahre|jahren)\b",
+    re.IGNORECASE,
+)
+_NUMBER_WORDS = {"two": 2, "three": 3, "four": 4, "five": 5, "zwei": 2, "drei": 3, "vier": 4, "fünf": 5}
+
+
+# === 1. Worker processes: Agg backend and font cache loaded once per process ===
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib import font_manager
+    font_manager.findfont(font_manager.FontProperties(family=["sans-serif"]))
+    # One throwaway draw loads the glyph cache, so the first real chart is not slower
+    figure = plt.figure()
+    figure.text(0.5, 0.5, "2024 Revenue 0123456789")
+    figure.canvas.draw()
+    plt.close(figure)
+
+def _worker_ready():
+    return os.getpid()
+
+def render_chart(spec: dict, out_path: str) -> str:
+    # Runs in a worker process: spec holds plain lists only
+    import matplotlib.pyplot as plt
+    labels, series = spec["labels"], spec["series"]
+    figure, ax = plt.subplots(figsize=(7, 4))
+    if spec["chart_type"] == "line":
+        for company, values in series.items():
+            ax.plot(labels, values, marker="o", label=company)
+    else:
+        width = 0.8 / len(series)
+        for index, (company, values) in enumerate(series.items()):
+            positions = [i + (index - (len(series) - 1) / 2) * width for i in range(len(labels))]
+            ax.bar(positions, [v if v is not None else 0 for v in values], width, label=company)
+        ax.set_xticks(range(len(labels)))
+        ax.set_xticklabels(labels)
+    ax.set_title(spec["title"])
+    ax.set_ylabel(spec["ylabel"])
+    ax.set_xlabel("Period")
+    ax.tick_params(axis="x", labelrotation=45 if len(labels) > 6 else 0)
+    if len(series) > 1:
+        ax.legend()
+    figure.tight_layout()
+    # Written under a temporary name: readers never see a half-written PNG
+    tmp_path = f"{out_path}.{os.getpid()}.tmp.png"
+    figure.savefig(tmp_path)
+    plt.close(figure)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+# === 2. On-disk figure cache: <key>.png, least recently used files are deleted first ===
+class FigureCache:
+    def __init__(self, directory: str = CHART_CACHE_DIR, max_files: int = MAX_FIGURES,
+                 grace_seconds: float = EVICTION_GRACE_SECONDS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_files = max_files
+        self.grace_seconds = grace_seconds
+        # mtime is the last use (touched on every hit), so the LRU order survives restarts
+        existing = [e for e in os.scandir(directory) if e.name.endswith(".png") and ".tmp." not in e.name]
+        self._entries = OrderedDict(
+            (e.name[:-4], e.path) for e in sorted(existing, key=lambda e: e.stat().st_mtime)
+        )
+        self._last_used = {e.name[:-4]: e.stat().st_mtime for e in existing}
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key: str):
+        with self._lock:
+            path = self._entries.get(key)
+            if path is None:
+                return None
+            if not os.path.exists(path):
+                del self._entries[key]
+                self._last_used.pop(key, None)
+                return None
+            # Marked as used under the lock, so a concurrent put() cannot evict it before it is served
+            self._entries.move_to_end(key)
+            self._last_used[key] = time.time()
+            os.utime(path)
+        return path
+
+    def put(self, key: str):
+        with self._lock:
+            now = time.time()
+            self._entries[key] = self.path_for(key)
+            self._entries.move_to_end(key)
+            self._last_used[key] = now
+            while len(self._entries) > self.max_files:
+                oldest = next(iter(self._entries))
+                if now - self._last_used.get(oldest, 0) < self.grace_seconds:
+                    break  # LRU order: every other entry was used even more recently
+                evicted = self._entries.pop(oldest)
+                self._last_used.pop(oldest, None)
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# === 3. Chart service: data from the preloaded dataset, rendering in the pool, one render per key ===
+class ChartService:
+    def __init__(self, cache: FigureCache = None, workers: int = CHART_WORKERS):
+        self.cache = cache
+        self.workers = workers
+        self._pool = None
+        self._inflight = {}    # figure key -> Future of the one running render
+        self._recording = None  # paths rendered during the current agent run (see recording())
+        self._lock = threading.Lock()
+        self.stats = {"charts": 0, "cache_hits": 0, "coalesced": 0, "rendered": 0}
+
+    def _figure_cache(self) -> FigureCache:
+        with self._lock:
+            if self.cache is None:
+                self.cache = FigureCache()
+            return self.cache
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: the workers must not inherit the app's threads and locks
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def warm_up(self):
+        # Starts the workers (import matplotlib, load fonts) before the first request needs them
+        pool = self._executor()
+        for future in [pool.submit(_worker_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def chart_spec(self, companies: list, concept: str, start_year: int = None, end_year: int = None,
+                   last_years: int = None, chart_type: str = "bar"):
+        from financials_dataset import get_dataset
+        from financial_facts import CONCEPT_NAMES
+        if chart_type not in CHART_TYPES:
+            raise ValueError(f"chart_type must be one of {CHART_TYPES}, not {chart_type!r}")
+        dataset = get_dataset()
+        names = [dataset.resolve_company(c) or c for c in companies]
+        metric = dataset.resolve_concept(concept)
+        if last_years:
+            # "Last 3 years" becomes a concrete range, so the key does not depend on the wording
+            latest = [int(str(periods[-1])[:4]) for periods, _ in (dataset.arrays(c, metric) for c in names)
+                      if len(periods)]
+            end_year = max(latest) if latest else None
+            start_year = end_year - last_years + 1 if end_year else None
+        data = {name: dataset.arrays(name, metric, start_year, end_year) for name in names}
+        if not any(len(periods) for periods, _ in data.values()):
+            raise ValueError(f"No data for {', '.join(names)} / {concept} in all_company_financials.csv.")
+
+        key_fields = [dataset.version, names, metric, start_year, end_year, chart_type]
+        key = hashlib.sha1(json.dumps(key_fields).encode("utf-8")).hexdigest()[:20]
+        labels = sorted({str(p)[:10] for periods, _ in data.values() for p in periods})
+        series = {}
+        for name, (periods, values) in data.items():
+            by_period = {str(p)[:10]: float(v) / 1e9 for p, v in zip(periods, values)}
+            series[name] = [by_period.get(label) for label in labels]
+        label = CONCEPT_NAMES.get(metric, metric)
+        years = f" ({start_year}–{end_year})" if start_year and end_year else ""
+        spec = {"labels": labels, "series": series, "chart_type": chart_type,
+                "title": f"{' vs. '.join(names)}: {label}{years}", "ylabel": f"{label.capitalize()} (Billion USD)"}
+        return key, spec
+
+    def render(self, companies: list, concept: str, start_year: int = None, end_year: int = None,
+               last_years: int = None, chart_type: str = "bar") -> str:
+        with span("plot", chart=chart_type):
+            key, spec = self.chart_spec(companies, concept, start_year, end_year, last_years, chart_type)
+            # A cache hit never starts the worker processes
+            cache = self._figure_cache()
+            path = cache.get(key)
+            annotate(cache_hit=path is not None)
+            self._count("charts")
+            if path is not None:
+                self._count("cache_hits")
+                return self._record(path)
+
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+                else:
+                    self.stats["coalesced"] += 1
+            if not leader:
+                # The same chart is being rendered for another session: wait for it
+                return self._record(future.result())
+            try:
+                path = self._executor().submit(render_chart, spec, cache.path_for(key)).result()
+                cache.put(key)
+                self._count("rendered")
+                future.set_result(path)
+                return self._record(path)
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _record(self, path: str) -> str:
+        with self._lock:
+            if self._recording is not None:
+                self._recording.append(path)
+        return path
+
+    @contextmanager
+    def recording(self):
+        # Collects the charts an agent run renders. The CodeAgent executes its code in its own
+        # thread, so this is service-wide: callers hold the analysis lock (one run at a time)
+        figures = []
+        with self._lock:
+            self._recording = figures
+        try:
+            yield figures
+        finally:
+            with self._lock:
+                self._recording = None
+
+    def format_stats(self) -> str:
+        s = self.stats
+        return (f"📈 Charts: {s['charts']} requested, {s['cache_hits']} from cache, {s['coalesced']} coalesced, "
+                f"{s['rendered']} rendered")
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_chart_service() -> ChartService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ChartService()
+        return _service
+
+
+# === 4. Direct chart requests ("show Apple profit for the last 3 years") skip the agent ===
+def parse_chart_request(question: str):
+    from query_analysis import analyze_query
+    from financial_facts import concepts_in
+    from router import keyword_signals
+    if not keyword_signals(question)["chart"]:
+        return None
+    analysis = analyze_query(question)
+    concepts = concepts_in(question)
+    if not analysis["companies"] or len(concepts) != 1:
+        return None
+    request = {"companies": analysis["companies"], "concept": concepts.pop(),
+               "chart_type": "line" if _LINE_TERMS.search(question) else "bar"}
+    last = _LAST_YEARS.search(question)
+    if last:
+        word = last.group(1).lower()
+        request["last_years"] = int(word) if word.isdigit() else _NUMBER_WORDS[word]
+    elif analysis["years"]:
+        request["start_year"], request["end_year"] = min(analysis["years"]), max(analysis["years"])
+    return request
+
+def chart_for_question(question: str):
+    # Returns (answer, figure path), or None when the question needs the agent
+    request = parse_chart_request(question)
+    if request is None:
+        return None
+    from financial_facts import CONCEPT_NAMES
+    try:
+        path = get_chart_service().render(**request)
+    except (ValueError, FileNotFoundError):
+        return None  # no such series (or no CSV): the agent explains what is there
+    companies = " vs. ".join(c.capitalize() for c in request["companies"])
+    return f"Chart of {CONCEPT_NAMES.get(request['concept'], request['concept'])} for {companies}: {path}", path
+
+
+# === 5. Tool for the data analysis CodeAgent ===
+def plot_chart(companies: list, concept: str, start_year: Optional[int] = None, end_year: Optional[int] = None,
+               chart_type: str = "bar") -> str:
+    """Draws a chart of one financial metric for one or more companies and returns the PNG path.
+    Identical charts are served from a cache, so call this instead of drawing with matplotlib.
+
+    Args:
+        companies: Company names, e.g. ["Apple"] or ["Apple", "Microsoft"].
+        concept: Metric, e.g. "revenue", "net_income", "profit", "total_liabilities".
+        start_year: First year to include (optional).
+        end_year: Last year to include (optional).
+        chart_type: "bar" or "line".
+    """
+    return get_chart_service().render(companies, concept, start_year, end_year, chart_type=chart_type)
+
+def get_chart_tools() -> list:
+    from smolagents import tool
+    return [tool(plot_chart)]
@@ -0,0 +1,82 @@
+import time
+import threading
+
+# === Lazy component registry: agents, models and stores are built on first use ===
+class ComponentRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.timings = {}  # name -> (total seconds, own seconds without nested components)
+
+    def register(self, name: str, factory):
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.RLock())
+
+    def override(self, name: str, instance):
+        # Benchmarks/tests inject fakes without building the real component
+        with self._lock:
+            self._locks.setdefault(name, threading.RLock())
+            self._instances[name] = instance
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    def get(self, name: str):
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._locks:
+            raise KeyError(f"Unknown component: {name}")
+        with self._locks[name]:
+            if name in self._instances:
+                return self._instances[name]
+
+            # Nested get() calls report their time to the parent, so "own" time excludes them
+            stack = getattr(self._local, "stack", None)
+            if stack is None:
+                stack = self._local.stack = []
+            stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                instance = self._factories[name]()
+            finally:
+                total = time.perf_counter() - started
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += total
+            self.timings[name] = (total, total - nested)
+            self._instances[name] = instance
+            return instance
+
+    def warm_up(self, names=None, background: bool = True, on_done=None):
+        names = list(names or self._factories)
+
+        def build():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"⚠️ Warm-up of '{name}' failed: {e}")
+            if on_done:
+                on_done()
+
+        if not background:
+            build()
+            return None
+        thread = threading.Thread(target=build, name="component-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def startup_report(self) -> str:
+        lines = ["⏱️ Component startup times (total / own):"]
+        for name, (total, own) in sorted(self.timings.items(), key=lambda item: -item[1][1]):
+            lines.append(f"  {name:<22} {total:7.2f}s / {own:7.2f}s")
+        pending = [name for name in self._factories if name not in self._instances]
+        if pending:
+            lines.append(f"  not built yet: {', '.join(pending)}")
+        return "\n".join(lines)
+
+registry = ComponentRegistry()
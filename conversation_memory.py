@@ -0,0 +1,227 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from query_analysis import analyze_query, COMPANY_ALIASES
+from financial_facts import CONCEPT_NAMES, CONCEPT_QUERY_TERMS, concepts_in
+from answer_cache import FOLLOWUP_PATTERN
+from tracing import debug
+
+# History budget per prompt (summary + context + recent turns); Gemini tokens are estimated, not counted
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1200"))
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "3"))
+SUMMARY_TOKENS = 250
+# Long web answers are cut when they are kept verbatim
+TURN_ANSWER_TOKENS = 300
+# MEMORY_SUMMARIZER=extractive: older turns are condensed without an LLM call
+MEMORY_SUMMARIZER = os.getenv("MEMORY_SUMMARIZER", "llm")
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = """Update the running summary of a conversation about company financials.
+Keep the companies, metrics, years and figures that were discussed; drop small talk, sources and formatting.
+Reply with the updated summary only, at most {words} words.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+"""
+
+# Words a follow-up may consist of besides years: "and its profit in the year 2024?", "und 2023?"
+_FOLLOWUP_WORDS = {
+    "and", "what", "about", "how", "the", "in", "for", "of", "at", "year", "years", "fiscal", "was", "is", "were",
+    "are", "did", "do", "does", "it", "its", "their", "they", "them", "that", "this", "those", "same", "then",
+    "again", "also", "please", "s", "und", "ist", "mit", "wie", "im", "jahr", "der", "die", "das", "es", "sein",
+    "ihr", "dann",
+}
+_KNOWN_WORDS = _FOLLOWUP_WORDS | {word for names in list(CONCEPT_QUERY_TERMS.values()) + list(COMPANY_ALIASES.values())
+                                  for name in names for word in re.findall(r"[^\W\d_]+", name.lower())}
+_WORD = re.compile(r"[^\W\d_]+")
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_tokens(text: str, tokens: int) -> str:
+    if estimate_tokens(text) <= tokens:
+        return text
+    return text[:tokens * CHARS_PER_TOKEN].rsplit(" ", 1)[0] + " …"
+
+def extract_entities(text: str) -> dict:
+    # Company keys, canonical metrics and years, the only state a follow-up question needs
+    analysis = analyze_query(text)
+    return {"companies": analysis["companies"], "metrics": sorted(concepts_in(text)), "years": analysis["years"]}
+
+def unknown_words(text: str) -> list:
+    # Words that are no year, metric term, known company or follow-up filler ("Samsung", "world", "cup")
+    return [word for word in _WORD.findall(text) if word.lower() not in _KNOWN_WORDS]
+
+def format_turns(turns) -> str:
+    return "\n".join(f"User: {user}\nAssistant: {assistant}" for user, assistant in turns)
+
+
+# === 1. Summarizers: (current summary, turns leaving the window) -> new summary ===
+def extractive_summary(summary: str, turns) -> str:
+    # One line per turn: the question and the first sentence of the answer; the oldest lines go first
+    lines = [line for line in (summary or "").splitlines() if line]
+    for user, assistant in turns:
+        first_sentence = assistant.strip().split("\n", 1)[0].split(". ", 1)[0]
+        lines.append(f"- {truncate_tokens(user, 30)} → {truncate_tokens(first_sentence, 40)}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > SUMMARY_TOKENS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+def llm_summary(summary: str, turns) -> str:
+    from components import registry
+    from llm_pool import call_with_backoff, MEMORY
+    prompt = SUMMARY_PROMPT.format(words=SUMMARY_TOKENS * 3 // 4, summary=summary or "(empty)",
+                                   turns=format_turns(turns))
+    return call_with_backoff(MEMORY, registry.get("llm").invoke, prompt).content.strip()
+
+SUMMARIZERS = {"llm": llm_summary, "extractive": extractive_summary}
+
+# Summaries run off the request path in a small shared pool; a session summarizes once every few turns
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory")
+
+
+# === 2. History tokens per turn over all sessions (turn number -> [sessions, total tokens]) ===
+_usage = {}
+_usage_lock = threading.Lock()
+
+def record_usage(turn: int, tokens: int):
+    with _usage_lock:
+        entry = _usage.setdefault(turn, [0, 0])
+        entry[0] += 1
+        entry[1] += tokens
+
+def format_usage(checkpoints=(1, 2, 5, 10, 20, 50, 100)) -> str:
+    with _usage_lock:
+        means = {turn: total / count for turn, (count, total) in _usage.items()}
+    shown = [f"#{turn}: {means[turn]:.0f}" for turn in checkpoints if turn in means]
+    if means and max(means) not in checkpoints:
+        shown.append(f"#{max(means)}: {means[max(means)]:.0f}")
+    return f"🧠 History tokens per prompt by turn (budget {MEMORY_TOKEN_BUDGET}): {', '.join(shown) or '-'}"
+
+
+# === 3. Memory of one conversation: summary + entities + the last turns verbatim ===
+class ConversationMemory:
+    def __init__(self, budget_tokens: int = MEMORY_TOKEN_BUDGET, recent_turns: int = MEMORY_RECENT_TURNS,
+                 summarizer=None):
+        self.budget_tokens = budget_tokens
+        self.recent_turns = recent_turns
+        self.summarizer = summarizer or SUMMARIZERS.get(MEMORY_SUMMARIZER, llm_summary)
+        self.summary = ""
+        self.entities = {"companies": [], "metrics": [], "years": []}
+        self.turns = []      # (user, assistant) pairs, newest last
+        self._pending = []   # turns that left the window and wait for the summarizer
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        # History tokens per prompt as running values, so a long-lived session does not grow a list
+        self.stats = {"turns": 0, "summaries": 0, "followups": 0, "history_tokens": None}
+
+    # --- Follow-ups: "and in the year 2024?" gets the company and metric of the previous questions ---
+    def expand_followup(self, question: str) -> str:
+        mentioned = extract_entities(question)
+        with self._lock:
+            known = {key: list(values) for key, values in self.entities.items()}
+        if not known["companies"] and not known["metrics"]:
+            return question
+        # Any word that is no year, metric, known company or filler ("samsung", "tesla", "ceo", "world cup")
+        # makes it a question of its own: the previous company or metric would answer something else
+        if unknown_words(question):
+            return question
+        # "and in 2024?" / "what about the profit?", or nothing but years, metrics and pronouns ("2023?", "profit?")
+        if not (FOLLOWUP_PATTERN.match(question.strip()) or not mentioned["companies"]):
+            return question
+        context = {key: mentioned[key] or known[key] for key in known}
+        if context == mentioned:
+            return question
+        with self._lock:
+            self.stats["followups"] += 1
+        parts = [" and ".join(c.capitalize() for c in context["companies"]),
+                 " and ".join(CONCEPT_NAMES.get(m, m) for m in context["metrics"]),
+                 " and ".join(map(str, context["years"]))]
+        return f"{question} ({', '.join(p for p in parts if p)})"
+
+    # --- Prompt views: a string for the ReAct prompt, messages for the supervisor graph ---
+    def _context_lines(self) -> list:
+        lines = []
+        if self.summary:
+            lines.append(f"Summary of the earlier conversation:\n{self.summary}")
+        parts = [f"{key}: {', '.join(map(str, values))}" for key, values in self.entities.items() if values]
+        if parts:
+            lines.append(f"Last discussed: {'; '.join(parts)}")
+        return lines
+
+    def as_prompt(self) -> str:
+        with self._lock:
+            return "\n".join(self._context_lines() + ([format_turns(self.turns)] if self.turns else []))
+
+    def as_messages(self) -> list:
+        with self._lock:
+            context = self._context_lines()
+            messages = [{"role": "assistant", "content": "\n".join(context)}] if context else []
+            for user, assistant in self.turns:
+                messages += [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]
+            return messages
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.as_prompt())
+
+    # --- Update after every answer: the window slides, older turns are summarized in the background ---
+    def add_turn(self, user: str, assistant: str):
+        history_tokens = self.tokens()  # what this turn's prompt carried
+        with self._lock:
+            self.stats["turns"] += 1
+            tokens = self.stats["history_tokens"]
+            if tokens is None:
+                self.stats["history_tokens"] = {"first": history_tokens, "last": history_tokens,
+                                                "min": history_tokens, "max": history_tokens}
+            else:
+                tokens.update(last=history_tokens, min=min(tokens["min"], history_tokens),
+                              max=max(tokens["max"], history_tokens))
+            mentioned = extract_entities(user)
+            self.entities = {key: mentioned[key] or values for key, values in self.entities.items()}
+            self.turns.append((user, truncate_tokens(str(assistant), TURN_ANSWER_TOKENS)))
+            # Window: at most `recent_turns`, and the turns must fit next to the summary and the context.
+            # Turns waiting for the summarizer are out of the prompt; the entities still cover follow-ups
+            while len(self.turns) > 1 and (len(self.turns) > self.recent_turns or estimate_tokens(
+                    format_turns(self.turns)) > self.budget_tokens - SUMMARY_TOKENS - 50):
+                self._pending.append(self.turns.pop(0))
+            start = bool(self._pending) and self._idle.is_set()
+            if start:
+                self._idle.clear()
+            turn = self.stats["turns"]
+        record_usage(turn, history_tokens)
+        if start:
+            _summary_executor.submit(self._summarize)
+
+    def _summarize(self):
+        while True:
+            with self._lock:
+                turns, self._pending = self._pending, []
+                summary = self.summary
+                if not turns:
+                    self._idle.set()
+                    return
+            try:
+                summary = self.summarizer(summary, turns)
+            except Exception as e:
+                debug(f"[Memory] Summary failed ({e}) → extractive summary")
+                summary = extractive_summary(summary, turns)
+            with self._lock:
+                self.summary = truncate_tokens(summary, SUMMARY_TOKENS)
+                self.stats["summaries"] += 1
+
+    def flush(self, timeout: float = None) -> bool:
+        # Waits for a running summary (benchmarks, shutdown)
+        return self._idle.wait(timeout)
+
+    def format_stats(self) -> str:
+        s = self.stats
+        tokens = s["history_tokens"]
+        usage = (f"history {tokens['first']}→{tokens['last']} tokens per prompt (min {tokens['min']}, "
+                 f"max {tokens['max']}, budget {self.budget_tokens})" if tokens else "no history yet")
+        return (f"🧠 Memory: {s['turns']} turns, {usage}, {s['summaries']} summaries, "
+                f"{s['followups']} follow-ups expanded")
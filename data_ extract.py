@@ -1,87 +1,90 @@
-python
 # data_loader.py
 import os
-import pdfplumber
 import json
+import time
+import argparse
+import pdfplumber
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 
-def extract_tables_from_directory_to_json(directory, output_path):
-    extracted_data = []
+# PDFs larger than this are split into page-range shards for the process pool
+LARGE_PDF_BYTES = 5 * 1024 * 1024
+PAGES_PER_SHARD = 25
+# A shard that kills its worker while running alone is retried this many times in a fresh pool
+MAX_SHARD_ATTEMPTS = 2
+
+
+# === 1. Per-page extraction (shared by the serial and the parallel mode) ===
+def table_to_text(table):
+    return "\n".join([
+        " | ".join([cell if cell else "" for cell in row]) for row in table
+    ])
 
-    for company in os.listdir(directory):
+def extract_page_records(page, company, filename, page_num, verbose=True):
+    records = []
+    tables = page.extract_tables()
+    if tables:
+        if verbose:
+            print(f"📄 {filename} - Page {page_num+1}: {len(tables)} tables found")
+        for table_idx, table in enumerate(tables):
+            records.append({
+                "type": "table",
+                "company": company,
+                "file": filename,
+                "page": page_num + 1,
+                "table_index": table_idx,
+                "content": table_to_text(table)
+            })
+    else:
+        text = page.extract_text()
+        if text:
+            records.append({
+                "type": "text",
+                "company": company,
+                "file": filename,
+                "page": page_num + 1,
+                "content": text
+            })
+    return records
+
+def extract_pdf_records(file_path, company, filename, page_range=None, verbose=True):
+    # Yields the records of one PDF (optionally only pages [start, end)) page by page
+    with pdfplumber.open(file_path) as pdf:
+        start, end = page_range if page_range else (0, len(pdf.pages))
+        for page_num in range(start, min(end, len(pdf.pages))):
+            page = pdf.pages[page_num]
+            yield from extract_page_records(page, company, filename, page_num, verbose=verbose)
+            # Free the parsed page objects, otherwise memory grows with the document
+            page.flush_cache()
+
+def iter_pdf_files(directory):
+    # Yields (company, file_path, filename) in a deterministic (sorted) order
+    for company in sorted(os.listdir(directory)):
         company_path = os.path.join(directory, company)
 
         # If it's a PDF file directly
         if os.path.isfile(company_path) and company_path.endswith(".pdf"):
-            company = "root"
-            file_path = company_path
-            try:
-                with pdfplumber.open(file_path) as pdf:
-                    for page_num, page in enumerate(pdf.pages):
-                        tables = page.extract_tables()
-                        if tables:
-                            print(f"📄 {file_path} - Page {page_num+1}: {len(tables)} tables found")
-                            for table_idx, table in enumerate(tables):
-                                text = "\n".join([
-                                    " | ".join([cell if cell else "" for cell in row]) for row in table
-                                ])
-                                extracted_data.append({
-                                    "type": "table",
-                                    "company": company,
-                                    "file": os.path.basename(file_path),
-                                    "page": page_num + 1,
-                                    "table_index": table_idx,
-                                    "content": text
-                                })
-                        else:
-                            text = page.extract_text()
-                            if text:
-                                extracted_data.append({
-                                    "type": "text",
-                                    "company": company,
-                                    "file": os.path.basename(file_path),
-                                    "page": page_num + 1,
-                                    "content": text
-                                })
-            except Exception as e:
-                print(f"❌ Error: {file_path} could not be read. {e}")
+            yield "root", company_path, os.path.basename(company_path)
 
         # If it's a directory
         elif os.path.isdir(company_path):
-            for filename in os.listdir(company_path):
-                if not filename.endswith(".pdf"):
-                    continue
-
-                file_path = os.path.join(company_path, filename)
-                try:
-                    with pdfplumber.open(file_path) as pdf:
-                        for page_num, page in enumerate(pdf.pages):
-                            tables = page.extract_tables()
-                            if tables:
-                                print(f"📄 {file_path} - Page {page_num+1}: {len(tables)} tables found")
-                                for table_idx, table in enumerate(tables):
-                                    text = "\n".join([
-                                        " | ".join([cell if cell else "" for cell in row]) for row in table
-                                    ])
-                                    extracted_data.append({
-                                        "type": "table",
-                                        "company": company,
-                                        "file": filename,
-                                        "page": page_num + 1,
-                                        "table_index": table_idx,
-                                        "content": text
-                                    })
-                            else:
-                                text = page.extract_text()
-                                if text:
-                                    extracted_data.append({
-                                        "type": "text",
-                                        "company": company,
-                                        "file": filename,
-                                        "page": page_num + 1,
-                                        "content": text
-                                    })
-                except Exception as e:
-                    print(f"❌ Error: {file_path} could not be read. {e}")
+            for filename in sorted(os.listdir(company_path)):
+                if filename.endswith(".pdf"):
+                    yield company, os.path.join(company_path, filename), filename
+
+
+# === 2. Serial extraction into a single JSON file ===
+def extract_tables_from_directory_to_json(directory, output_path, facts_store=None):
+    extracted_data = []
+
+    for company, file_path, filename in iter_pdf_files(directory):
+        try:
+            extracted_data.extend(extract_pdf_records(file_path, company, filename))
+        except Exception as e:
+            print(f"❌ Error: {file_path} could not be read. {e}")
+
+    if facts_store is not None:
+        add_to_facts_store(facts_store, extracted_data)
 
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(extracted_data, f, indent=2, ensure_ascii=False)
@@ -89,6 +92,184 @@ def extract_tables_from_directory_to_json(directory, output_path):
     print(f"✅ {len(extracted_data)} records saved to JSON file: {output_path}")
 
 
+def add_to_facts_store(facts_store, records):
+    # Structured (company, concept, period) facts for the no-LLM lookup path
+    count = sum(facts_store.add_record(record) for record in records)
+    facts_store.commit()
+    print(f"✅ {count} financial facts stored in {facts_store.path}")
+
+
+# === 3. Parallel extraction: shard by PDF (or page range), stream to JSONL ===
+def plan_shards(directory, pages_per_shard=PAGES_PER_SHARD, large_pdf_bytes=LARGE_PDF_BYTES):
+    # A shard is (company, file_path, filename, page_range); page_range None = whole file
+    shards = []
+    for company, file_path, filename in iter_pdf_files(directory):
+        page_count = None
+        if os.path.getsize(file_path) > large_pdf_bytes:
+            try:
+                with pdfplumber.open(file_path) as pdf:
+                    page_count = len(pdf.pages)
+            except Exception:
+                # Broken file: let the worker report the error for the whole file
+                page_count = None
+        if page_count and page_count > pages_per_shard:
+            for start in range(0, page_count, pages_per_shard):
+                shards.append((company, file_path, filename, (start, start + pages_per_shard)))
+        else:
+            shards.append((company, file_path, filename, None))
+    return shards
+
+def _extract_shard(shard):
+    # Runs inside a worker process; never raises so one bad PDF cannot stop the pool
+    company, file_path, filename, page_range = shard
+    records = []
+    pages = 0
+    error = None
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            start, end = page_range if page_range else (0, len(pdf.pages))
+            for page_num in range(start, min(end, len(pdf.pages))):
+                page = pdf.pages[page_num]
+                records.extend(extract_page_records(page, company, filename, page_num, verbose=False))
+                page.flush_cache()
+                pages += 1
+    except Exception as e:
+        # Keep the pages read before the failure
+        error = f"{file_path} could not be read. {e}"
+    return {"records": records, "pages": pages, "error": error}
+
+def _extract_shard_alone(shard):
+    # After a pool broke it is unknown which in-flight shard killed it: each lost shard runs by itself
+    # in a single-worker pool, so a crash there can only be its own
+    for _ in range(MAX_SHARD_ATTEMPTS):
+        with ProcessPoolExecutor(max_workers=1) as single:
+            try:
+                return single.submit(_extract_shard, shard).result()
+            except BrokenProcessPool:
+                continue
+    return {"records": [], "pages": 0, "error": f"{shard[1]} crashed the extraction worker."}
+
+class ExtractionProgress:
+    def __init__(self, total_shards, report_every=5.0):
+        self.total_shards = total_shards
+        self.report_every = report_every
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.shards = 0
+        self.pages = 0
+        self.tables = 0
+        self.records = 0
+        self.errors = []
+
+    def update(self, result):
+        self.shards += 1
+        self.pages += result["pages"]
+        self.records += len(result["records"])
+        self.tables += sum(1 for r in result["records"] if r["type"] == "table")
+        if result["error"]:
+            self.errors.append(result["error"])
+            print(f"❌ Error: {result['error']}")
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"{self.shards}/{self.total_shards} shards, {self.pages} pages, {self.tables} tables "
+            f"in {elapsed:.1f}s ({self.pages / elapsed:.1f} pages/s, {self.tables / elapsed:.1f} tables/s)"
+        )
+
+    def maybe_report(self):
+        now = time.perf_counter()
+        if now - self.last_report >= self.report_every:
+            self.last_report = now
+            print(f"⏱️ {self.summary()}")
+
+def extract_directory_to_jsonl(directory, output_path, workers=None, pages_per_shard=PAGES_PER_SHARD,
+                               report_every=5.0, facts_store=None):
+    shards = plan_shards(directory, pages_per_shard)
+    workers = workers or os.cpu_count() or 1
+    # Bound the number of shards in flight so out-of-order results cannot pile up in memory
+    max_in_flight = workers * 2
+    progress = ExtractionProgress(len(shards), report_every)
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending = {}   # future -> shard index
+    finished = {}  # shard index -> result, waiting for its turn to be written
+    next_submit = 0
+    next_write = 0
+    facts_count = 0
+
+    try:
+        with open(output_path, "w", encoding="utf-8") as out:
+            while next_write < len(shards):
+                while next_submit < len(shards) and len(pending) + len(finished) < max_in_flight:
+                    pending[pool.submit(_extract_shard, shards[next_submit])] = next_submit
+                    next_submit += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                lost = []
+                for future in done:
+                    idx = pending.pop(future)
+                    try:
+                        finished[idx] = future.result()
+                    except BrokenProcessPool:
+                        # A worker died (e.g. a segfault inside the PDF parser)
+                        lost.append(idx)
+
+                if lost:
+                    # Every in-flight shard is lost with the pool, the healthy ones included
+                    lost.extend(pending.values())
+                    pending.clear()
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    for idx in sorted(lost):
+                        finished[idx] = _extract_shard_alone(shards[idx])
+                    pool = ProcessPoolExecutor(max_workers=workers)
+
+                # Write in shard order, which keeps (file, page, table_index) deterministic
+                while next_write in finished:
+                    result = finished.pop(next_write)
+                    for record in result["records"]:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    if facts_store is not None:
+                        facts_count += sum(facts_store.add_record(record) for record in result["records"])
+                    progress.update(result)
+                    next_write += 1
+                progress.maybe_report()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    print(f"⏱️ {progress.summary()}")
+    if progress.errors:
+        print(f"⚠️ {len(progress.errors)} shards failed, see errors above.")
+    print(f"✅ {progress.records} records streamed to JSONL file: {output_path}")
+    if facts_store is not None:
+        facts_store.commit()
+        print(f"✅ {facts_count} financial facts stored in {facts_store.path}")
+    return progress
+
+
 if __name__ == "__main__":
-    extract_tables_from_directory_to_json("data", "structured_data.json")
+    parser = argparse.ArgumentParser(description="Extract tables and text from IR PDFs.")
+    parser.add_argument("directory", nargs="?", default="data")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Use the process pool and stream records to JSONL.")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pages-per-shard", type=int, default=PAGES_PER_SHARD)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--no-facts", action="store_true",
+                        help="Do not rebuild the financial facts store from the extracted tables.")
+    args = parser.parse_args()
+
+    facts_store = None
+    if not args.no_facts:
+        from financial_facts import FactsStore
+        facts_store = FactsStore()
+        facts_store.reset("pdf")
 
+    if args.parallel:
+        extract_directory_to_jsonl(args.directory, args.output or "structured_data.jsonl",
+                                   workers=args.workers, pages_per_shard=args.pages_per_shard,
+                                   facts_store=facts_store)
+    else:
+        extract_tables_from_directory_to_json(args.directory, args.output or "structured_data.json",
+                                              facts_store=facts_store)
@@ -1,36 +1,20 @@
-python
- 📦 Import necessary libraries
+# 📦 Import necessary libraries
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import re
-from smolagents import InferenceClientModel, CodeAgent 
+import threading
 from dotenv import load_dotenv
 
- 🔑 Load HuggingFace token and log in
+# 🔑 Load HuggingFace token and log in
 load_dotenv()
 
- 🧠 Initialize LLM model with Inference API
-model = InferenceClientModel("meta-llama/Llama-3.1-70B-Instruct")
+MODEL_ID = "meta-llama/Llama-3.1-70B-Instruct"
+_agent = None
+_agent_lock = threading.Lock()
 
- 🤖 Define agent with allowed libraries
-agent = CodeAgent(
-    tools=[],
-    model=model,
-    additional_authorized_imports=[
-        "numpy",
-        "pandas",
-        "matplotlib.pyplot",
-        "seaborn"
-    ]
-)
-
- 📁 Ensure output directory exists
-os.makedirs("figures", exist_ok=True)
-
- 📓 Additional notes (e.g., column descriptions)
+# 📓 Additional notes (e.g., column descriptions), part of the agent's instructions on every run
 additional_notes = """
+ Prefer the tools get_series, compare_companies and top_n_by_concept over reading the CSV:
+ the data is already loaded and indexed (they return pandas DataFrames).
+ Draw charts with plot_chart (cached, returns the PNG path) and mention the path in the final answer.
  Variable Description:
 - 'company': Company name
 - 'concept': Financial metric (e.g., revenue, expenses, equity)
@@ -38,49 +22,60 @@ additional_notes = """
 - This file contains financial results for various companies across multiple quarters.
 """
 
+# 🧠 Model and 🤖 agent are created on first use, not at import time
+def get_model():
+    from smolagents import InferenceClientModel
+    # Initialize LLM model with Inference API
+    return InferenceClientModel(MODEL_ID)
+
+def get_agent():
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            from smolagents import CodeAgent
+            from financials_dataset import get_dataset, get_dataset_tools
+            from chart_service import get_chart_service, get_chart_tools
+            get_dataset()  # parse (or map) the financials once, before the first request
+            get_chart_service().warm_up()  # start the rendering processes (matplotlib, fonts)
+            # Define agent with allowed libraries, the dataset query tools and the chart tool
+            _agent = CodeAgent(
+                tools=get_dataset_tools() + get_chart_tools(),
+                model=get_model(),
+                instructions=additional_notes,
+                additional_authorized_imports=[
+                    "numpy",
+                    "pandas",
+                    "matplotlib.pyplot",
+                    "seaborn"
+                ]
+            )
+        return _agent
+
+# `from data_analysis_agent import agent` keeps working (builds the agent on access)
+def __getattr__(name):
+    if name == "agent":
+        return get_agent()
+    raise AttributeError(f"module 'data_analysis_agent' has no attribute '{name}'")
+
+# 📁 Ensure output directory exists (charts themselves go to figures/cache via chart_service)
+os.makedirs("figures", exist_ok=True)
+
 def generate_apple_profit_plot():
-    """Creates a plot of Apple's profit over the last 3 years from all_company_financials.csv and saves it to figures/apple_profit_last3years.png. Returns the image path."""
-    import pandas as pd
-    import matplotlib.pyplot as plt
-    import os
-     Load CSV
-    df = pd.read_csv("all_company_financials.csv")
-     Filter for Apple, concept=Profit
-    df_apple = df[(df['company'].str.lower() == 'apple') & (df['concept'].str.lower().str.contains('profit'))]
-     Extract only columns with year data
-    year_cols = [col for col in df_apple.columns if re.match(r"^20\d{2}", col)]
-     Find last 3 years
-    years = sorted(year_cols)[-3:]
-    values = [float(df_apple[y].values[0]) if not df_apple[y].isnull().all() else 0 for y in years]
-     Plot
-    plt.figure(figsize=(6,4))
-    plt.bar(years, values, color="0071c5")
-    plt.title("Apple Profit (Last 3 Years)")
-    plt.ylabel("Profit (Billion USD)")
-    plt.xlabel("Year")
-    plt.tight_layout()
-     Filename: Only letters/numbers, all lowercase
-    safe_name = re.sub(r'[^a-z0-9]', '', 'apple')
-    fname = f"{safe_name}_profit_last3years.png"
-    out_path = os.path.join("figures", fname)
-    plt.savefig(out_path)
-    plt.close()
-    return out_path
+    """Creates a plot of Apple's profit over the last 3 years from all_company_financials.csv and returns the image path (figures/cache/<key>.png, reused while the data is unchanged)."""
+    from chart_service import get_chart_service
+    return get_chart_service().render(["apple"], "profit", last_years=3, chart_type="bar")
 
 if __name__ == "__main__":
-     📣 User interaction - input prompt
+    # 📣 User interaction - input prompt
     print("🔍 Please enter your analysis request (e.g., 'Compare the liabilities of Apple and Microsoft in 2024.'):\n")
     user_prompt = input("> ")
 
-     🏃 Run agent with analysis request
-    response = agent.run(
+    # 🏃 Run agent with analysis request
+    response = get_agent().run(
         user_prompt,
-        additional_args={
-            "source_file": "all_company_financials.csv",
-            "additional_notes": additional_notes
-        }
+        additional_args={"source_file": "all_company_financials.csv"}
     )
 
-     🖨 Display result
+    # 🖨 Display result
     print("\n📊 Analysis Result:\n")
     print(response)
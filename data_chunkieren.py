@@ -1,33 +1,55 @@
-python
 import os
 import json
 import shutil
+import hashlib
+import argparse
+import importlib.util
 from dotenv import load_dotenv
 from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
+from embedding_cache import get_embeddings, EMBEDDING_BACKEND
+from query_analysis import enrich_metadata
+from hybrid_retrieval import BM25Index, BM25_PATH
+from table_chunker import CHUNK_STRATEGY, TableAwareChunker
 
 # Load .env file
 load_dotenv()
 
 # File paths
 DATA_PATH = "structured_data.json"
+PDF_DIR = "data"
 CHROMA_DIR = "chroma_langchain_db"
+# Same collection that rag_agnet_brandnew.load_existing_vectorstore opens
+COLLECTION_NAME = "example_collection"
+# Source-file and chunk hashes of the incremental ingest, kept next to the vectors
+MANIFEST_PATH = os.path.join(CHROMA_DIR, "ingest_manifest.json")
+ADD_BATCH_SIZE = 1000
 
 def load_structured_data(json_path):
     with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return [Document(page_content=item["content"], metadata=item) for item in data]
+        # JSONL output of the parallel extraction: one record per line
+        if json_path.endswith(".jsonl"):
+            data = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+    return records_to_documents(data)
 
-def chunk_documents(documents, chunk_size=1000, chunk_overlap=200):
+def records_to_documents(records):
+    # Metadata gets company_key/year so retrieval can filter by company and year
+    return [Document(page_content=item["content"], metadata=enrich_metadata(item)) for item in records]
+
+def chunk_documents(documents, chunk_size=1000, chunk_overlap=200, strategy=CHUNK_STRATEGY):
+    if strategy == "table":
+        # Row groups with the header repeated for tables, deduplicated prose (table_chunker.py)
+        return TableAwareChunker().split_documents(documents)
     splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     return splitter.split_documents(documents)
 
-def embed_and_store(chunks):
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
+def embed_and_store(chunks, backend=EMBEDDING_BACKEND):
+    embeddings = get_embeddings(backend=backend)
 
-    # Delete old database if exists
+    # Delete old database if exists (this also drops the incremental manifest)
     if os.path.exists(CHROMA_DIR):
         shutil.rmtree(CHROMA_DIR)
 
@@ -35,23 +57,172 @@ def embed_and_store(chunks):
     db = Chroma.from_documents(
         documents=chunks,
         embedding=embeddings,
+        collection_name=COLLECTION_NAME,
         persist_directory=CHROMA_DIR
     )
+    # Keyword index over the same chunks for the hybrid retriever
+    BM25Index.from_vectorstore(db).save(BM25_PATH)
     return db
 
-def main():
+# === Incremental ingest: only new/changed PDFs are extracted, chunked and embedded ===
+def _load_extractor():
+    # "data_ extract.py" has a space in its name, so it cannot be imported normally
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_ extract.py")
+    spec = importlib.util.spec_from_file_location("data_extract", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_ids(source_key, chunks):
+    # Content-derived ids: an unchanged chunk keeps its id (and its vector) when the file changes
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        meta = chunk.metadata
+        raw = f"{source_key}|{meta.get('page')}|{meta.get('table_index', '')}|{chunk.page_content}"
+        chunk_id = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        # Identical chunks on the same page still need distinct ids
+        seen[chunk_id] = seen.get(chunk_id, 0) + 1
+        if seen[chunk_id] > 1:
+            chunk_id = f"{chunk_id}-{seen[chunk_id]}"
+        ids.append(chunk_id)
+    return ids
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    os.makedirs(CHROMA_DIR, exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def incremental_ingest(pdf_dir=PDF_DIR, backend=EMBEDDING_BACKEND, strategy=CHUNK_STRATEGY):
+    extractor = _load_extractor()
+    embeddings = get_embeddings(backend=backend)
+    db = Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=embeddings,
+        persist_directory=CHROMA_DIR
+    )
+
+    manifest = load_manifest()
+    if manifest is None:
+        # Vectors from a full rebuild have random ids we cannot match: start the collection over
+        if db.get(limit=1)["ids"]:
+            print("⚠️ No ingest manifest found, resetting the existing collection once.")
+            db.reset_collection()
+        manifest = {"collection": COLLECTION_NAME, "files": {}}
+    elif manifest.get("encoder", embeddings.model_name) != embeddings.encoder_id:
+        # Vectors of two encoders in one collection are not comparable: re-embed everything once
+        print(f"⚠️ Collection was embedded with {manifest.get('encoder', embeddings.model_name)}, "
+              f"not {embeddings.encoder_id}: resetting it.")
+        db.reset_collection()
+        manifest = {"collection": COLLECTION_NAME, "files": {}}
+    manifest["encoder"] = embeddings.encoder_id
+    # Another chunker: unchanged files are re-chunked too, their new ids replace the old chunks
+    rechunk = manifest.get("chunker", "recursive") != strategy
+    manifest["chunker"] = strategy
+
+    report = {"added": 0, "skipped": 0, "removed": 0,
+              "new_files": 0, "changed_files": 0, "removed_files": 0}
+    old_files = manifest["files"]
+    new_files = {}
+    ids_to_delete = []
+
+    for company, file_path, filename in extractor.iter_pdf_files(pdf_dir):
+        source_key = f"{company}/{filename}"
+        sha = file_sha256(file_path)
+        previous = old_files.get(source_key)
+
+        if previous and previous["sha256"] == sha and not rechunk:
+            new_files[source_key] = previous
+            report["skipped"] += len(previous["chunks"])
+            continue
+
+        try:
+            records = list(extractor.extract_pdf_records(file_path, company, filename, verbose=False))
+        except Exception as e:
+            # Keep the old vectors of a file that can no longer be read
+            print(f"❌ Error: {file_path} could not be read. {e}")
+            if previous:
+                new_files[source_key] = previous
+            continue
+
+        chunks = chunk_documents(records_to_documents(records), strategy=strategy)
+        ids = chunk_ids(source_key, chunks)
+        old_ids = set(previous["chunks"]) if previous else set()
+        to_add = [(chunk_id, chunk) for chunk_id, chunk in zip(ids, chunks) if chunk_id not in old_ids]
+
+        for start in range(0, len(to_add), ADD_BATCH_SIZE):
+            batch = to_add[start:start + ADD_BATCH_SIZE]
+            db.add_documents([chunk for _, chunk in batch], ids=[chunk_id for chunk_id, _ in batch])
+
+        ids_to_delete.extend(old_ids - set(ids))
+        report["added"] += len(to_add)
+        report["skipped"] += len(ids) - len(to_add)
+        report["changed_files" if previous else "new_files"] += 1
+        new_files[source_key] = {"sha256": sha, "chunks": ids}
+
+    for source_key, previous in old_files.items():
+        if source_key not in new_files:
+            ids_to_delete.extend(previous["chunks"])
+            report["removed_files"] += 1
+
+    if ids_to_delete:
+        db.delete(ids=ids_to_delete)
+    report["removed"] = len(ids_to_delete)
+
+    manifest["files"] = new_files
+    save_manifest(manifest)
+    if ids_to_delete or report["added"] or not os.path.exists(BM25_PATH):
+        BM25Index.from_vectorstore(db).save(BM25_PATH)
+
+    print(f"📊 Embedding cache: {embeddings.format_stats()}")
+    print(
+        f"✅ Incremental ingest: {report['added']} chunks added, {report['skipped']} skipped, "
+        f"{report['removed']} removed ({report['new_files']} new, {report['changed_files']} changed, "
+        f"{report['removed_files']} removed files)."
+    )
+    return report
+
+def main(backend=EMBEDDING_BACKEND, strategy=CHUNK_STRATEGY):
     print("🔄 Loading data...")
     documents = load_structured_data(DATA_PATH)
     print(f"📄 {len(documents)} documents found.")
 
     print("✂️ Starting chunking...")
-    chunks = chunk_documents(documents)
-    print(f"✅ {len(chunks)} chunks created.")
+    chunks = chunk_documents(documents, strategy=strategy)
+    print(f"✅ {len(chunks)} chunks created ({strategy}).")
 
     print("📦 Embedding and storing in Chroma...")
-    embed_and_store(chunks)
+    embed_and_store(chunks, backend)
+    print(f"📊 Embedding cache: {get_embeddings(backend=backend).format_stats()}")
     print(f"✅ All data has been stored in '{CHROMA_DIR}'.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Chunk and embed the extracted IR data into Chroma.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only ingest new/changed PDFs from the data directory and drop removed ones.")
+    parser.add_argument("--pdf-dir", default=PDF_DIR)
+    parser.add_argument("--embeddings", choices=["torch", "onnx"], default=EMBEDDING_BACKEND,
+                        help="Encoder backend (onnx: int8 export from onnx_encoder.py, no torch needed).")
+    parser.add_argument("--chunking", choices=["recursive", "table"], default=CHUNK_STRATEGY,
+                        help="table: header-repeating row groups for tables, deduplicated prose chunks.")
+    args = parser.parse_args()
 
+    if args.incremental:
+        incremental_ingest(args.pdf_dir, args.embeddings, args.chunking)
+    else:
+        main(args.embeddings, args.chunking)
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer use only
+    fcntl = None
+
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+# "torch": sentence-transformers via HuggingFaceEmbeddings, "onnx": int8 ONNX export (onnx_encoder.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+CACHE_DIR = "embedding_cache"
+
+def normalize_text(text: str) -> str:
+    # Unicode + whitespace normalization, so reflowed boilerplate maps to the same key
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+def cache_key(model_name: str, kind: str, text: str) -> str:
+    return hashlib.sha1(f"{model_name}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+
+# === 1. On-disk vector store: append-only matrix (memory-mapped on read) + key index ===
+class DiskVectorStore:
+    def __init__(self, directory: str, dim: int, dtype: str = "float16"):
+        os.makedirs(directory, exist_ok=True)
+        self.dtype = np.dtype(dtype)
+        self.dim = dim
+        self.row_bytes = self.dtype.itemsize * dim
+        self.vectors_path = os.path.join(directory, "vectors.bin")
+        self.keys_path = os.path.join(directory, "keys.txt")
+        self.index = {}        # key -> row
+        self._keys_offset = 0  # bytes of keys.txt already read
+        self._matrix = None
+        self._lock = threading.Lock()
+
+        meta_path = os.path.join(directory, "meta.json")
+        meta = {"dim": dim, "dtype": self.dtype.name}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored != meta:
+                raise ValueError(f"Embedding cache in {directory} was built with {stored}, not {meta}.")
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        for path in (self.vectors_path, self.keys_path):
+            open(path, "ab").close()
+        self._sync()
+
+    def __len__(self):
+        return len(self.index)
+
+    def _sync(self):
+        # Pick up keys appended since the last read (also by other processes)
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        self._keys_offset += len(complete)
+        # A key is only written after its vector, but never trust more rows than the file holds
+        rows_on_disk = os.path.getsize(self.vectors_path) // self.row_bytes
+        for line in complete.decode("ascii").splitlines():
+            row = len(self.index)
+            if row >= rows_on_disk:
+                break
+            self.index[line] = row
+        self._matrix = None
+
+    def _rows(self):
+        if self._matrix is None or self._matrix.shape[0] < len(self.index):
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r",
+                                     shape=(len(self.index), self.dim)) if self.index else None
+        return self._matrix
+
+    def get_many(self, keys):
+        with self._lock:
+            matrix = self._rows()
+            return {key: np.asarray(matrix[self.index[key]], dtype=np.float32)
+                    for key in keys if key in self.index}
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=self.dtype).reshape(len(keys), self.dim)
+        with self._lock, open(self.keys_path, "ab") as keys_file:
+            if fcntl:
+                fcntl.flock(keys_file, fcntl.LOCK_EX)
+            try:
+                self._sync()
+                new = [(key, vec) for key, vec in zip(keys, vectors) if key not in self.index]
+                if not new:
+                    return
+                with open(self.vectors_path, "ab") as f:
+                    # Drop a torn trailing row left by a crashed writer
+                    f.truncate(len(self.index) * self.row_bytes)
+                    f.write(np.stack([vec for _, vec in new]).tobytes())
+                keys_file.write("".join(f"{key}\n" for key, _ in new).encode("ascii"))
+                keys_file.flush()
+                self._sync()
+            finally:
+                if fcntl:
+                    fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+
+# === 2. Cache-backed embeddings wrapper (drop-in for HuggingFaceEmbeddings) ===
+class CachedEmbeddings(Embeddings):
+    def __init__(self, model_name: str = EMBEDDING_MODEL, cache_dir: str = CACHE_DIR,
+                 dtype: str = "float16", batch_size: int = 256, query_cache_size: int = 4096,
+                 base: Embeddings = None, backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        # The int8 encoder gives slightly different vectors (truncated at ONNX_MAX_LENGTH): its own cache and keys
+        self.encoder_id = model_name
+        if backend == "onnx":
+            from onnx_encoder import ONNX_MAX_LENGTH
+            self.encoder_id = f"{model_name}@onnx-int8-{ONNX_MAX_LENGTH}"
+        self.cache_dir = os.path.join(cache_dir, self.encoder_id.replace("/", "__"))
+        self.dtype = dtype
+        self.batch_size = batch_size
+        self.query_cache_size = query_cache_size
+        self._base = base
+        self._store = None
+        self._queries = OrderedDict()  # in-memory LRU for query vectors
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "embedded": 0, "embed_seconds": 0.0}
+
+    @property
+    def base(self) -> Embeddings:
+        # The model is only loaded when there is a miss to embed
+        if self._base is None and self.backend == "onnx":
+            from onnx_encoder import get_onnx_embeddings
+            self._base = get_onnx_embeddings(self.model_name)
+        elif self._base is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            self._base = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._base
+
+    def _embed(self, texts, query=False):
+        started = time.perf_counter()
+        if query:
+            vectors = [self.base.embed_query(texts[0])]
+        else:
+            vectors = []
+            for start in range(0, len(texts), self.batch_size):
+                vectors.extend(self.base.embed_documents(texts[start:start + self.batch_size]))
+        with self._lock:
+            self.stats["embed_seconds"] += time.perf_counter() - started
+            self.stats["embedded"] += len(texts)
+        if self._store is None:
+            self._store = DiskVectorStore(self.cache_dir, len(vectors[0]), self.dtype)
+        return vectors
+
+    def _lookup(self, keys):
+        if self._store is None:
+            meta_path = os.path.join(self.cache_dir, "meta.json")
+            if not os.path.exists(meta_path):
+                return {}
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self._store = DiskVectorStore(self.cache_dir, meta["dim"], meta["dtype"])
+        return self._store.get_many(keys)
+
+    def embed_documents(self, texts):
+        normalized = [normalize_text(t) for t in texts]
+        keys = [cache_key(self.encoder_id, "doc", t) for t in normalized]
+        found = self._lookup(set(keys))
+
+        # Embed each distinct missing text once, in large batches
+        missing = {}
+        for key, text in zip(keys, normalized):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self._embed(list(missing.values()))
+            self._store.put_many(list(missing), vectors)
+            found.update({key: np.asarray(vec, dtype=np.float32) for key, vec in zip(missing, vectors)})
+
+        with self._lock:
+            self.stats["misses"] += len(missing)
+            self.stats["disk_hits"] += len(keys) - len(missing)
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        normalized = normalize_text(text)
+        key = cache_key(self.encoder_id, "query", normalized)
+        with self._lock:
+            if key in self._queries:
+                self._queries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._queries[key]
+
+        vector = self._lookup([key]).get(key)
+        if vector is not None:
+            vector = vector.tolist()
+            with self._lock:
+                self.stats["disk_hits"] += 1
+        else:
+            vector = self._embed([normalized], query=True)[0]
+            self._store.put_many([key], [vector])
+            vector = np.asarray(vector, dtype=np.float32).tolist()
+            with self._lock:
+                self.stats["misses"] += 1
+
+        with self._lock:
+            self._queries[key] = vector
+            if len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        return vector
+
+    def format_stats(self) -> str:
+        s = dict(self.stats)
+        hits = s["memory_hits"] + s["disk_hits"]
+        total = hits + s["misses"]
+        per_text = s["embed_seconds"] / s["embedded"] if s["embedded"] else 0.0
+        return (
+            f"{hits}/{total} hits ({s['memory_hits']} memory, {s['disk_hits']} disk), "
+            f"{s['misses']} misses, {s['embed_seconds']:.1f}s embedding, "
+            f"~{hits * per_text:.1f}s CPU saved"
+        )
+
+
+# === 3. One shared wrapper per model for ingestion and query time ===
+_instances = {}
+_instances_lock = threading.Lock()
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL, backend: str = EMBEDDING_BACKEND) -> CachedEmbeddings:
+    with _instances_lock:
+        if (model_name, backend) not in _instances:
+            _instances[(model_name, backend)] = CachedEmbeddings(model_name=model_name, backend=backend)
+        return _instances[(model_name, backend)]
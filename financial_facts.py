@@ -0,0 +1,309 @@
+import os
+import re
+import csv
+import json
+import sqlite3
+import argparse
+import threading
+from collections import defaultdict, Counter
+from query_analysis import analyze_query, company_key
+from tracing import span
+
+FACTS_DB = "financial_facts.db"
+FINANCIALS_CSV = "all_company_financials.csv"
+
+# Canonical concept -> row labels in IR tables and concept names in all_company_financials.csv
+CONCEPT_LABELS = {
+    "revenue": ["total net sales", "net sales", "total revenues", "total revenue", "revenues", "revenue",
+                "net revenue", "net revenues", "revenuefromcontractwithcustomerexcludingassessedtax"],
+    "net_income": ["net income", "net income (loss)", "net earnings", "netincomeloss", "profit", "net profit"],
+    "operating_income": ["operating income", "operating income (loss)", "income from operations",
+                         "operatingincomeloss"],
+    "gross_profit": ["gross margin", "total gross margin", "gross profit", "grossprofit"],
+    "cash": ["cash and cash equivalents", "cash and cash equivalents, end of period",
+             "cash and cash equivalents, end of year", "cashandcashequivalentsatcarryingvalue"],
+    "total_assets": ["total assets", "assets"],
+    "total_liabilities": ["total liabilities", "liabilities"],
+    "equity": ["total shareholders' equity", "total stockholders' equity", "total shareholders’ equity",
+               "total stockholders’ equity", "stockholdersequity"],
+}
+CONCEPT_NAMES = {
+    "revenue": "revenue", "net_income": "net income", "operating_income": "operating income",
+    "gross_profit": "gross profit", "cash": "cash and cash equivalents", "total_assets": "total assets",
+    "total_liabilities": "total liabilities", "equity": "shareholders' equity",
+}
+# Balance-sheet items are point-in-time: any period inside the year answers "in year Y"
+STOCK_CONCEPTS = {"cash", "total_assets", "total_liabilities", "equity"}
+
+# Words in a question -> canonical concept (longest phrases are matched first)
+CONCEPT_QUERY_TERMS = {
+    "revenue": ["revenue", "revenues", "sales", "net sales", "turnover", "umsatz", "umsätze", "einnahmen"],
+    "net_income": ["profit", "net income", "net profit", "earnings", "gewinn", "jahresüberschuss"],
+    "operating_income": ["operating income", "operating profit", "betriebsergebnis"],
+    "gross_profit": ["gross margin", "gross profit", "bruttomarge"],
+    "cash": ["cash", "cash and cash equivalents", "barmittel", "liquide mittel"],
+    "total_assets": ["total assets", "assets", "bilanzsumme"],
+    "total_liabilities": ["liabilities", "total liabilities", "verbindlichkeiten"],
+    "equity": ["equity", "shareholders' equity", "eigenkapital"],
+}
+# Anything beyond a single lookup (comparisons, trends, explanations) goes to the agents
+NOT_A_LOOKUP = re.compile(
+    r"\b(compare|comparison|vs|versus|trend|growth|grow|change|why|explain|forecast|plot|chart|"
+    r"average|between|analy\w*|statisti\w*|visuali\w*|diagramm|vergleich\w*|warum|entwicklung|prognose)\b",
+    re.IGNORECASE,
+)
+# The store answers full fiscal years only; quarters, half-years and outlooks go to the RAG path
+PERIOD_QUALIFIER = re.compile(
+    r"\b(q[1-4]|quarter\w*|quartal\w*|h[12]|half[- ]year\w*|first half|second half|halbjahr\w*|"
+    r"project\w*|forecast\w*|guidance|outlook|expected|estimated?|prognos\w*)\b",
+    re.IGNORECASE,
+)
+
+_LABEL_TO_CONCEPT = {label: concept for concept, labels in CONCEPT_LABELS.items() for label in labels}
+_TERM_TO_CONCEPT = {term: concept for concept, terms in CONCEPT_QUERY_TERMS.items() for term in terms}
+_CONCEPT_QUERY_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted(map(re.escape, _TERM_TO_CONCEPT), key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+_YEAR = re.compile(r"(?<!\d)(20\d{2})(?!\d)")
+_FOOTNOTE = re.compile(r"\(\d\)|\*+|:$")
+_SCALE = re.compile(r"in (millions|billions|thousands)", re.IGNORECASE)
+_CURRENCY_CELLS = {"$", "€"}
+
+
+# === 1. Parsing helpers for pipe-joined tables from data_ extract.py ===
+def parse_number(cell):
+    # "$ 394,328" -> 394328.0, "(1,234)" -> -1234.0, "—" / "" -> None
+    if cell is None:
+        return None
+    text = cell.strip().replace("$", "").replace("€", "").replace(" ", "").replace("—", "")
+    negative = text.startswith("(") and text.endswith(")")
+    text = text.strip("()").rstrip("%")
+    if not re.fullmatch(r"-?\d{1,3}(,\d{3})*(\.\d+)?|-?\d+(\.\d+)?", text):
+        return None
+    value = float(text.replace(",", ""))
+    return -value if negative else value
+
+def normalize_label(label: str) -> str:
+    return _FOOTNOTE.sub("", " ".join((label or "").lower().split())).strip()
+
+def concept_for_label(label: str):
+    label = normalize_label(label)
+    if label in _LABEL_TO_CONCEPT:
+        return _LABEL_TO_CONCEPT[label]
+    if label.startswith("cash and cash equivalents"):
+        return "cash"
+    return None
+
+def _period_from_header(cell: str):
+    # "2022" / "Fiscal 2022" -> annual; "Q3 2023" / "Three Months Ended ..." -> quarter
+    years = _YEAR.findall(cell or "")
+    if len(years) != 1:
+        return None
+    lowered = cell.lower()
+    if re.search(r"six months|nine months", lowered):
+        return None
+    if re.search(r"\bq[1-4]\b|three months|quarter", lowered):
+        return {"period": " ".join(cell.split()), "year": int(years[0]), "period_type": "quarter"}
+    return {"period": years[0], "year": int(years[0]), "period_type": "annual"}
+
+def facts_from_table(record: dict):
+    rows = [[cell.strip() for cell in row.split(" | ")] for row in record["content"].split("\n")]
+    scale = _SCALE.search(record["content"])
+    unit = f"USD {scale.group(1).lower()}" if scale else ""
+
+    # The first row with period headers defines the value columns
+    columns = {}
+    header_idx = None
+    for idx, row in enumerate(rows):
+        columns = {col: p for col, p in ((col, _period_from_header(c)) for col, c in enumerate(row)) if p}
+        if columns:
+            header_idx = idx
+            break
+    if header_idx is None:
+        return []
+
+    facts = []
+    for row in rows[header_idx + 1:]:
+        if not row:
+            continue
+        concept = concept_for_label(row[0])
+        if not concept:
+            continue
+        # "$" often lands in its own cell and shifts the figures right: one value per period column
+        # pairs them in order, otherwise the period's own cell counts (a lone "$" points to its neighbour)
+        values = [cell for cell in row[1:] if cell and cell not in _CURRENCY_CELLS]
+        if len(values) == len(columns):
+            cells = dict(zip(sorted(columns), values))
+        else:
+            cells = {}
+            for col in columns:
+                cell = row[col] if col < len(row) else ""
+                cells[col] = row[col + 1] if cell in _CURRENCY_CELLS and col + 1 < len(row) else cell
+        for col, period in columns.items():
+            # Any other non-number ("—", "") means there is no value, not the next period's value
+            value = parse_number(cells[col])
+            if value is not None:
+                facts.append(dict(period, concept=concept, value=value, raw_value=cells[col], unit=unit))
+    return facts
+
+
+# === 2. SQLite store with an in-memory (company, concept, year) index ===
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    company TEXT, company_key TEXT, concept TEXT, period TEXT, year INTEGER, period_type TEXT,
+    value REAL, raw_value TEXT, unit TEXT, file TEXT, page INTEGER, origin TEXT
+);
+CREATE INDEX IF NOT EXISTS facts_lookup ON facts (company_key, concept, year);
+"""
+
+class FactsStore:
+    def __init__(self, path: str = FACTS_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._index = None
+        self._lock = threading.Lock()
+
+    def reset(self, origin: str):
+        self.conn.execute("DELETE FROM facts WHERE origin = ?", (origin,))
+        self._index = None
+
+    def _insert(self, rows):
+        self.conn.executemany("INSERT INTO facts VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+        self._index = None
+
+    def add_record(self, record: dict) -> int:
+        # Called for every extraction record; only tables carry facts
+        if record.get("type") != "table":
+            return 0
+        facts = facts_from_table(record)
+        self._insert([
+            (record["company"], company_key(record["company"]), f["concept"], f["period"], f["year"],
+             f["period_type"], f["value"], f["raw_value"], f["unit"], record["file"], record["page"], "pdf")
+            for f in facts
+        ])
+        return len(facts)
+
+    def add_csv(self, path: str = FINANCIALS_CSV) -> int:
+        # all_company_financials.csv: company, concept, one column per period ("2024-03-31")
+        self.reset(os.path.basename(path))
+        rows = []
+        with open(path, "r", encoding="utf-8") as f:
+            for item in csv.DictReader(f):
+                concept = concept_for_label(item.get("concept", ""))
+                if not concept:
+                    continue
+                for column, cell in item.items():
+                    match = re.match(r"^(20\d{2})-\d{2}-\d{2}$", column or "")
+                    value = parse_number(cell) if match else None
+                    if value is None:
+                        continue
+                    rows.append((item["company"], company_key(item["company"]), concept, column,
+                                 int(match.group(1)), "quarter", value, cell, "", os.path.basename(path),
+                                 None, os.path.basename(path)))
+        self._insert(rows)
+        self.commit()
+        return len(rows)
+
+    def commit(self):
+        self.conn.commit()
+
+    def _load_index(self):
+        with self._lock:
+            if self._index is None:
+                index = defaultdict(list)
+                for row in self.conn.execute("SELECT * FROM facts"):
+                    fact = dict(zip(("company", "company_key", "concept", "period", "year", "period_type",
+                                     "value", "raw_value", "unit", "file", "page", "origin"), row))
+                    index[(fact["company_key"], fact["concept"], fact["year"])].append(fact)
+                self._index = index
+            return self._index
+
+    def lookup(self, company: str, concept: str, year: int):
+        facts = self._load_index().get((company_key(company), concept, year), [])
+        annual = [f for f in facts if f["period_type"] == "annual"]
+        if annual:
+            facts = annual
+        elif concept in STOCK_CONCEPTS and facts:
+            # Only quarterly balances: the latest quarter stands for the year
+            latest = max(f["period"] for f in facts)
+            facts = [f for f in facts if f["period"] == latest]
+        else:
+            # Flows (revenue, profit) need a full-year figure, never a single quarter
+            return None
+        # The same figure is repeated across reports: take the most frequent value, cite its first source
+        value, _ = Counter(f["value"] for f in facts).most_common(1)[0]
+        return next(f for f in facts if f["value"] == value)
+
+
+# === 3. No-LLM fast path for direct metric lookups ===
+def concepts_in(question: str) -> set:
+    return {_TERM_TO_CONCEPT[m.lower()] for m in _CONCEPT_QUERY_PATTERN.findall(question)}
+
+def parse_metric_question(question: str):
+    if NOT_A_LOOKUP.search(question) or PERIOD_QUALIFIER.search(question):
+        return None
+    analysis = analyze_query(question)
+    concepts = concepts_in(question)
+    if len(analysis["companies"]) != 1 or len(analysis["years"]) != 1 or len(concepts) != 1:
+        return None
+    return analysis["companies"][0], concepts.pop(), analysis["years"][0]
+
+def format_value(fact: dict) -> str:
+    if fact["unit"]:
+        return f"{fact['raw_value'].replace('$', '').strip()} ({fact['unit']})"
+    # CSV values are plain US dollars
+    value = fact["value"]
+    for threshold, word in ((1e9, "billion"), (1e6, "million")):
+        if abs(value) >= threshold:
+            return f"{value / threshold:.2f} {word} US dollars"
+    return f"{value:,.0f} US dollars"
+
+def format_fact(fact: dict) -> tuple:
+    period = f" ({fact['period']})" if fact["period_type"] == "quarter" else ""
+    answer = (f"{fact['company']}'s {CONCEPT_NAMES[fact['concept']]} in {fact['year']}{period} "
+              f"was {format_value(fact)}.")
+    location = f"{fact['file']}, page {fact['page']}" if fact["page"] else fact["file"]
+    return answer, f"Financial facts store ({fact['company']}/{location})"
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_facts_store(path: str = FACTS_DB):
+    global _store
+    with _store_lock:
+        if _store is None and os.path.exists(path):
+            _store = FactsStore(path)
+        return _store
+
+def answer_from_facts(question: str):
+    # Returns (answer, source) when the store has the figure, otherwise None
+    parsed = parse_metric_question(question)
+    store = get_facts_store() if parsed else None
+    if store is None:
+        return None
+    with span("facts_lookup") as current:
+        fact = store.lookup(*parsed)
+        current.set(cache_hit=fact is not None)
+    return format_fact(fact) if fact else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the financial facts store.")
+    parser.add_argument("--records", default=None, help="Extraction output (.json or .jsonl).")
+    parser.add_argument("--csv", default=FINANCIALS_CSV)
+    parser.add_argument("--db", default=FACTS_DB)
+    args = parser.parse_args()
+
+    store = FactsStore(args.db)
+    if args.records:
+        store.reset("pdf")
+        with open(args.records, "r", encoding="utf-8") as f:
+            records = ([json.loads(line) for line in f if line.strip()]
+                       if args.records.endswith(".jsonl") else json.load(f))
+        count = sum(store.add_record(record) for record in records)
+        store.commit()
+        print(f"✅ {count} facts extracted from tables.")
+    if os.path.exists(args.csv):
+        print(f"✅ {store.add_csv(args.csv)} facts loaded from {args.csv}.")
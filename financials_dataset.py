@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import threading
+from typing import Optional
+import numpy as np
+import pandas as pd
+from financial_facts import FINANCIALS_CSV, CONCEPT_NAMES, CONCEPT_QUERY_TERMS, concept_for_label
+from query_analysis import company_key
+from tracing import span
+
+CACHE_DIR = "financials_cache"
+_PERIOD_COLUMN = re.compile(r"^(20\d{2})-(\d{2})-(\d{2})$")
+_TERM_TO_CONCEPT = {term: concept for concept, terms in CONCEPT_QUERY_TERMS.items() for term in terms}
+_COLUMNS = ("company", "concept", "metric", "period", "value")
+
+def csv_signature(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# === 1. Long format: one row per (company, concept, period), sorted, with row positions per series ===
+class FinancialsDataset:
+    def __init__(self, frame: pd.DataFrame, version: str):
+        # frame: company/concept/metric as categoricals, period as datetime64, value as float64
+        self.frame = frame.sort_values(["company", "concept", "period"], kind="stable").reset_index(drop=True)
+        self.frame["year"] = self.frame["period"].dt.year.astype("int16")
+        self.version = version
+        self._company = {company_key(c): c for c in self.frame["company"].cat.categories}
+        self._concept = {c.lower(): c for c in self.frame["concept"].cat.categories}
+        # (company, concept) and (company, metric) -> row positions, so a lookup never scans strings
+        self._periods = self.frame["period"].to_numpy()
+        self._values = self.frame["value"].to_numpy(dtype=np.float64)
+        self._years = self.frame["year"].to_numpy()
+        self._rows = {}
+        periods = self._periods
+        for column in ("concept", "metric"):
+            groups = self.frame.groupby(["company", column], observed=True, sort=False).indices
+            for key, positions in groups.items():
+                # A metric can span several CSV concepts: keep its rows in period order too
+                self._rows.setdefault(key, positions[np.argsort(periods[positions], kind="stable")])
+
+    @classmethod
+    def from_csv(cls, path: str = FINANCIALS_CSV) -> "FinancialsDataset":
+        # all_company_financials.csv: company, concept, one column per period ("2024-03-31")
+        wide = pd.read_csv(path)
+        periods = [c for c in wide.columns if _PERIOD_COLUMN.match(str(c))]
+        long = wide.melt(id_vars=["company", "concept"], value_vars=periods, var_name="period", value_name="value")
+        long["value"] = pd.to_numeric(long["value"], errors="coerce")
+        long = long.dropna(subset=["value"])
+        long["period"] = pd.to_datetime(long["period"], format="%Y-%m-%d")
+        concepts = long["concept"].astype(str)
+        long["metric"] = concepts.map({c: concept_for_label(c) or "" for c in concepts.unique()})
+        for column in ("company", "concept", "metric"):
+            long[column] = long[column].astype(str).astype("category")
+        with open(path, "rb") as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:16]
+        return cls(long[list(_COLUMNS)], version)
+
+    # --- Memory-mapped cache: category codes + values as .npy, categories in meta.json ---
+    def save(self, directory: str, signature: dict):
+        os.makedirs(directory, exist_ok=True)
+        meta = {"version": self.version, "csv": signature, "categories": {}}
+        for column in ("company", "concept", "metric"):
+            np.save(os.path.join(directory, f"{column}.npy"), self.frame[column].cat.codes.to_numpy())
+            meta["categories"][column] = list(self.frame[column].cat.categories)
+        np.save(os.path.join(directory, "period.npy"), self.frame["period"].to_numpy().astype("datetime64[D]"))
+        np.save(os.path.join(directory, "value.npy"), self.frame["value"].to_numpy(dtype=np.float64))
+        # meta.json last: a cache without it is never read
+        tmp_path = os.path.join(directory, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+    @classmethod
+    def load(cls, directory: str) -> "FinancialsDataset":
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        columns = {}
+        for column in ("company", "concept", "metric"):
+            codes = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r")
+            columns[column] = pd.Categorical.from_codes(codes, categories=meta["categories"][column])
+        columns["period"] = pd.to_datetime(np.load(os.path.join(directory, "period.npy"), mmap_mode="r"))
+        columns["value"] = np.load(os.path.join(directory, "value.npy"), mmap_mode="r")
+        return cls(pd.DataFrame(columns), meta["version"])
+
+    # --- Lookups ---
+    def companies(self) -> list:
+        return list(self.frame["company"].cat.categories)
+
+    def concepts(self) -> list:
+        return list(self.frame["concept"].cat.categories)
+
+    def resolve_company(self, name: str):
+        return self._company.get(company_key(name))
+
+    def resolve_concept(self, name: str):
+        # Exact concept name from the CSV, canonical metric ("net_income") or a question term ("profit")
+        name = (name or "").strip()
+        if name.lower() in self._concept:
+            return self._concept[name.lower()]
+        if name in CONCEPT_NAMES:
+            return name
+        return _TERM_TO_CONCEPT.get(name.lower()) or concept_for_label(name)
+
+    def arrays(self, company: str, concept: str, start_year: int = None, end_year: int = None):
+        # (periods, values) as numpy arrays, straight from the precomputed row positions
+        positions = self._rows.get((self.resolve_company(company), self.resolve_concept(concept)))
+        if positions is None:
+            return self._periods[:0], self._values[:0]
+        if start_year is not None or end_year is not None:
+            years = self._years[positions]
+            positions = positions[(years >= (start_year or 0)) & (years <= (end_year or 9999))]
+        periods = self._periods[positions]
+        # Two CSV concepts of the same metric (e.g. two revenue tags): keep one value per period
+        periods, first = np.unique(periods, return_index=True)
+        return periods, self._values[positions[first]]
+
+    def series(self, company: str, concept: str, start_year: int = None, end_year: int = None) -> pd.Series:
+        periods, values = self.arrays(company, concept, start_year, end_year)
+        return pd.Series(values, index=pd.DatetimeIndex(periods, name="period"), name=self.resolve_company(company))
+
+    def compare(self, companies: list, concept: str, start_year: int = None, end_year: int = None) -> pd.DataFrame:
+        return pd.concat([self.series(c, concept, start_year, end_year) for c in companies], axis=1)
+
+    def top_n(self, concept: str, n: int = 5, year: int = None) -> pd.DataFrame:
+        results = []
+        for company in self.companies():
+            periods, values = self.arrays(company, concept, year, year)
+            if len(periods):
+                results.append({"company": company, "period": pd.Timestamp(periods[-1]), "value": values[-1]})
+        frame = pd.DataFrame(results, columns=["company", "period", "value"])
+        return frame.sort_values("value", ascending=False).head(n).reset_index(drop=True)
+
+
+# === 2. Loaded once per process; the cache is rebuilt only when the CSV changes ===
+_dataset = None
+_dataset_signature = None
+_dataset_lock = threading.Lock()
+
+def load_dataset(csv_path: str = FINANCIALS_CSV, cache_dir: str = CACHE_DIR) -> FinancialsDataset:
+    signature = csv_signature(csv_path)
+    meta_path = os.path.join(cache_dir, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("csv") == signature:
+                with span("financials_load", cache_hit=True):
+                    return FinancialsDataset.load(cache_dir)
+    with span("financials_load", cache_hit=False):
+        dataset = FinancialsDataset.from_csv(csv_path)
+        dataset.save(cache_dir, signature)
+    return dataset
+
+def get_dataset(csv_path: str = FINANCIALS_CSV) -> FinancialsDataset:
+    global _dataset, _dataset_signature
+    with _dataset_lock:
+        # One stat() per call picks up a replaced CSV without re-parsing an unchanged one
+        signature = csv_signature(csv_path)
+        if _dataset is None or signature != _dataset_signature:
+            _dataset = load_dataset(csv_path)
+            _dataset_signature = signature
+        return _dataset
+
+
+# === 3. Query tools for the data analysis CodeAgent ===
+def get_series(company: str, concept: str, start_year: Optional[int] = None,
+               end_year: Optional[int] = None) -> pd.DataFrame:
+    """Returns the time series of one financial metric of one company from all_company_financials.csv.
+
+    Args:
+        company: Company name, e.g. "Apple" or "Microsoft".
+        concept: Metric, e.g. "revenue", "net_income", "profit", "total_assets" or a concept name from the CSV.
+        start_year: First year to include (optional).
+        end_year: Last year to include (optional).
+    """
+    series = get_dataset().series(company, concept, start_year, end_year)
+    return series.rename("value").reset_index()
+
+def compare_companies(companies: list, concept: str, start_year: Optional[int] = None,
+                      end_year: Optional[int] = None) -> pd.DataFrame:
+    """Returns one metric for several companies side by side: one row per period, one column per company.
+
+    Args:
+        companies: Company names, e.g. ["Apple", "Microsoft"].
+        concept: Metric, e.g. "revenue", "net_income", "total_liabilities".
+        start_year: First year to include (optional).
+        end_year: Last year to include (optional).
+    """
+    return get_dataset().compare(companies, concept, start_year, end_year)
+
+def top_n_by_concept(concept: str, n: int = 5, year: Optional[int] = None) -> pd.DataFrame:
+    """Ranks the companies by one metric (latest period, or latest period within `year`).
+
+    Args:
+        concept: Metric, e.g. "revenue", "net_income", "cash".
+        n: Number of companies to return.
+        year: Year to rank (optional, default: latest available period).
+    """
+    return get_dataset().top_n(concept, n, year)
+
+def get_dataset_tools() -> list:
+    from smolagents import tool
+    return [tool(fn) for fn in (get_series, compare_companies, top_n_by_concept)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the financials cache from the CSV.")
+    parser.add_argument("--csv", default=FINANCIALS_CSV)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    dataset = FinancialsDataset.from_csv(args.csv)
+    dataset.save(args.cache_dir, csv_signature(args.csv))
+    print(f"✅ {len(dataset.frame)} values ({len(dataset.companies())} companies, {len(dataset.concepts())} concepts) "
+          f"cached in {args.cache_dir} (version {dataset.version}).")
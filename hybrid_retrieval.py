@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, List, Optional
+from pydantic import PrivateAttr
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from query_analysis import analyze_query, relaxed_filters
+from tracing import span
+
+CHROMA_DIR = "chroma_langchain_db"
+BM25_PATH = os.path.join(CHROMA_DIR, "bm25_index.json")
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Best dense relevance (0..1) below which the documents probably do not answer the question:
+# speculative web search and the direct RAG mode's escalation to the agent both use it
+LOW_RETRIEVAL_SCORE = float(os.getenv("LOW_RETRIEVAL_SCORE", "0.35"))
+
+# Numbers keep their separators ("116.61", "1,234") so exact figures stay matchable tokens
+_TOKEN_PATTERN = re.compile(r"\d+(?:[.,]\d+)*%?|[a-zäöüß]+\d*", re.IGNORECASE)
+
+def tokenize(text: str) -> List[str]:
+    return [t.lower().replace(",", "") for t in _TOKEN_PATTERN.findall(text or "")]
+
+def _matches(metadata: dict, where: Optional[dict]) -> bool:
+    # In-process evaluation of the Chroma `where` subset produced by query_analysis
+    if not where:
+        return True
+    if "$and" in where:
+        return all(_matches(metadata, clause) for clause in where["$and"])
+    field, condition = next(iter(where.items()))
+    value = metadata.get(field)
+    if isinstance(condition, dict) and "$in" in condition:
+        return value in condition["$in"]
+    if isinstance(condition, dict) and "$eq" in condition:
+        return value == condition["$eq"]
+    return value == condition
+
+
+# === 1. In-process BM25 inverted index over the same chunks as Chroma ===
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self.lengths = []
+        self.postings = defaultdict(list)  # token -> [(doc_idx, term_frequency)]
+        self.avg_length = 0.0
+
+    @classmethod
+    def build(cls, ids, texts, metadatas, **kwargs):
+        index = cls(**kwargs)
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            doc_idx = len(index.ids)
+            tokens = tokenize(text)
+            index.ids.append(chunk_id)
+            index.texts.append(text)
+            # The extraction record's full "content" is already in texts, don't store it twice
+            index.metadatas.append({k: v for k, v in (metadata or {}).items() if k != "content"})
+            index.lengths.append(len(tokens))
+            for token, tf in Counter(tokens).items():
+                index.postings[token].append((doc_idx, tf))
+        index.avg_length = sum(index.lengths) / len(index.lengths) if index.lengths else 0.0
+        return index
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, **kwargs):
+        data = vectorstore.get(include=["documents", "metadatas"])
+        return cls.build(data["ids"], data["documents"], data["metadatas"], **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 10, where: Optional[dict] = None):
+        # Returns [(Document, score)] sorted by BM25 score
+        n = len(self.ids)
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_idx, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_idx] / (self.avg_length or 1))
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        hits = []
+        for doc_idx, score in ranked:
+            if _matches(self.metadatas[doc_idx], where):
+                doc = Document(page_content=self.texts[doc_idx], metadata=dict(self.metadatas[doc_idx]),
+                               id=self.ids[doc_idx])
+                hits.append((doc, score))
+                if len(hits) >= k:
+                    break
+        return hits
+
+    def save(self, path: str = BM25_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "ids": self.ids, "texts": self.texts,
+                       "metadatas": self.metadatas}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = BM25_PATH):
+        # Postings are rebuilt on load; storing the raw chunks keeps the file simple and small
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls.build(data["ids"], data["texts"], data["metadatas"], k1=data["k1"], b=data["b"])
+
+def load_or_build_bm25(vectorstore, path: str = BM25_PATH) -> BM25Index:
+    if os.path.exists(path):
+        return BM25Index.load(path)
+    index = BM25Index.from_vectorstore(vectorstore)
+    index.save(path)
+    return index
+
+
+# === 2. Reciprocal-rank fusion and optional CPU cross-encoder reranking ===
+def _doc_key(doc: Document):
+    # Chroma and BM25 hits of the same chunk share metadata and text, not necessarily the id
+    meta = doc.metadata
+    return (meta.get("file"), meta.get("page"), meta.get("table_index"), doc.page_content)
+
+def rrf_fuse(result_lists, k: int = 60, limit: Optional[int] = None) -> List[Document]:
+    scores = defaultdict(float)
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = _doc_key(doc)
+            scores[key] += 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked[:limit]]
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL, max_length: int = 512):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+    def rerank(self, query: str, docs: List[Document], top_n: int) -> List[Document]:
+        if not docs:
+            return docs
+        scores = self.model.predict([(query, doc.page_content) for doc in docs])
+        ranked = sorted(zip(docs, scores), key=lambda item: item[1], reverse=True)
+        return [doc for doc, _ in ranked[:top_n]]
+
+def load_reranker(model_name: str = CROSS_ENCODER_MODEL) -> Optional[CrossEncoderReranker]:
+    try:
+        return CrossEncoderReranker(model_name)
+    except ImportError:
+        print("⚠️ sentence-transformers not installed, reranking is disabled.")
+        return None
+
+
+# === 3. Hybrid retriever: dense + BM25 under the same metadata filter, fused, reranked ===
+def dense_search(vectorstore, query: str, k: int, where: Optional[dict] = None) -> List[Document]:
+    # Dense hits carry their relevance in metadata["relevance"], so callers need no second search
+    hits = vectorstore.similarity_search_with_relevance_scores(query, k=k, filter=where)
+    for doc, score in hits:
+        doc.metadata["relevance"] = score
+    return [doc for doc, _ in hits]
+
+def top_relevance(docs: List[Document]) -> Optional[float]:
+    # None when no hit came from the dense search (e.g. BM25 only)
+    scores = [doc.metadata["relevance"] for doc in docs if "relevance" in doc.metadata]
+    return max(scores) if scores else None
+
+class HybridRetriever(BaseRetriever):
+    vectorstore: Any
+    bm25: Any
+    reranker: Any = None
+    fetch_k: int = 20
+    top_n: int = 3
+    min_hits: int = 2
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        dense, sparse = [], []
+        with span("retrieve", retriever="hybrid") as current:
+            for where in relaxed_filters(analyze_query(query)):
+                dense = dense_search(self.vectorstore, query, self.fetch_k, where)
+                sparse = [doc for doc, _ in self.bm25.search(query, k=self.fetch_k, where=where)]
+                if len(dense) + len(sparse) >= self.min_hits:
+                    break
+            current.set(dense_hits=len(dense), sparse_hits=len(sparse))
+        fused = rrf_fuse([dense, sparse], limit=self.fetch_k)
+        if self.reranker is not None:
+            with span("rerank", candidates=len(fused)):
+                return self.reranker.rerank(query, fused, self.top_n)
+        return fused[:self.top_n]
+
+class RecentQueryRetriever(BaseRetriever):
+    # Keeps the hits of the last queries: the speculation check and the RAG path of the same question
+    # share one retrieval instead of searching twice
+    retriever: Any
+    size: int = 128
+    _recent: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        with self._lock:
+            if query in self._recent:
+                self._recent.move_to_end(query)
+                return list(self._recent[query])
+        docs = self.retriever.invoke(query)
+        with self._lock:
+            self._recent[query] = docs
+            while len(self._recent) > self.size:
+                self._recent.popitem(last=False)
+        return list(docs)
@@ -0,0 +1,294 @@
+import os
+import re
+import sys
+import csv
+import json
+import glob
+import time
+import queue
+import atexit
+import argparse
+import threading
+from datetime import datetime
+
+LOG_PATH = os.getenv("INTERACTION_LOG", os.path.join("logs", "interactions.jsonl"))
+MAX_BYTES = 20 * 1024 * 1024
+BACKUP_COUNT = 5
+QUEUE_SIZE = 10000
+BATCH_SIZE = 200
+FLUSH_INTERVAL_SECONDS = 1.0
+
+def make_record(kind: str, question: str, answer: str, source: str, session: str = None, route: str = None,
+                timings: dict = None, qa: str = None, insufficient: bool = None, **extra) -> dict:
+    record = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "kind": kind,  # "chat" (answered question) or "web" (stored web search answer)
+        "session": session,
+        "route": route,
+        "question": question,
+        "answer": answer,
+        "source": source,
+        "timings": timings or {},
+        "qa": qa,
+        # qa_ethics_agent reports problems as "⚠️ ..." lines
+        "qa_warnings": [line for line in (qa or "").splitlines() if line.startswith("⚠️")],
+        "insufficient": insufficient,
+    }
+    record.update(extra)
+    return record
+
+
+# === 1. Background writer: bounded queue, batched appends, size-based rotation ===
+class InteractionLogger:
+    def __init__(self, path: str = LOG_PATH, max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT,
+                 queue_size: int = QUEUE_SIZE, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {"logged": 0, "written": 0, "dropped": 0, "batches": 0, "rotations": 0}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="interaction-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def log(self, record: dict) -> bool:
+        # Never blocks the request path: a full queue drops the record and counts it
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["logged"] += 1
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            try:
+                if records:
+                    self._write(records)
+            except Exception as e:
+                print(f"⚠️ Interaction log write failed: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if len(records) < len(batch):
+                return  # close() sentinel
+
+    def _write(self, records):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(lines) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self.stats["written"] += len(records)
+        self.stats["batches"] += 1
+
+    def _rotate(self):
+        # interactions.jsonl → .1 → .2 ... ; the oldest backup is dropped
+        for index in range(self.backup_count - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self.stats["rotations"] += 1
+
+    def flush(self):
+        if self._thread is not None:
+            self.queue.join()
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+
+_logger = None
+_logger_lock = threading.Lock()
+
+def get_interaction_log(path: str = LOG_PATH) -> InteractionLogger:
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            _logger = InteractionLogger(path)
+        return _logger
+
+
+# === 2. Reading: all log files (oldest first), filters, import of the old text logs ===
+def log_files(path: str = LOG_PATH):
+    # Rotated backups (highest number = oldest) first, the current file last
+    backups = [p for p in glob.glob(f"{path}.*") if p.rsplit(".", 1)[1].isdigit()]
+    backups.sort(key=lambda p: int(p.rsplit(".", 1)[1]), reverse=True)
+    return backups + ([path] if os.path.exists(path) else [])
+
+def read_records(path: str = LOG_PATH):
+    for file_path in log_files(path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def filter_records(records, route=None, source=None, session=None, since=None, insufficient=None):
+    for record in records:
+        if route and record.get("route") != route:
+            continue
+        if source and source.lower() not in (record.get("source") or "").lower():
+            continue
+        if session and record.get("session") != session:
+            continue
+        if since and (record.get("ts") or "") < since:
+            continue
+        if insufficient is not None and record.get("insufficient") != insufficient:
+            continue
+        yield record
+
+def _timestamp(text: str) -> str:
+    return datetime.strptime(text.strip(), "%Y-%m-%d %H:%M:%S").isoformat(timespec="seconds")
+
+def parse_chat_log(path: str = "chat_log.txt", counts: dict = None):
+    # Blocks of "⏰ <ts>\n[<✅|❗> ]Question: ...\nAnswer: ...\nSource: ...\n[Timings: ...]\n-----";
+    # older entries have no flag. Blocks that match neither shape are counted in counts["unmatched"].
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    for block in re.split(r"\n-{20,}\n", text):
+        match = re.search(r"⏰ (?P<ts>[\d\- :]+)\n(?:(?P<flag>\S+) )?Question: (?P<question>.*?)\nAnswer: (?P<answer>.*?)"
+                          r"\nSource: (?P<source>.*?)(?:\nTimings: (?P<timings>.*))?\s*$", block, re.DOTALL)
+        if not match:
+            if block.strip() and counts is not None:
+                counts["unmatched"] = counts.get("unmatched", 0) + 1
+            continue
+        timings = dict(re.findall(r"(\w+)=([\d.]+)s", match.group("timings") or ""))
+        route = re.search(r"route=(.+?) ttft=", match.group("timings") or "")
+        yield make_record("chat", match.group("question").strip(), match.group("answer").strip(),
+                          match.group("source").strip(), session="imported", route=route.group(1) if route else None,
+                          timings={k: float(v) for k, v in timings.items()},
+                          insufficient=match.group("flag") == "❗" if match.group("flag") else None, ts=_timestamp(match.group("ts")),
+                          imported_from=os.path.basename(path))
+
+def parse_answers_log(path: str = "answers_and_sources.txt", counts: dict = None):
+    # Blocks of "Timestamp: ...\nQuestion: ...\nAnswer: ...\nSource: ...\n\n-----"
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    for block in re.split(r"\n-{20,}\n", text):
+        match = re.search(r"Timestamp: (?P<ts>[\d\- :]+)\nQuestion: (?P<question>.*?)\nAnswer: (?P<answer>.*?)"
+                          r"\nSource: ?(?P<source>.*?)\s*$", block, re.DOTALL)
+        if not match:
+            if block.strip() and counts is not None:
+                counts["unmatched"] = counts.get("unmatched", 0) + 1
+            continue
+        yield make_record("web", match.group("question").strip(), match.group("answer").strip(),
+                          match.group("source").strip(), session="imported", route="Web-Agent",
+                          ts=_timestamp(match.group("ts")), imported_from=os.path.basename(path))
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else None
+
+def summarize(records) -> str:
+    records = list(records)
+    chats = [r for r in records if r.get("kind") == "chat"]
+    lines = [f"📒 {len(records)} records ({len(chats)} chat answers)"]
+    by_route = {}
+    for record in chats:
+        by_route.setdefault(record.get("route") or "unknown", []).append(record)
+    for route, items in sorted(by_route.items(), key=lambda item: -len(item[1])):
+        totals = [r["timings"]["total"] for r in items if "total" in (r.get("timings") or {})]
+        ttfts = [r["timings"]["ttft"] for r in items if (r.get("timings") or {}).get("ttft") is not None]
+        web = sum(1 for r in items if "web" in (r.get("source") or "").lower() or (r.get("source") or "").startswith("http"))
+        insufficient = sum(1 for r in items if r.get("insufficient"))
+        line = f"  {route:<22} {len(items):5d}  web fallback {web / len(items):5.1%}  insufficient {insufficient / len(items):5.1%}"
+        if totals:
+            line += f"  total p50 {percentile(totals, 0.5):.2f}s p95 {percentile(totals, 0.95):.2f}s"
+        if ttfts:
+            line += f"  ttft p50 {percentile(ttfts, 0.5):.2f}s"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# === 3. CLI: import / query / stats / export ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Structured interaction log")
+    parser.add_argument("--log", default=LOG_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="Import the old chat_log.txt / answers_and_sources.txt")
+    importer.add_argument("--chat-log", default="chat_log.txt")
+    importer.add_argument("--answers", default="answers_and_sources.txt")
+
+    for name in ("query", "stats", "export"):
+        command = commands.add_parser(name)
+        command.add_argument("--route")
+        command.add_argument("--source", help="Substring of the source")
+        command.add_argument("--session")
+        command.add_argument("--since", help="ISO timestamp, e.g. 2025-05-23")
+        command.add_argument("--insufficient", action="store_true", default=None)
+        if name == "query":
+            command.add_argument("--limit", type=int, default=20)
+        if name == "export":
+            command.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+            command.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        logger = InteractionLogger(args.log)
+        # Re-running the import only adds blocks that are not in the log yet
+        seen = {(r.get("ts"), r.get("question")) for r in read_records(args.log)}
+        count = 0
+        for path, parse in ((args.chat_log, parse_chat_log), (args.answers, parse_answers_log)):
+            if os.path.exists(path):
+                counts = {"unmatched": 0}
+                parsed = list(parse(path, counts))
+                records = [r for r in parsed if (r["ts"], r["question"]) not in seen]
+                seen.update((r["ts"], r["question"]) for r in records)
+                if records:
+                    logger._write(records)
+                count += len(records)
+                print(f"📥 {path}: {len(records)} records, {len(parsed) - len(records)} already imported, "
+                      f"{counts['unmatched']} unreadable blocks")
+        print(f"✅ Imported {count} records into {args.log}")
+        return
+
+    records = filter_records(read_records(args.log), route=args.route, source=args.source,
+                             session=args.session, since=args.since, insufficient=args.insufficient)
+    if args.command == "stats":
+        print(summarize(records))
+    elif args.command == "query":
+        for record in list(records)[-args.limit:]:
+            print(f"{record['ts']}  [{record.get('route') or '-'}] {record['question']}\n"
+                  f"    → {record['source']}  {record.get('timings') or ''}")
+    else:
+        records = list(records)
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            if args.format == "jsonl":
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                writer = csv.writer(f)
+                writer.writerow(["ts", "kind", "session", "route", "source", "insufficient", "ttft", "total",
+                                 "question", "answer", "qa_warnings"])
+                for r in records:
+                    timings = r.get("timings") or {}
+                    writer.writerow([r.get("ts"), r.get("kind"), r.get("session"), r.get("route"), r.get("source"),
+                                     r.get("insufficient"), timings.get("ttft"), timings.get("total"),
+                                     r.get("question"), r.get("answer"), " | ".join(r.get("qa_warnings") or [])])
+        print(f"✅ Exported {len(records)} records to {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_core.callbacks import BaseCallbackHandler
+from tracing import tracing_callback, debug
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+DEFAULT_TEMPERATURE = 0.7
+# Process-wide Gemini quota (requests and tokens per minute)
+REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_RPM", "60"))
+TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TPM", "1000000"))
+# Callers of call_with_backoff; every name needs an AGENT_CONCURRENCY entry
+RAG_AGENT = "rag_agent"
+DIRECT_RAG = "direct_rag"
+RESEARCH_AGENT = "research_agent"
+DATA_ANALYSIS_AGENT = "data_analysis_agent"
+GENERAL_CHAT = "general_chat"
+SUPERVISOR = "supervisor"
+MEMORY = "memory"
+# Concurrent runs per agent, so one busy route cannot take the whole quota
+AGENT_CONCURRENCY = {RAG_AGENT: 8, DIRECT_RAG: 8, RESEARCH_AGENT: 4, DATA_ANALYSIS_AGENT: 2, GENERAL_CHAT: 8,
+                     SUPERVISOR: 4, MEMORY: 2}
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Exception class names of the Google, LiteLLM/OpenAI and httpx clients for quota, 5xx and timeouts
+RATE_LIMIT_ERRORS = {"ResourceExhausted", "TooManyRequests", "RateLimitError"}
+RETRYABLE_ERRORS = RATE_LIMIT_ERRORS | {"InternalServerError", "BadGateway", "ServiceUnavailable", "GatewayTimeout",
+                                        "DeadlineExceeded", "APITimeoutError", "TimeoutException"}
+
+def status_code(error: Exception):
+    # google.api_core: .code (HTTPStatus); LiteLLM/OpenAI: .status_code; httpx: .response.status_code
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int):
+            return int(value)
+    return None
+
+def _matches_error(error: Exception, statuses: set, names: set) -> bool:
+    # Whichever client library raised it; wrapped errors are checked via their cause
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if status_code(error) in statuses or any(cls.__name__ in names for cls in type(error).__mro__):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+def is_retryable(error: Exception) -> bool:
+    # 429 (quota), 5xx errors and timeouts
+    return _matches_error(error, RETRYABLE_STATUS, RETRYABLE_ERRORS)
+
+def is_rate_limited(error: Exception) -> bool:
+    # Only an exhausted quota pauses every session; a 5xx or timeout is retried by its caller alone
+    return _matches_error(error, {429}, RATE_LIMIT_ERRORS)
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE_SECONDS, cap: float = BACKOFF_MAX_SECONDS) -> float:
+    # Exponential backoff with full jitter, so retrying sessions do not hit the API in lockstep
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# === 1. Token buckets: requests/min and tokens/min, shared by every client in the process ===
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount: float = 1.0) -> float:
+        # Takes `amount` and returns 0, or returns the seconds to wait before it is available
+        with self._lock:
+            self._refill()
+            if self.level >= amount:
+                self.level -= amount
+                return 0.0
+            return (amount - self.level) / self.rate
+
+    def debit(self, amount: float):
+        # Actual usage is only known afterwards; the level may go negative and delays later calls
+        with self._lock:
+            self._refill()
+            self.level -= amount
+
+class SharedRateLimiter(BaseRateLimiter):
+    def __init__(self, requests_per_minute: int = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = TOKENS_PER_MINUTE, check_every: float = 0.1):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.check_every = check_every
+        self.cooldown = 0.0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "tokens": 0, "rate_limited": 0, "waited_seconds": 0.0}
+
+    def _wait_time(self) -> float:
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            return pause
+        # A request may start once the token budget is not overdrawn
+        token_wait = self.tokens.try_take(0)
+        if token_wait > 0:
+            return token_wait
+        return self.requests.try_take(1)
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        started = time.monotonic()
+        while True:
+            wait = self._wait_time()
+            if wait <= 0:
+                break
+            if not blocking:
+                return False
+            time.sleep(min(wait, 1.0))
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["waited_seconds"] += time.monotonic() - started
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        started = time.monotonic()
+        while True:
+            wait = self._wait_time()
+            if wait <= 0:
+                break
+            if not blocking:
+                return False
+            await asyncio.sleep(min(wait, 1.0))
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["waited_seconds"] += time.monotonic() - started
+        return True
+
+    def record_usage(self, tokens: int):
+        self.tokens.debit(tokens)
+        with self._lock:
+            self.stats["tokens"] += tokens
+            # Successful calls shrink the adaptive cooldown again
+            self.cooldown = self.cooldown / 2 if self.cooldown > 0.5 else 0.0
+
+    def record_rate_limited(self):
+        # Every session backs off together instead of all hammering an exhausted quota
+        with self._lock:
+            self.stats["rate_limited"] += 1
+            self.cooldown = min(max(self.cooldown * 2, 1.0), BACKOFF_MAX_SECONDS)
+            self.paused_until = max(self.paused_until, time.monotonic() + self.cooldown)
+
+def response_tokens(response) -> int:
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    tokens = usage.get("total_tokens")
+    if tokens is None:
+        tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                tokens += metadata.get("total_tokens", 0)
+    return tokens
+
+class UsageCallback(BaseCallbackHandler):
+    def __init__(self, limiter: SharedRateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response, **kwargs):
+        # Rate-limit errors are recorded by call_with_backoff, which also sees non-LangChain clients
+        self.limiter.record_usage(response_tokens(response))
+
+rate_limiter = SharedRateLimiter()
+
+
+# === 2. Shared clients: one per (model, temperature), reusing its HTTP/gRPC connections ===
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_chat_model(model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE):
+    key = (model, temperature)
+    with _clients_lock:
+        if key not in _clients:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            _clients[key] = ChatGoogleGenerativeAI(
+                model=model,
+                temperature=temperature,
+                rate_limiter=rate_limiter,
+                callbacks=[UsageCallback(rate_limiter), tracing_callback],
+                max_retries=1,  # retries are done by call_with_backoff, with jitter
+            )
+        return _clients[key]
+
+
+# === 3. Per-agent concurrency caps and jittered retries around agent runs ===
+_slots = {}
+_slots_lock = threading.Lock()
+
+@contextmanager
+def agent_slot(agent: str):
+    with _slots_lock:
+        if agent not in _slots:
+            if agent not in AGENT_CONCURRENCY:
+                raise ValueError(f"Unknown agent {agent!r}: add it to llm_pool.AGENT_CONCURRENCY")
+            _slots[agent] = threading.BoundedSemaphore(AGENT_CONCURRENCY[agent])
+        slot = _slots[agent]
+    with slot:
+        yield
+
+def call_with_backoff(agent: str, fn, *args, max_retries: int = MAX_RETRIES, **kwargs):
+    for attempt in range(max_retries + 1):
+        try:
+            with agent_slot(agent):
+                return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            if is_rate_limited(e):
+                rate_limiter.record_rate_limited()
+            delay = backoff_delay(attempt)
+            debug(f"[LLM] {agent}: {type(e).__name__}, retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+# === 4. Per-question accounting: passed in the run config, nested chains and tool calls report to it too ===
+class CallCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response, **kwargs):
+        tokens = response_tokens(response)
+        with self._lock:
+            self.calls += 1
+            self.tokens += tokens
+
+    def on_llm_error(self, error, **kwargs):
+        # A failed round trip still costs latency and quota
+        with self._lock:
+            self.calls += 1
+
+class CallStats:
+    def __init__(self, title: str):
+        self.title = title
+        self.modes = {}  # mode -> [questions, calls, tokens]
+        self._lock = threading.Lock()
+
+    def record(self, mode: str, counter: CallCounter):
+        with self._lock:
+            entry = self.modes.setdefault(mode, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += counter.calls
+            entry[2] += counter.tokens
+
+    def format_stats(self) -> str:
+        with self._lock:
+            parts = [f"{mode} {calls / n:.1f} calls, {tokens / n:.0f} tokens (n={n})"
+                     for mode, (n, calls, tokens) in sorted(self.modes.items())]
+        return f"🔁 {self.title} per question: {'; '.join(parts) or '-'}"
+
+rag_call_stats = CallStats("RAG LLM calls")
@@ -0,0 +1,183 @@
+import os
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ONNX_DIR = "onnx_models"
+# Longer inputs are truncated; mpnet was trained with 384, queries rarely need more than 128
+ONNX_MAX_LENGTH = int(os.getenv("ONNX_MAX_LENGTH", "384"))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0: onnxruntime picks (one per physical core)
+# Concurrent queries are encoded together: up to ONNX_MAX_BATCH, waiting at most ONNX_BATCH_WAIT_MS for more
+ONNX_MAX_BATCH = int(os.getenv("ONNX_MAX_BATCH", "16"))
+ONNX_BATCH_WAIT_MS = float(os.getenv("ONNX_BATCH_WAIT_MS", "0"))
+DOCUMENT_BATCH_SIZE = 32
+MODEL_FILE = "model.onnx"
+QUANTIZED_FILE = "model_int8.onnx"
+
+def model_dir_for(model_name: str, onnx_dir: str = ONNX_DIR) -> str:
+    return os.path.join(onnx_dir, model_name.replace("/", "__"))
+
+
+# === 1. Export (needs optimum + torch, once): ONNX graph, dynamic int8 weights, fast tokenizer ===
+def export_model(model_name: str, onnx_dir: str = ONNX_DIR, quantize: bool = True) -> str:
+    try:
+        from optimum.exporters.onnx import main_export
+    except ImportError as e:
+        raise ImportError("Exporting to ONNX needs `pip install optimum[onnxruntime]` (serving does not).") from e
+    directory = model_dir_for(model_name, onnx_dir)
+    # Writes model.onnx plus tokenizer.json, so serving needs neither torch nor transformers
+    main_export(model_name, output=directory, task="feature-extraction")
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        # Weights to int8 ahead of time, activations quantized per batch at run time
+        quantize_dynamic(os.path.join(directory, MODEL_FILE), os.path.join(directory, QUANTIZED_FILE),
+                         weight_type=QuantType.QInt8)
+    return directory
+
+def load_or_export(model_name: str, onnx_dir: str = ONNX_DIR, quantized: bool = True) -> str:
+    directory = model_dir_for(model_name, onnx_dir)
+    if not os.path.exists(os.path.join(directory, QUANTIZED_FILE if quantized else MODEL_FILE)):
+        export_model(model_name, onnx_dir, quantize=quantized)
+    return directory
+
+
+# === 2. Micro-batching: queries of concurrent sessions share one forward pass ===
+class MicroBatcher:
+    def __init__(self, encode_fn, max_batch: int = ONNX_MAX_BATCH, max_wait_ms: float = ONNX_BATCH_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "batches": 0, "largest_batch": 0}
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="onnx-batcher", daemon=True)
+                self._thread.start()
+        self._queue.put((text, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        # Everything that queued up during the previous pass joins; max_wait > 0 also waits for stragglers
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                vectors = self.encode_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+            with self._lock:
+                self.stats["queries"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+
+
+# === 3. Encoder: tokenizers + onnxruntime, mean pooling and L2 normalization like sentence-transformers ===
+def mean_pool(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+class OnnxEmbeddings(Embeddings):
+    def __init__(self, model_dir: str, max_length: int = ONNX_MAX_LENGTH, quantized: bool = True,
+                 threads: int = ONNX_THREADS, batch_size: int = DOCUMENT_BATCH_SIZE,
+                 max_batch: int = ONNX_MAX_BATCH, max_wait_ms: float = ONNX_BATCH_WAIT_MS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        self.model_dir = model_dir
+        self.max_length = max_length
+        self.batch_size = batch_size
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, QUANTIZED_FILE if quantized else MODEL_FILE), options,
+            providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        pad_token = (self.tokenizer.padding or {}).get("pad_token") or next(
+            (t for t in ("<pad>", "[PAD]") if self.tokenizer.token_to_id(t) is not None), "<pad>")
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+        self._batcher = MicroBatcher(self._encode_batch, max_batch, max_wait_ms)
+
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._inputs:
+            feed["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, {name: value for name, value in feed.items() if name in self._inputs})[0]
+        return mean_pool(hidden, attention_mask)
+
+    def encode(self, texts: list) -> np.ndarray:
+        # Similar lengths per batch, so short chunks are not padded to the longest one
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            batch = self._encode_batch([texts[i] for i in rows])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[rows] = batch
+        return vectors
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self._batcher.submit(text).result().tolist()
+
+    def format_stats(self) -> str:
+        s = self._batcher.stats
+        per_batch = s["queries"] / s["batches"] if s["batches"] else 0.0
+        return (f"⚡ ONNX encoder: {s['queries']} queries in {s['batches']} batches "
+                f"(avg {per_batch:.1f}, max {s['largest_batch']}), max_length {self.max_length}")
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+def get_onnx_embeddings(model_name: str, max_length: int = ONNX_MAX_LENGTH) -> OnnxEmbeddings:
+    with _encoders_lock:
+        if (model_name, max_length) not in _encoders:
+            _encoders[(model_name, max_length)] = OnnxEmbeddings(load_or_export(model_name), max_length)
+        return _encoders[(model_name, max_length)]
+
+
+if __name__ == "__main__":
+    from embedding_cache import EMBEDDING_MODEL
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX with int8 weights.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--out", default=ONNX_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    directory = export_model(args.model, args.out, quantize=not args.no_quantize)
+    sizes = {name: os.path.getsize(os.path.join(directory, name)) / 2**20
+             for name in (MODEL_FILE, QUANTIZED_FILE) if os.path.exists(os.path.join(directory, name))}
+    print(f"✅ {args.model} exported to {directory}: "
+          + ", ".join(f"{name} {size:.0f} MB" for name, size in sizes.items()))
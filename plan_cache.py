@@ -0,0 +1,302 @@
+import io
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import tokenize
+import threading
+from financial_facts import CONCEPT_QUERY_TERMS, CONCEPT_NAMES
+from query_analysis import COMPANY_ALIASES
+from tracing import span, annotate
+
+PLAN_CACHE_DB = os.getenv("PLAN_CACHE_DB", "plan_cache.db")
+# Generated code with other large literals copied numbers from a printout: not reusable
+MAX_PLAIN_NUMBER = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    template TEXT,
+    fixed TEXT,
+    code TEXT,
+    question TEXT,
+    agent_seconds REAL,
+    created REAL,
+    hits INTEGER DEFAULT 0,
+    seconds_saved REAL DEFAULT 0,
+    PRIMARY KEY (template, fixed)
+);
+"""
+
+_ALIAS_TO_KEY = {alias: key for key, aliases in COMPANY_ALIASES.items() for alias in aliases}
+_TERM_TO_CONCEPT = {term: concept for concept, terms in CONCEPT_QUERY_TERMS.items() for term in terms}
+
+def _alternation(words):
+    return "|".join(sorted(map(re.escape, words), key=len, reverse=True))
+
+_COMPANY = re.compile(r"\b(" + _alternation(_ALIAS_TO_KEY) + r")(?:'s|s)?\b")
+_CONCEPT = re.compile(r"\b(" + _alternation(_TERM_TO_CONCEPT) + r")\b")
+_YEAR = re.compile(r"(?<!\d)(20\d{2})(?!\d)")
+_MARKER = re.compile(r"⟦(company|concept|year):(\d+)(?::(\w+))?⟧")
+
+
+# === 1. Request → template + parameters ("compare liabilities of {company_0} and {company_1} in {year_0}") ===
+def normalize_request(question: str):
+    params = {"companies": [], "concepts": [], "terms": [], "years": []}
+
+    def slot(kind, value, extra=None):
+        values = params[kind]
+        if value not in values:
+            values.append(value)
+            if extra is not None:
+                params["terms"].append(extra)
+        return values.index(value)
+
+    text = " ".join(question.lower().split()).strip(" ?!.")
+    text = _COMPANY.sub(lambda m: f"{{company_{slot('companies', _ALIAS_TO_KEY[m.group(1)])}}}", text)
+    text = _CONCEPT.sub(lambda m: f"{{concept_{slot('concepts', _TERM_TO_CONCEPT[m.group(1)], m.group(1))}}}", text)
+    text = _YEAR.sub(lambda m: f"{{year_{slot('years', int(m.group(1)))}}}", text)
+    return text, params
+
+
+# === 2. Generated code → code template: parameter literals become markers ===
+def _style(text: str) -> str:
+    return "lower" if text.islower() else "upper" if text.isupper() else "name"
+
+def _company_names(key: str, display: str = None):
+    return set(COMPANY_ALIASES.get(key, [key])) | ({display.lower()} if display else set())
+
+def _string_replacements(literal: str, params: dict, displays: dict) -> str:
+    for index, key in enumerate(params["companies"]):
+        pattern = re.compile(r"\b(" + _alternation(_company_names(key, displays.get(key))) + r")\b", re.IGNORECASE)
+        literal = pattern.sub(lambda m: f"⟦company:{index}:{_style(m.group(1))}⟧", literal)
+    for index, concept in enumerate(params["concepts"]):
+        words = {concept, CONCEPT_NAMES.get(concept, concept), params["terms"][index]}
+        pattern = re.compile(r"\b(" + _alternation(words) + r")\b", re.IGNORECASE)
+        literal = pattern.sub(lambda m: f"⟦concept:{index}:{'key' if m.group(1) == concept else 'term'}⟧", literal)
+    for index, year in enumerate(params["years"]):
+        literal = re.sub(rf"(?<!\d){year}(?!\d)", f"⟦year:{index}⟧", literal)
+    return literal
+
+def parameterize(code: str, params: dict, displays: dict = None):
+    """Returns (code template, used slots), or (None, None) when the code is not reusable."""
+    displays = displays or {}
+    lines = code.splitlines(keepends=True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    edits = []
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        start = offsets[token.start[0] - 1] + token.start[1]
+        end = offsets[token.end[0] - 1] + token.end[1]
+        if token.type == tokenize.STRING:
+            replaced = _string_replacements(token.string, params, displays)
+            if replaced != token.string:
+                edits.append((start, end, replaced))
+        elif token.type == tokenize.NUMBER:
+            try:
+                value = float(token.string)
+            except ValueError:
+                continue
+            if value in params["years"]:
+                edits.append((start, end, f"⟦year:{params['years'].index(int(value))}⟧"))
+            elif abs(value) >= MAX_PLAIN_NUMBER:
+                return None, None
+    for start, end, replacement in reversed(edits):
+        code = code[:start] + replacement + code[end:]
+    used = {(kind, int(index)) for kind, index, _ in _MARKER.findall(code)}
+    return code, used
+
+def render(template: str, params: dict, displays: dict = None) -> str:
+    displays = displays or {}
+
+    def value(match):
+        kind, index, style = match.group(1), int(match.group(2)), match.group(3)
+        if kind == "year":
+            return str(params["years"][index])
+        if kind == "concept":
+            return params["concepts"][index] if style == "key" else params["terms"][index]
+        key = params["companies"][index]
+        name = displays.get(key) or key.capitalize()
+        return name.lower() if style == "lower" else name.upper() if style == "upper" else name
+
+    return _MARKER.sub(value, template)
+
+def fixed_params(params: dict, used: set) -> dict:
+    # Parameters the code does not mention were baked in: the plan only fits requests with the same values
+    kinds = {"company": "companies", "concept": "concepts", "year": "years"}
+    return {f"{kind}_{i}": params[name][i] for kind, name in kinds.items()
+            for i in range(len(params[name])) if (kind, i) not in used}
+
+
+# === 3. Plan cache: SQLite-backed, replays stored code in a fresh LocalPythonExecutor ===
+class PlanCache:
+    def __init__(self, path: str = PLAN_CACHE_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "hits": 0, "misses": 0, "fallbacks": 0, "stored": 0,
+                      "not_reusable": 0, "seconds_saved": 0.0}
+
+    def _count(self, name: str, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _displays(self, params: dict) -> dict:
+        from financials_dataset import get_dataset
+        dataset = get_dataset()
+        return {key: dataset.resolve_company(key) for key in params["companies"]}
+
+    # --- Schema checks: the parameters must exist in the dataset, the result must be a real answer ---
+    def valid_params(self, params: dict) -> bool:
+        from financials_dataset import get_dataset
+        dataset = get_dataset()
+        if any(dataset.resolve_company(c) is None for c in params["companies"]):
+            return False
+        years = dataset.frame["year"]
+        if params["years"] and not all(years.min() <= y <= years.max() for y in params["years"]):
+            return False
+        for concept in params["concepts"]:
+            for company in params["companies"]:
+                if not len(dataset.arrays(company, concept)[0]):
+                    return False
+        return True
+
+    @staticmethod
+    def valid_output(output, params: dict, stored_question: str) -> bool:
+        if output is None or (isinstance(output, str) and not output.strip()):
+            return False
+        if hasattr(output, "empty") and output.empty:
+            return False
+        # A company of the stored request that is not in this one must not show up in the answer
+        _, stored = normalize_request(stored_question)
+        stale = [c for c in stored["companies"] if c not in params["companies"]]
+        text = str(output).lower()
+        return not any(alias in text for c in stale for alias in COMPANY_ALIASES.get(c, [c]))
+
+    def lookup(self, template: str, params: dict):
+        with self._lock:
+            rows = self.conn.execute("SELECT fixed, code, question, agent_seconds FROM plans WHERE template = ?",
+                                     (template,)).fetchall()
+        for fixed, code, question, agent_seconds in rows:
+            fixed = json.loads(fixed)
+            if fixed == fixed_params(params, _used_slots(code)):
+                return code, fixed, question, agent_seconds
+        return None
+
+    def replay(self, agent, code_template: str, params: dict):
+        from smolagents import LocalPythonExecutor
+        executor = LocalPythonExecutor(additional_authorized_imports=list(agent.additional_authorized_imports))
+        executor.send_tools({**agent.tools})
+        executor.send_variables({})
+        result = executor(render(code_template, params, self._displays(params)))
+        if not result.is_final_answer:
+            raise ValueError("Stored plan did not reach final_answer()")
+        return result.output
+
+    def store(self, question: str, template: str, params: dict, code: str, agent_seconds: float, agent) -> bool:
+        code_template, used = parameterize(code, params, self._displays(params))
+        if code_template is None or not self.valid_params(params):
+            self._count("not_reusable")
+            return False
+        # Validated by replaying the template with the original parameters before it is kept
+        try:
+            output = self.replay(agent, code_template, params)
+        except Exception:
+            self._count("not_reusable")
+            return False
+        if not self.valid_output(output, params, question):
+            self._count("not_reusable")
+            return False
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO plans (template, fixed, code, question, agent_seconds, created)"
+                              " VALUES (?,?,?,?,?,?)",
+                              (template, json.dumps(fixed_params(params, used)), code_template, question,
+                               agent_seconds, time.time()))
+            self.conn.commit()
+        self._count("stored")
+        return True
+
+    def run(self, agent, question: str, run_fn=None):
+        """Answers `question` from a stored plan, or runs the agent (run_fn) and learns its plan."""
+        run_fn = run_fn or agent.run
+        template, params = normalize_request(question)
+        self._count("requests")
+        with span("plan_cache") as current:
+            hit = self.lookup(template, params) if params["companies"] else None
+            if hit is not None:
+                code, _, stored_question, agent_seconds = hit
+                started = time.perf_counter()
+                try:
+                    output = self.replay(agent, code, params) if self.valid_params(params) else None
+                except Exception:
+                    output = None  # the agent gets the request instead
+                if output is not None and self.valid_output(output, params, stored_question):
+                    saved = max(agent_seconds - (time.perf_counter() - started), 0.0)
+                    self._count("hits")
+                    self._count("seconds_saved", saved)
+                    with self._lock:
+                        self.conn.execute("UPDATE plans SET hits = hits + 1, seconds_saved = seconds_saved + ?"
+                                          " WHERE template = ? AND code = ?", (saved, template, code))
+                        self.conn.commit()
+                    current.set(cache_hit=True, template=template)
+                    return output
+                self._count("fallbacks")
+            current.set(cache_hit=False, template=template)
+
+        self._count("misses")
+        started = time.perf_counter()
+        output = run_fn(question)
+        elapsed = time.perf_counter() - started
+        code = successful_code(agent)
+        if code and params["companies"]:
+            with span("plan_store"):
+                try:
+                    stored = self.store(question, template, params, code, elapsed, agent)
+                except Exception:
+                    stored = False  # e.g. no financials CSV: nothing to validate against
+                annotate(stored=stored)
+        return output
+
+    def format_stats(self) -> str:
+        s = self.stats
+        rate = s["hits"] / s["requests"] if s["requests"] else 0.0
+        return (f"🧩 Plan cache: {s['requests']} analysis requests, {s['hits']} replayed ({rate:.0%}), "
+                f"{s['fallbacks']} fell back to the agent, {s['stored']} plans stored, "
+                f"{s['not_reusable']} not reusable, {s['seconds_saved']:.1f}s saved")
+
+def _used_slots(code_template: str) -> set:
+    return {(kind, int(index)) for kind, index, _ in _MARKER.findall(code_template)}
+
+def successful_code(agent) -> str:
+    # The code of the last run's error-free steps, in order; None unless it ended with final_answer()
+    from smolagents.memory import ActionStep
+    steps = [s for s in agent.memory.steps if isinstance(s, ActionStep) and s.code_action and s.error is None]
+    if not steps or not steps[-1].is_final_answer:
+        return None
+    return "\n".join(step.code_action for step in steps)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_plan_cache(path: str = PLAN_CACHE_DB) -> PlanCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PlanCache(path)
+        return _cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the analysis plan cache.")
+    parser.add_argument("--db", default=PLAN_CACHE_DB)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    rows = conn.execute("SELECT template, fixed, hits, seconds_saved, agent_seconds FROM plans "
+                        "ORDER BY hits DESC").fetchall()
+    for template, fixed, hits, saved, agent_seconds in rows:
+        print(f"{hits:5d} hits  {saved:8.1f}s saved  (agent {agent_seconds:5.1f}s)  {template}  fixed={fixed}")
+    print(f"{len(rows)} plans, {sum(r[2] for r in rows)} replays, {sum(r[3] for r in rows):.1f}s saved in total")
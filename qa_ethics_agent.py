@@ -1,4 +1,5 @@
-python
+from tracing import span
+
 # === Dummy base class for compatibility with Agent concept (if no real LangChain agent is used) ===
 class Agent:
     def __init__(self, name=None, instructions=None):
@@ -31,7 +32,9 @@ class QA_EthicsAgent(Agent):
         )
 
     def run(self, answer, sources):
-        warnings = check_facts_and_ethics(answer, sources)
+        with span("qa") as current:
+            warnings = check_facts_and_ethics(answer, sources)
+            current.set(warnings=len(warnings))
         if warnings:
             return "\n".join(warnings)  # Return collected warnings as string
         return "✅ Answer passes the QA/ethics check."  # Confirmation for clean answer
@@ -0,0 +1,93 @@
+import re
+
+# Canonical company key (as stored in the chunk metadata) -> names used in questions
+COMPANY_ALIASES = {
+    "apple": ["apple", "aapl"],
+    "google": ["google", "alphabet", "googl", "goog"],
+    "meta": ["meta", "facebook", "meta platforms"],
+    "microsoft": ["microsoft", "msft"],
+    "nvidia": ["nvidia", "nvda"],
+    "amazon": ["amazon", "amzn"],
+}
+
+# Questions about figures are answered from tables, questions about statements from text pages
+TABLE_TERMS = [
+    "revenue", "revenues", "sales", "profit", "income", "earnings", "eps", "margin", "cash",
+    "assets", "liabilities", "equity", "expenses", "cost", "costs", "debt", "dividend",
+    "how much", "table", "figures", "numbers", "umsatz", "gewinn", "einnahmen", "ausgaben",
+    "kosten", "bilanz", "verbindlichkeiten",
+]
+TEXT_TERMS = [
+    "why", "explain", "strategy", "outlook", "risk", "risks", "said", "ceo", "cfo", "guidance",
+    "describe", "summary", "summarize", "warum", "strategie", "ausblick", "erkläre",
+]
+
+_COMPANY_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted({re.escape(a) for aliases in COMPANY_ALIASES.values() for a in aliases},
+                             key=len, reverse=True)) + r")(?:'s|s)?\b",
+    re.IGNORECASE,
+)
+_ALIAS_TO_KEY = {alias: key for key, aliases in COMPANY_ALIASES.items() for alias in aliases}
+_YEAR_PATTERN = re.compile(r"\b(20\d{2})\b")
+# File names like "NVDA_10K_2023.pdf": underscores are word characters, so no \b here
+_FILENAME_YEAR_PATTERN = re.compile(r"(?<!\d)(20\d{2})(?!\d)")
+_TABLE_PATTERN = re.compile(r"\b(" + "|".join(map(re.escape, TABLE_TERMS)) + r")\b", re.IGNORECASE)
+_TEXT_PATTERN = re.compile(r"\b(" + "|".join(map(re.escape, TEXT_TERMS)) + r")\b", re.IGNORECASE)
+
+def company_key(name: str) -> str:
+    key = re.sub(r"[^a-z0-9]", "", (name or "").lower())
+    return _ALIAS_TO_KEY.get(key, key)
+
+def year_from_filename(filename: str):
+    years = _FILENAME_YEAR_PATTERN.findall(filename or "")
+    return int(years[0]) if years else None
+
+def enrich_metadata(record: dict) -> dict:
+    # Filterable fields derived from the extraction record (Chroma metadata cannot hold None)
+    metadata = dict(record)
+    metadata["company_key"] = company_key(record.get("company", ""))
+    year = year_from_filename(record.get("file", ""))
+    if year:
+        metadata["year"] = year
+    return metadata
+
+def analyze_query(question: str) -> dict:
+    companies = []
+    for match in _COMPANY_PATTERN.finditer(question):
+        key = _ALIAS_TO_KEY[match.group(1).lower()]
+        if key not in companies:
+            companies.append(key)
+    years = sorted({int(y) for y in _YEAR_PATTERN.findall(question)})
+    is_table = bool(_TABLE_PATTERN.search(question))
+    is_text = bool(_TEXT_PATTERN.search(question))
+    doc_type = "table" if is_table and not is_text else "text" if is_text and not is_table else None
+    return {"companies": companies, "years": years, "doc_type": doc_type}
+
+def _where(clauses):
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def relaxed_filters(analysis: dict):
+    # Chroma `where` filters from the strictest to unfiltered (None)
+    company_clause = None
+    if analysis["companies"]:
+        company_clause = {"company_key": {"$in": analysis["companies"]}}
+    year_clause = None
+    if analysis["years"]:
+        # Reports for a fiscal year are often published (and named) in the following year
+        years = sorted({y for year in analysis["years"] for y in (year, year + 1)})
+        year_clause = {"year": {"$in": years}}
+    type_clause = {"type": analysis["doc_type"]} if analysis["doc_type"] else None
+
+    seen = []
+    for clauses in (
+        [company_clause, year_clause, type_clause],
+        [company_clause, year_clause],
+        [company_clause],
+        [],
+    ):
+        where = _where([c for c in clauses if c])
+        if where not in seen:
+            seen.append(where)
+            yield where
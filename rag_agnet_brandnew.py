@@ -1,16 +1,57 @@
-python
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.chains import RetrievalQA
 from langchain.agents import Tool, AgentExecutor, create_react_agent
 from langchain_core.prompts import ChatPromptTemplate
-from typing import Optional
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from typing import Any, List, Optional
+from embedding_cache import get_embeddings, EMBEDDING_BACKEND
+from llm_pool import get_chat_model, call_with_backoff, DIRECT_RAG
+from query_analysis import analyze_query, relaxed_filters
+from hybrid_retrieval import (HybridRetriever, LOW_RETRIEVAL_SCORE, dense_search, top_relevance,
+                              load_or_build_bm25, load_reranker)
+from tracing import span, debug, DEBUG
+import os
+import re
+import threading
+
+# Chunks handed to the "stuff" prompt; filtering by company/year keeps this small
+RETRIEVAL_K = 5
+# Fewer filtered hits than this → relax the filter (finally: unfiltered search)
+MIN_FILTERED_HITS = 2
+# Optional CPU cross-encoder after BM25 + dense fusion (set RAG_RERANKER=1)
+USE_RERANKER = os.getenv("RAG_RERANKER", "0") == "1"
+RERANK_TOP_N = 3
+# VECTOR_BACKEND=mmap: in-process memory-mapped index exported from the Chroma DB (vector_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Prompt of the general_chat tool (also used when the app streams small talk directly)
+GENERAL_CHAT_PROMPT = "Answer naturally to: {question}"
+# Direct RAG: one grounded generation over the retrieved chunks, cited as [1], [2], ...
+NOT_FOUND_ANSWER = "Not available in the documents."
+DIRECT_PROMPT = """Answer the question using only the numbered report excerpts below.
+Cite the excerpts you used as [1], [2], ... right after the figures or statements they support.
+If the excerpts do not contain the answer, reply exactly: {not_found}
+
+Conversation so far:
+{history}
+
+Excerpts:
+{context}
+
+Question: {question}
+Answer:"""
+_CITATION = re.compile(r"\[(\d+)\]")
 
 # === 1. Load existing vector database (e.g., Chroma with HuggingFace Embeddings) ===
-def load_existing_vectorstore():
-    # Use HuggingFace embedding model for semantic text representation
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
+def load_existing_vectorstore(backend: str = VECTOR_BACKEND, embedding_backend: str = EMBEDDING_BACKEND):
+    # HuggingFace embedding model behind a persistent cache (repeated questions are not re-embedded);
+    # EMBEDDING_BACKEND=onnx encodes queries with the int8 ONNX export instead of torch
+    embeddings = get_embeddings(backend=embedding_backend)
+    if backend == "mmap":
+        # Same chunks, filters and retriever interface without the Chroma client (re-exported when Chroma changes)
+        from vector_index import load_or_export
+        return load_or_export(embeddings)
+    from langchain_chroma import Chroma
     # Load existing Chroma database with embeddings
     return Chroma(
         collection_name="example_collection",
@@ -18,10 +59,38 @@ def load_existing_vectorstore():
         persist_directory="./chroma_langchain_db"
     )
 
+# === 1b. Retriever that filters on company/year/type extracted from the question ===
+class MetadataFilteredRetriever(BaseRetriever):
+    vectorstore: Any
+    k: int = RETRIEVAL_K
+    min_hits: int = MIN_FILTERED_HITS
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        docs = []
+        with span("retrieve", retriever="dense") as current:
+            for where in relaxed_filters(analyze_query(query)):
+                docs = dense_search(self.vectorstore, query, self.k, where)
+                if len(docs) >= self.min_hits:
+                    break
+            current.set(hits=len(docs))
+        return docs
+
 # === 2. Prepare tools: document search and general chat ===
-def setup_tools(vectorstore: Optional[Chroma] = None):
-    # Initialize LLM (Google Gemini) for tool logic
-    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+def build_retriever(vectorstore, hybrid: bool = True, use_reranker: bool = USE_RERANKER):
+    if not hybrid:
+        return MetadataFilteredRetriever(vectorstore=vectorstore)
+    # BM25 catches exact tokens ("116.61", "Q3 2023") that the dense mpnet search misses
+    reranker = load_reranker() if use_reranker else None
+    return HybridRetriever(
+        vectorstore=vectorstore,
+        bm25=load_or_build_bm25(vectorstore),
+        reranker=reranker,
+        top_n=RERANK_TOP_N if reranker else RETRIEVAL_K,
+    )
+
+def setup_tools(vectorstore: Optional[VectorStore] = None, llm=None, retriever=None):
+    # Shared, rate-limited LLM client (Google Gemini) for tool logic, unless one is injected
+    llm = llm or get_chat_model()
 
     tools = []  # List of all available tools for the agent
 
@@ -30,14 +99,15 @@ def setup_tools(vectorstore: Optional[Chroma] = None):
         qa_chain = RetrievalQA.from_chain_type(
             llm=llm,
             chain_type="stuff",
-            retriever=vectorstore.as_retriever(search_kwargs={"k": 10}),
-            verbose=True
+            retriever=retriever or build_retriever(vectorstore),
+            verbose=DEBUG
         )
 
-        # Wrapper function to output QA results with debug output
+        # Wrapper function to output QA results with debug output (AGENT_DEBUG=0 silences it)
         def debug_qa_chain(query):
-            result = qa_chain.run(query)
-            print("[DEBUG] RetrievalQA result:", result)
+            with span("document_search"):
+                result = qa_chain.run(query)
+            debug("[DEBUG] RetrievalQA result:", result)
             return result
 
         # Add tool for document search
@@ -56,7 +126,7 @@ def setup_tools(vectorstore: Optional[Chroma] = None):
     tools.append(
         Tool(
             name="general_chat",
-            func=lambda q: llm.invoke(f"Answer naturally to: {q}").content,
+            func=lambda q: llm.invoke(GENERAL_CHAT_PROMPT.format(question=q)).content,
             description="For small talk or questions without document reference."
         )
     )
@@ -64,7 +134,7 @@ def setup_tools(vectorstore: Optional[Chroma] = None):
     return tools
 
 # === 3. Define ReAct agent that intelligently uses tools and is controlled by prompt ===
-def create_agent(tools: list):
+def create_agent(tools: list, llm=None):
     # Prompt with instructions on when to use which tool
     prompt = ChatPromptTemplate.from_template("""
 You are a ReAct agent for corporate data. Strictly follow these rules:
@@ -100,8 +170,8 @@ Final Answer: <Answer>
 {agent_scratchpad}
 """)
 
-    # Initialize LLM again for the agent itself
-    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+    # Same shared client for the agent itself
+    llm = llm or get_chat_model()
 
     # Create the ReAct agent based on prompt and tools
     agent = create_react_agent(llm=llm, tools=tools, prompt=prompt)
@@ -110,8 +180,66 @@ Final Answer: <Answer>
     executor = AgentExecutor(
         agent=agent,
         tools=tools,
-        verbose=True,  # Output intermediate steps
+        verbose=DEBUG,  # Output intermediate steps (AGENT_DEBUG=0 in production)
         handle_parsing_errors=True  # Tolerance for parsing problems
     )
     executor.name = "rag_agent"
     return executor
+
+# === 4. Direct RAG: retrieve once, one grounded LLM call; the ReAct agent only when that is not good enough ===
+def format_context(docs: List[Document]) -> str:
+    blocks = []
+    for number, doc in enumerate(docs, 1):
+        meta = doc.metadata
+        blocks.append(f"[{number}] {meta.get('company', '')}, {meta.get('file', '?')}, p. {meta.get('page', '?')}\n"
+                      f"{doc.page_content}")
+    return "\n\n".join(blocks)
+
+def cite_sources(answer: str, docs: List[Document]) -> str:
+    cited = sorted({int(n) for n in _CITATION.findall(answer) if 0 < int(n) <= len(docs)})
+    if not cited:
+        return answer
+    sources = [f"[{n}] {docs[n - 1].metadata.get('file', '?')}, p. {docs[n - 1].metadata.get('page', '?')}"
+               for n in cited]
+    return f"{answer}\n\nSources: " + "; ".join(sources)
+
+class DirectRAG:
+    def __init__(self, vectorstore, llm=None, retriever=None, min_relevance: Optional[float] = LOW_RETRIEVAL_SCORE):
+        self.vectorstore = vectorstore
+        self.llm = llm or get_chat_model()
+        self.retriever = retriever or build_retriever(vectorstore)
+        # None: no relevance check (e.g. fake embeddings without meaningful scores)
+        self.min_relevance = min_relevance
+        self.stats = {"questions": 0, "direct": 0, "low_relevance": 0, "insufficient": 0}
+        self._lock = threading.Lock()
+
+    def answer(self, question: str, history: str = "", validate=None, escalate=None, config=None):
+        """Returns (answer, escalated). `validate(answer)` is False for answers that need the agent,
+        `escalate(question, history)` runs it; without `escalate` the direct answer is always returned."""
+        with span("rag_direct") as current:
+            docs = self.retriever.invoke(question, config=config)
+            # Relevance of the retriever's own (filtered) dense hits, 0..1
+            score = top_relevance(docs) if self.min_relevance is not None else None
+            low = not docs or (score is not None and score < self.min_relevance)
+            answer_text = None
+            if not low or escalate is None:
+                prompt = DIRECT_PROMPT.format(not_found=NOT_FOUND_ANSWER, history=history or "-",
+                                              context=format_context(docs), question=question)
+                answer_text = call_with_backoff(DIRECT_RAG, self.llm.invoke, prompt, config=config).content
+            reason = "low_relevance" if low else None
+            # Citation markers are digits too: they must not pass the "answer contains a figure" check
+            if reason is None and validate is not None and not validate(_CITATION.sub("", answer_text)):
+                reason = "insufficient"
+            current.set(chunks=len(docs), relevance=score, escalated=reason or "")
+        with self._lock:
+            self.stats["questions"] += 1
+            self.stats[reason if reason and escalate is not None else "direct"] += 1
+        if reason is None or escalate is None:
+            return cite_sources(answer_text, docs), False
+        debug(f"[Direct RAG] {reason} → ReAct agent")
+        return escalate(question, history), True
+
+    def format_stats(self) -> str:
+        s = self.stats
+        return (f"🎯 Direct RAG: {s['questions']} questions, {s['direct']} answered in one call, escalated: "
+                f"{s['low_relevance']} low relevance, {s['insufficient']} insufficient answers")
@@ -0,0 +1,245 @@
+import os
+import re
+import threading
+import numpy as np
+from query_analysis import COMPANY_ALIASES
+from tracing import span
+
+# Routes the router can decide on its own; anything else goes to the LangGraph supervisor (one LLM call)
+ROUTES = ("general_chat", "data_analysis", "web", "rag")
+FALLBACK_ROUTE = "supervisor"
+MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.55"))
+# Keyword decisions at least this sure skip the embedding step
+KEYWORD_CONFIDENCE = 0.8
+# ROUTER_EMBEDDINGS=0: keywords only (no encoder needed, unmatched questions go to the supervisor)
+USE_EMBEDDINGS = os.getenv("ROUTER_EMBEDDINGS", "1") == "1"
+SOFTMAX_TEMPERATURE = 0.05
+KEYWORD_PRIOR = 0.3
+
+# English and German terms per signal, matched as whole words ("hi" does not match "this" or "history")
+TERMS = {
+    "greeting": [
+        "hello", "hi", "hey", "greetings", "good morning", "good evening", "how are you", "how's it going",
+        "what's up", "all right", "thanks", "thank you", "who are you", "what can you do",
+        "what are you doing", "hallo", "servus", "moin", "guten morgen", "guten tag", "guten abend",
+        "wie geht's", "wie geht es dir", "danke", "wer bist du", "was kannst du",
+    ],
+    # Figure or analysis cues only: "show" with a metric and year is a lookup (facts store, RAG)
+    "chart": [
+        "plot", "chart", "diagram", "graph", "draw", "visualize", "visualise", "analyze", "analyse",
+        "analysis", "statistics", "correlation", "trend", "trends", "time series", "over time", "csv", "excel",
+        "analysiere", "diagramm", "visualisiere", "statistik", "datenanalyse", "korrelation", "zeitreihe",
+        "zeichne", "verlauf", "entwicklung",
+    ],
+    "finance": [
+        "revenue", "revenues", "sales", "profit", "income", "earnings", "eps", "margin", "cash", "assets",
+        "liabilities", "equity", "expenses", "costs", "debt", "dividend", "capital",
+        "umsatz", "umsätze", "gewinn", "einnahmen", "ausgaben", "kosten", "kapital", "verbindlichkeit",
+        "verbindlichkeiten", "bilanz", "eigenkapital", "aktien",
+    ],
+    "documents": [
+        "annual report", "10-k", "10k", "report", "filing", "strategy", "outlook", "risk", "risks",
+        "guidance", "ceo", "cfo", "geschäftsbericht", "bericht", "strategie", "ausblick", "risiken",
+    ],
+    "current": [
+        "current", "currently", "today", "latest", "now", "recent", "recently", "this year", "news",
+        "stock price", "share price", "market cap", "aktuell", "aktuelle", "aktuellen", "heute",
+        "derzeit", "neueste", "neuesten", "aktienkurs", "nachrichten",
+    ],
+    # An analysis cue only across several companies or years, see keyword_signals
+    "compare": ["compare", "comparison", "vs", "versus", "vergleich", "vergleiche", "vergleichen"],
+    "company": sorted({alias for aliases in COMPANY_ALIASES.values() for alias in aliases}),
+}
+_ALIAS_TO_COMPANY = {alias: key for key, aliases in COMPANY_ALIASES.items() for alias in aliases}
+_YEAR = re.compile(r"\b(?:19|20)\d{2}\b")
+
+def _group(terms):
+    return "|".join(sorted(map(re.escape, terms), key=len, reverse=True))
+
+# One pass over the question: every alternative is a named group, the longest term wins
+_PATTERN = re.compile(
+    r"\b(?:" + "|".join(f"(?P<{name}>{_group(terms)})" for name, terms in TERMS.items()) + r")\b",
+    re.IGNORECASE,
+)
+
+_YEAR_SPAN = re.compile(
+    r"\b(?:(?:last|past|previous)\s+(?:\d+|two|three|four|five|six|seven|eight|nine|ten|few)\s+years|"
+    r"over the (?:last |past )?years|letzten\s+(?:\d+|zwei|drei|vier|fünf|paar)\s+jahren?)\b",
+    re.IGNORECASE,
+)
+
+# Example questions per route; their mean embedding is the route's prototype vector
+PROTOTYPES = {
+    "general_chat": [
+        "hello", "hi, how are you?", "thanks for your help", "who are you and what can you do?",
+        "good morning!", "guten morgen", "danke dir", "wie geht es dir?",
+    ],
+    "data_analysis": [
+        "plot the revenue of Apple over the last years", "compare the liabilities of Apple and Microsoft in 2024",
+        "create a chart of NVIDIA's net income", "show a trend of Google's cash over time",
+        "visualisiere den Umsatz von Meta", "analysiere die Kosten von Amazon als Zeitreihe",
+    ],
+    "web": [
+        "what is Apple's current stock price?", "latest news about NVIDIA",
+        "what did Microsoft announce today?", "who is the CEO of Meta right now?",
+        "wie ist der aktuelle Aktienkurs von Amazon?", "neueste Nachrichten zu Google",
+    ],
+    "rag": [
+        "what was Apple's revenue in 2022?", "how much net income did Microsoft report in 2023?",
+        "what does the annual report say about risks?", "explain NVIDIA's strategy according to the 10-K",
+        "wie hoch war der Umsatz von Amazon 2021?", "what are Alphabet's total assets?",
+        "show me Apple's revenue", "show Microsoft's net income in 2023",
+    ],
+}
+
+class RouteDecision:
+    def __init__(self, route: str, confidence: float, method: str, scores: dict = None):
+        self.route = route
+        self.confidence = confidence
+        self.method = method  # "keywords", "embedding" or "fallback"
+        self.scores = scores or {}
+
+    @property
+    def skips_supervisor(self) -> bool:
+        return self.route != FALLBACK_ROUTE
+
+    def __repr__(self):
+        return f"RouteDecision({self.route!r}, confidence={self.confidence:.2f}, method={self.method!r})"
+
+
+# === 1. Keywords: one compiled regex, evidence per signal, scores per route ===
+def keyword_signals(question: str) -> dict:
+    signals = dict.fromkeys(TERMS, 0)
+    companies = set()
+    for match in _PATTERN.finditer(question):
+        signals[match.lastgroup] += 1
+        if match.lastgroup == "company":
+            companies.add(_ALIAS_TO_COMPANY[match.group().lower()])
+    # "compare Apple and Microsoft liabilities" / "2024 vs 2023" is an analysis; one company and year a lookup
+    if signals["compare"] and signals["finance"] and (len(companies) > 1 or len(set(_YEAR.findall(question))) > 1):
+        signals["chart"] += 1
+    # "for the last 3 years" asks for a series, which is a chart cue as well
+    signals["chart"] += len(_YEAR_SPAN.findall(question))
+    return signals
+
+def keyword_scores(question: str, signals: dict = None) -> dict:
+    signals = signals if signals is not None else keyword_signals(question)
+    topical = signals["finance"] or signals["company"] or signals["documents"]
+    scores = dict.fromkeys(ROUTES, 0.0)
+    if signals["greeting"] and not (topical or signals["chart"] or signals["current"]):
+        # "hi" alone is smalltalk, a long message that starts with "hi" maybe not
+        scores["general_chat"] = 0.95 if len(question.split()) <= 8 else 0.6
+    if signals["chart"]:
+        scores["data_analysis"] = 0.9 if (signals["finance"] or signals["company"]) else 0.5
+    if signals["current"]:
+        scores["web"] = 0.85 if topical else 0.5
+    if topical and not signals["chart"] and not signals["current"]:
+        scores["rag"] = 0.85
+    return scores
+
+def keyword_route(question: str) -> RouteDecision:
+    scores = keyword_scores(question)
+    route = max(scores, key=scores.get)
+    if scores[route] == 0.0:
+        return RouteDecision(FALLBACK_ROUTE, 0.0, "keywords", scores)
+    return RouteDecision(route, scores[route], "keywords", scores)
+
+def is_smalltalk(question: str) -> bool:
+    return keyword_route(question).route == "general_chat"
+
+# Requests for a figure: never answered by a text lookup, even when they name one metric and year
+_CHART_REQUEST = re.compile(r"\b(plot\w*|chart\w*|diagram\w*|graph\w*|draw\w*|visuali[sz]\w*|zeichne\w*)\b",
+                            re.IGNORECASE)
+
+def asks_for_chart(question: str) -> bool:
+    return bool(_CHART_REQUEST.search(question))
+
+def is_data_analysis_request(user_input: str) -> bool:
+    decision = keyword_route(user_input)
+    return decision.route == "data_analysis" and decision.confidence >= KEYWORD_CONFIDENCE
+
+
+# === 2. Router: keywords first, the local encoder only for questions they do not settle ===
+class IntentRouter:
+    def __init__(self, embeddings=None, prototypes: dict = PROTOTYPES, min_confidence: float = MIN_CONFIDENCE,
+                 use_embeddings: bool = USE_EMBEDDINGS):
+        self.embeddings = embeddings  # None: the shared mpnet encoder from embedding_cache, on first use
+        self.prototypes = prototypes
+        self.min_confidence = min_confidence
+        self.use_embeddings = use_embeddings
+        self._routes = None
+        self._matrix = None  # one unit prototype vector per route
+        self._lock = threading.Lock()
+        self.stats = {"questions": 0, "keywords": 0, "embedding": 0, "fallback": 0}
+
+    def _encoder(self):
+        if self.embeddings is None:
+            from embedding_cache import get_embeddings
+            self.embeddings = get_embeddings()
+        return self.embeddings
+
+    def prototype_matrix(self):
+        # Built once; the example embeddings themselves also land in the on-disk embedding cache
+        with self._lock:
+            if self._matrix is None:
+                routes, rows = [], []
+                for route, examples in self.prototypes.items():
+                    vectors = np.asarray(self._encoder().embed_documents(examples), dtype=np.float32)
+                    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+                    centroid = vectors.mean(axis=0)
+                    routes.append(route)
+                    rows.append(centroid / (np.linalg.norm(centroid) + 1e-12))
+                self._routes, self._matrix = routes, np.vstack(rows)
+            return self._routes, self._matrix
+
+    def embedding_scores(self, question: str, prior: dict = None) -> dict:
+        routes, matrix = self.prototype_matrix()
+        vector = np.asarray(self._encoder().embed_query(question), dtype=np.float32)
+        similarities = matrix @ (vector / (np.linalg.norm(vector) + 1e-12))
+        weights = np.exp((similarities - similarities.max()) / SOFTMAX_TEMPERATURE)
+        probabilities = weights / weights.sum()
+        scores = dict(zip(routes, probabilities.tolist()))
+        # Weak keyword hints (e.g. "chart" without a metric) tilt the decision
+        for route, score in (prior or {}).items():
+            if route in scores:
+                scores[route] = (scores[route] + KEYWORD_PRIOR * score) / (1 + KEYWORD_PRIOR)
+        return scores
+
+    def route(self, question: str) -> RouteDecision:
+        with span("route") as current:
+            decision = self._decide(question)
+            current.set(route=decision.route, confidence=round(decision.confidence, 3), method=decision.method)
+        with self._lock:
+            self.stats["questions"] += 1
+            self.stats[decision.method] += 1
+        return decision
+
+    def _decide(self, question: str) -> RouteDecision:
+        decision = keyword_route(question)
+        if decision.confidence >= KEYWORD_CONFIDENCE:
+            return decision
+        if self.use_embeddings:
+            try:
+                scores = self.embedding_scores(question, prior=decision.scores)
+            except Exception:
+                scores = None  # encoder unavailable: only the keyword hint is left
+            if scores:
+                route = max(scores, key=scores.get)
+                if scores[route] >= self.min_confidence:
+                    return RouteDecision(route, scores[route], "embedding", scores)
+                return RouteDecision(FALLBACK_ROUTE, scores[route], "fallback", scores)
+        if decision.route != FALLBACK_ROUTE and decision.confidence >= self.min_confidence:
+            return decision
+        return RouteDecision(FALLBACK_ROUTE, decision.confidence, "fallback", decision.scores)
+
+    def format_stats(self) -> str:
+        s = self.stats
+        skipped = s["keywords"] + s["embedding"]
+        share = skipped / s["questions"] if s["questions"] else 0.0
+        return (f"🔀 Router: {s['questions']} questions, {s['keywords']} by keywords, {s['embedding']} by embedding, "
+                f"{s['fallback']} to the supervisor ({share:.0%} without the supervisor LLM call)")
+
+router = IntentRouter()
+
+def route_question(question: str) -> RouteDecision:
+    return router.route(question)
@@ -0,0 +1,236 @@
+import os
+import re
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import Future
+from answer_cache import normalize_question, WEB_TTL_SECONDS
+from query_analysis import analyze_query
+from tracing import span, annotate
+
+SEARCH_CACHE_DB = "web_search_cache.db"
+MAX_RESULTS = 3
+# Related cached queries answer a follow-up when this share of its terms appears in a result
+RELATED_MIN_OVERLAP = 0.8
+RELATED_SCAN_LIMIT = 20
+# WEB_SEARCH_BACKEND=stub runs without network access (benchmarks, offline development)
+SEARCH_BACKEND = os.getenv("WEB_SEARCH_BACKEND", "tavily")
+STUB_LATENCY_SECONDS = float(os.getenv("WEB_SEARCH_STUB_LATENCY", "0.8"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    key TEXT PRIMARY KEY,
+    query TEXT,
+    results TEXT,
+    created REAL,
+    entities TEXT,
+    result_terms TEXT
+);
+CREATE INDEX IF NOT EXISTS searches_entities ON searches (entities, created);
+"""
+
+_STOPWORDS = {
+    "the", "and", "what", "was", "were", "how", "much", "did", "does", "for", "with", "about", "der", "die",
+    "das", "und", "wie", "was", "hoch", "war", "ist", "von", "im", "in", "of", "is", "a", "an", "to",
+}
+
+def normalize_query(query: str) -> str:
+    return normalize_question(query)
+
+def query_key(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+def query_terms(text: str) -> set:
+    return {t for t in re.findall(r"[a-zäöüß0-9]+", (text or "").lower()) if len(t) > 2 and t not in _STOPWORDS}
+
+def entity_key(query: str):
+    # "apple|2023": companies and years of the query; None when it names no company
+    analysis = analyze_query(query)
+    if not analysis["companies"]:
+        return None
+    return "|".join(sorted(analysis["companies"]) + sorted(map(str, analysis["years"])))
+
+def result_terms(result: dict) -> list:
+    return sorted(query_terms(f"{result.get('title', '')} {result.get('content', '')}"))
+
+
+# === 1. Backends: the real Tavily client (one instance) and an offline stub ===
+class TavilyBackend:
+    name = "tavily"
+
+    def __init__(self, max_results: int = MAX_RESULTS):
+        from langchain_tavily import TavilySearch
+        self.client = TavilySearch(max_results=max_results)
+
+    def search(self, query: str) -> list:
+        with span("tavily"):
+            response = self.client.invoke(query)
+        return list(response.get("results") or []) if isinstance(response, dict) else []
+
+class StubBackend:
+    """Deterministic fake results after a configurable delay, for offline runs and benchmarks."""
+    name = "stub"
+
+    def __init__(self, latency: float = STUB_LATENCY_SECONDS, jitter: float = 0.0, max_results: int = MAX_RESULTS):
+        self.latency = latency
+        self.jitter = jitter
+        self.max_results = max_results
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def search(self, query: str) -> list:
+        with self._lock:
+            self.calls += 1
+        time.sleep(max(self.latency + random.uniform(-self.jitter, self.jitter), 0))
+        digest = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()[:8]
+        return [
+            {
+                "title": f"Stub result {rank + 1} for '{query}'",
+                "url": f"https://stub.local/{digest}/{rank + 1}",
+                "content": f"Stub content {rank + 1} about {query}.",
+                "score": round(1.0 - rank * 0.1, 2),
+            }
+            for rank in range(self.max_results)
+        ]
+
+
+# === 2. Persistent TTL cache, keyed by the normalized query ===
+class SearchCache:
+    def __init__(self, path: str = SEARCH_CACHE_DB, ttl: int = WEB_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(searches)")}
+        if columns and "entities" not in columns:
+            # Entries live for WEB_TTL_SECONDS only: a cache file of the old layout is simply started anew
+            self.conn.execute("DROP TABLE searches")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def get(self, query: str):
+        with self._lock:
+            row = self.conn.execute("SELECT results, created FROM searches WHERE key = ?",
+                                    (query_key(query),)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, query: str, results: list):
+        # Terms are tokenized once here, not on every related() lookup
+        terms = [result_terms(result) for result in results]
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO searches VALUES (?,?,?,?,?,?)",
+                              (query_key(query), normalize_query(query), json.dumps(results), time.time(),
+                               entity_key(query), json.dumps(terms)))
+            self.conn.commit()
+
+    def with_entities(self, entities: str, limit: int = RELATED_SCAN_LIMIT):
+        # Unexpired entries about the same companies and years, newest first: [(results, result terms)]
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT results, result_terms FROM searches WHERE entities = ? AND created >= ? "
+                "ORDER BY created DESC LIMIT ?", (entities, time.time() - self.ttl, limit)).fetchall()
+        return [(json.loads(results), json.loads(terms)) for results, terms in rows]
+
+    def purge(self) -> int:
+        with self._lock:
+            deleted = self.conn.execute("DELETE FROM searches WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            self.conn.commit()
+        return deleted
+
+
+# === 3. Search layer: cache → related cached results → single-flight backend request ===
+class WebSearch:
+    def __init__(self, backend, cache: SearchCache = None, related_min_overlap: float = RELATED_MIN_OVERLAP):
+        self.backend = backend
+        self.cache = cache
+        self.related_min_overlap = related_min_overlap
+        self._inflight = {}  # query key -> Future of the one running backend request
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "hits": 0, "related_hits": 0, "coalesced": 0, "backend_calls": 0,
+                      "backend_seconds": 0.0}
+
+    def _count(self, name: str, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def related(self, query: str):
+        # "Apple net income 2023" is often covered by results fetched for "Apple revenue 2023".
+        # Only searches about the same companies and years are candidates (an indexed lookup)
+        terms = query_terms(query)
+        entities = entity_key(query)
+        if len(terms) < 2 or entities is None or self.cache is None:
+            return None
+        numbers = {t for t in terms if t.isdigit()}
+        best, best_overlap = None, 0.0
+        for results, terms_per_result in self.cache.with_entities(entities):
+            for result, found in zip(results, terms_per_result):
+                found = set(found)
+                # Years and figures must match exactly, like in the answer cache
+                if not numbers <= found:
+                    continue
+                overlap = len(terms & found) / len(terms)
+                if overlap > best_overlap:
+                    best, best_overlap = result, overlap
+        if best is None or best_overlap < self.related_min_overlap:
+            return None
+        return [best]
+
+    def search(self, query: str) -> list:
+        """Returns all results for the query (list of dicts with content and url)."""
+        self._count("queries")
+        cached = self.cache.get(query) if self.cache else None
+        if cached is not None:
+            self._count("hits")
+            annotate(cache_hit=True, web_cache="hit")
+            return cached
+        related = self.related(query)
+        if related is not None:
+            self._count("related_hits")
+            annotate(cache_hit=True, web_cache="related")
+            return related
+
+        key = query_key(query)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            # The same query is already being fetched by another session: wait for its result
+            annotate(cache_hit=True, web_cache="coalesced")
+            return future.result()
+        annotate(cache_hit=False, web_cache="miss")
+
+        try:
+            started = time.perf_counter()
+            results = self.backend.search(query)
+            self._count("backend_calls")
+            self._count("backend_seconds", time.perf_counter() - started)
+            if self.cache is not None and results:
+                self.cache.put(query, results)
+            future.set_result(results)
+            return results
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def format_stats(self) -> str:
+        s = self.stats
+        served = s["hits"] + s["related_hits"] + s["coalesced"]
+        rate = served / s["queries"] if s["queries"] else 0.0
+        return (f"🔎 Web search: {s['queries']} queries, {s['hits']} cache hits, {s['related_hits']} related hits, "
+                f"{s['coalesced']} coalesced, {s['backend_calls']} backend calls "
+                f"({s['backend_seconds']:.1f}s), {rate:.0%} served without a request")
+
+def build_web_search(backend: str = SEARCH_BACKEND, cache_path: str = SEARCH_CACHE_DB):
+    search_backend = StubBackend() if backend == "stub" else TavilyBackend()
+    return WebSearch(search_backend, SearchCache(cache_path))
@@ -0,0 +1,108 @@
+import re
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from tracing import debug
+from hybrid_retrieval import LOW_RETRIEVAL_SCORE
+
+# Questions about "now" are likely to need the web even if the documents are searched first
+CURRENT_KEYWORDS = re.compile(
+    r"\b(current|currently|today|latest|now|recent|recently|this year|aktuell\w*|heute|derzeit|neueste\w*)\b",
+    re.IGNORECASE,
+)
+# Speculation doubles the LLM/API cost of a question, so it is budgeted
+MAX_SPECULATION_RATIO = 0.3
+MAX_SPECULATIONS_PER_MINUTE = 10
+RATIO_WINDOW = 100
+
+executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="speculative")
+
+
+# === 1. When to speculate ===
+def should_speculate(question: str, recent_year: bool = False, score_fn=None) -> bool:
+    if recent_year or CURRENT_KEYWORDS.search(question):
+        return True
+    if score_fn is not None:
+        # Only pay for the extra retrieval when the cheap signals are negative
+        score = score_fn(question)
+        return score is not None and score < LOW_RETRIEVAL_SCORE
+    return False
+
+class SpeculationBudget:
+    # At most max_ratio of the last `window` questions and max_per_minute runs per minute
+    def __init__(self, max_ratio: float = MAX_SPECULATION_RATIO,
+                 max_per_minute: int = MAX_SPECULATIONS_PER_MINUTE, window: int = RATIO_WINDOW):
+        self.max_ratio = max_ratio
+        self.max_per_minute = max_per_minute
+        self.decisions = deque(maxlen=window)
+        self.recent = deque()
+        self._lock = threading.Lock()
+        self.stats = {"questions": 0, "wanted": 0, "speculated": 0}
+
+    def _prune(self, now: float):
+        while self.recent and now - self.recent[0] > 60:
+            self.recent.popleft()
+
+    def has_room(self) -> bool:
+        # Whether a speculative run could be allowed now; lets callers skip the costlier checks
+        with self._lock:
+            self._prune(time.time())
+            return (len(self.recent) < self.max_per_minute
+                    and sum(self.decisions) < self.max_ratio * max(len(self.decisions) + 1, 1))
+
+    def allow(self, wanted: bool) -> bool:
+        now = time.time()
+        with self._lock:
+            self.stats["questions"] += 1
+            self._prune(now)
+            allowed = (
+                wanted
+                and len(self.recent) < self.max_per_minute
+                and sum(self.decisions) < self.max_ratio * max(len(self.decisions) + 1, 1)
+            )
+            self.decisions.append(allowed)
+            if wanted:
+                self.stats["wanted"] += 1
+            if allowed:
+                self.stats["speculated"] += 1
+                self.recent.append(now)
+            return allowed
+
+
+# === 2. Run both paths, the first acceptable answer wins ===
+def run_speculative(candidates: dict, accept, timeout: float = None):
+    """Runs every candidate (name -> callable returning (answer, source)) at once.
+    Returns (answer, source, winner); when nothing is acceptable, the first finished result."""
+    # Each candidate runs in the caller's context, so its spans nest under the current request
+    futures = {executor.submit(contextvars.copy_context().run, fn): name for name, fn in candidates.items()}
+    pending = set(futures)
+    deadline = time.monotonic() + timeout if timeout else None
+    fallback = None
+
+    while pending:
+        remaining = max(deadline - time.monotonic(), 0) if deadline else None
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            try:
+                answer, source = future.result()
+            except Exception as e:
+                debug(f"[Speculative] {futures[future]} failed: {e}")
+                continue
+            if accept(answer):
+                # Not-yet-started losers are cancelled; a running one finishes in the background
+                # and its result is discarded
+                for loser in pending:
+                    loser.cancel()
+                return answer, source, futures[future]
+            if fallback is None:
+                fallback = (answer, source, futures[future])
+
+    for loser in pending:
+        loser.cancel()
+    if fallback is None:
+        raise TimeoutError("No speculative candidate produced an answer.")
+    return fallback
@@ -0,0 +1,109 @@
+import time
+import asyncio
+from tracing import activate
+
+# The ReAct agent writes its reasoning first; only what follows this marker is meant for the user
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+
+# === 1. Token filter: pass through only the final answer of each LLM run ===
+class FinalAnswerFilter:
+    def __init__(self, marker: str = FINAL_ANSWER_MARKER):
+        self.marker = marker
+        self.buffers = {}   # run_id -> text generated so far
+        self.emitted = {}   # run_id -> length of the final answer already passed on
+
+    def feed(self, run_id, text: str) -> str:
+        buffer = self.buffers.get(run_id, "") + text
+        self.buffers[run_id] = buffer
+        position = buffer.find(self.marker)
+        if position < 0:
+            return ""
+        final = buffer[position + len(self.marker):].lstrip()
+        new_text = final[self.emitted.get(run_id, 0):]
+        self.emitted[run_id] = len(final)
+        return new_text
+
+
+# === 2. Time-to-first-token: the latency users actually notice ===
+class FirstTokenTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+
+    def mark_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def ttft(self):
+        return None if self.first_token is None else self.first_token - self.started
+
+    @property
+    def total(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def as_dict(self) -> dict:
+        return {"ttft": None if self.ttft is None else round(self.ttft, 3), "total": round(self.total, 3)}
+
+    def format(self) -> str:
+        ttft = f"{self.ttft:.2f}s" if self.ttft is not None else "-"
+        return f"ttft={ttft} total={self.total:.2f}s"
+
+
+# === 3. Async streams: ("token", text) items while generating, ("answer", text) at the end ===
+async def _next_before(iterator, deadline, parent=None):
+    remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+    # The step runs as its own task, which copies the context: LLM/tool spans nest under `parent`
+    with activate(parent):
+        return await asyncio.wait_for(iterator.__anext__(), remaining)
+
+async def stream_agent_events(agent, inputs: dict, timeout: float = None, parent=None):
+    """Streams the final answer tokens of an AgentExecutor via astream_events.
+    Raises asyncio.TimeoutError when the run exceeds `timeout`."""
+    deadline = time.monotonic() + timeout if timeout else None
+    answer_filter = FinalAnswerFilter()
+    streamed = []
+    output = None
+    events = agent.astream_events(inputs, version="v2")
+    try:
+        while True:
+            try:
+                event = await _next_before(events, deadline, parent)
+            except StopAsyncIteration:
+                break
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                chunk = event["data"]["chunk"]
+                text = answer_filter.feed(event["run_id"], chunk.content if isinstance(chunk.content, str) else "")
+                if text:
+                    streamed.append(text)
+                    yield "token", text
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                # End of the top-level run: the executor's parsed output is authoritative
+                result = event["data"].get("output")
+                output = result.get("output") if isinstance(result, dict) else result
+    finally:
+        await events.aclose()
+    yield "answer", output if output is not None else "".join(streamed)
+
+async def stream_llm(llm, prompt: str, timeout: float = None, parent=None):
+    deadline = time.monotonic() + timeout if timeout else None
+    parts = []
+    chunks = llm.astream(prompt)
+    try:
+        while True:
+            try:
+                chunk = await _next_before(chunks, deadline, parent)
+            except StopAsyncIteration:
+                break
+            if isinstance(chunk.content, str) and chunk.content:
+                parts.append(chunk.content)
+                yield "token", chunk.content
+    finally:
+        await chunks.aclose()
+    yield "answer", "".join(parts)
@@ -1,56 +1,135 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph_supervisor import create_supervisor
-from rag_agnet_ganzneu import create_agent, setup_tools, load_existing_vectorstore
-from web_such_agent import research_agent, ask_question_and_save_answer
+from web_such_agent import ask_question_and_save_answer
 from qa_ethics_agent import qa_ethics_agent
-from data_analysis_agent import agent as data_analysis_agent
+from answer_cache import AnswerCache
+from embedding_cache import get_embeddings
+from financial_facts import answer_from_facts
+from speculative import SpeculationBudget, should_speculate, run_speculative
+from hybrid_retrieval import top_relevance
+from components import registry
+from llm_pool import (get_chat_model, call_with_backoff, CallCounter, rag_call_stats, RAG_AGENT, SUPERVISOR,
+                      DATA_ANALYSIS_AGENT, GENERAL_CHAT)
+from streaming import stream_agent_events, stream_llm
+from interaction_log import get_interaction_log, make_record
+from tracing import span, debug, annotate, metrics
+from router import route_question, is_smalltalk, asks_for_chart, router
+from chart_service import chart_for_question, get_chart_service
+from plan_cache import get_plan_cache
+from conversation_memory import ConversationMemory, format_usage
 import os
 from dotenv import load_dotenv
 import re
 import time
+import threading
 
- === Loading environment variables (e.g., API keys) ===
+# === Loading environment variables (e.g., API keys) ===
 load_dotenv()
 
- === Initialization of the language model (Google Gemini Flash) ===
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
-
- === Preparing the RAG agent (Document-based QA) ===
-vectorstore = load_existing_vectorstore()   Loading the existing vector database (e.g., financial reports)
-tools = setup_tools(vectorstore)   Setting up the tools for the RAG agent
-rag_agent = create_agent(tools)   Creating the ReAct agent with the tools
-rag_agent.name = "rag_agent"
-research_agent.name = "research_agent"   Naming the web search agent
-data_analysis_agent.name = "data_analysis_agent"   Naming the data analysis agent
-
- === Creating and configuring the supervisor ===
-supervisor = create_supervisor(
-    model=llm,
-    agents=[rag_agent, research_agent, data_analysis_agent],
-    prompt=(
-        "You are a supervisor managing three agents:\n"
-        "- 'rag_agent': Handles document-based and structured data questions.\n"
-        "- 'research_agent': Handles real-time web search questions.\n"
-        "- 'data_analysis_agent': Handles data analysis, statistics, CSV/Excel, plotting, and advanced comparisons.\n"
-        "Always assign one task to one agent. Never do the work yourself.\n"
-        "If the user asks for analysis, statistics, plotting, or comparison of data, use the data_analysis_agent.\n"
-        "After each agent responds, hand back the results."
-    ),
-    add_handoff_back_messages=True,
-    output_mode="full_history",
-).compile()
-
- === Smalltalk detection (friendly greetings, etc.) ===
-smalltalk_keywords = [
-    "hello", "hi", "how are", "good morning", "good evening", "servus",
-    "greetings", "moin", "hey", "what's up", "how's it going", "all right",
-    "what are you doing", "who are you", "what can you do"
-]
+# RAG_MODE=direct: retrieval + one grounded LLM call, the ReAct agent only on low relevance or a weak answer
+RAG_MODE = os.getenv("RAG_MODE", "agent")
+
+# === Component factories: nothing heavy is built at import time, only on first use ===
+def build_llm():
+    # Initialization of the language model (Google Gemini Flash), shared with all agents
+    return get_chat_model()
+
+def build_vectorstore():
+    from rag_agnet_brandnew import load_existing_vectorstore
+    return load_existing_vectorstore()  # Loading the existing vector database (e.g., financial reports)
+
+def build_retriever():
+    from rag_agnet_brandnew import build_retriever as build_hybrid_retriever
+    from hybrid_retrieval import RecentQueryRetriever
+    # One retriever for the speculation check, the RAG tool and the direct mode
+    return RecentQueryRetriever(retriever=build_hybrid_retriever(registry.get("vectorstore")))
+
+def build_tools():
+    from rag_agnet_brandnew import setup_tools
+    # Setting up the tools for the RAG agent
+    return setup_tools(registry.get("vectorstore"), llm=registry.get("llm"), retriever=registry.get("retriever"))
+
+def build_general_chat_tool():
+    # Smalltalk only needs the LLM, not the embedding model and vector database
+    from rag_agnet_brandnew import setup_tools
+    return setup_tools(None, llm=registry.get("llm"))[0]
+
+def build_rag_agent():
+    from rag_agnet_brandnew import create_agent
+    # Creating the ReAct agent with the tools
+    rag_agent = create_agent(registry.get("tools"), llm=registry.get("llm"))
+    rag_agent.name = "rag_agent"
+    return rag_agent
+
+def build_direct_rag():
+    from rag_agnet_brandnew import DirectRAG
+    return DirectRAG(registry.get("vectorstore"), llm=registry.get("llm"), retriever=registry.get("retriever"))
+
+def build_research_agent():
+    from web_such_agent import get_research_agent
+    research_agent = get_research_agent()
+    research_agent.name = "research_agent"  # Naming the web search agent
+    return research_agent
+
+def build_data_analysis_agent():
+    from data_analysis_agent import get_agent
+    data_analysis_agent = get_agent()
+    data_analysis_agent.name = "data_analysis_agent"  # Naming the data analysis agent
+    return data_analysis_agent
+
+def build_supervisor():
+    # === Creating and configuring the supervisor ===
+    from langgraph_supervisor import create_supervisor
+    return create_supervisor(
+        model=registry.get("llm"),
+        agents=[registry.get("rag_agent"), registry.get("research_agent"), registry.get("data_analysis_agent")],
+        prompt=(
+            "You are a supervisor managing three agents:\n"
+            "- 'rag_agent': Handles document-based and structured data questions.\n"
+            "- 'research_agent': Handles real-time web search questions.\n"
+            "- 'data_analysis_agent': Handles data analysis, statistics, CSV/Excel, plotting, and advanced comparisons.\n"
+            "Always assign one task to one agent. Never do the work yourself.\n"
+            "If the user asks for analysis, statistics, plotting, or comparison of data, use the data_analysis_agent.\n"
+            "After each agent responds, hand back the results."
+        ),
+        add_handoff_back_messages=True,
+        output_mode="full_history",
+    ).compile()
+
+registry.register("llm", build_llm)
+registry.register("vectorstore", build_vectorstore)
+registry.register("retriever", build_retriever)
+registry.register("tools", build_tools)
+registry.register("general_chat", build_general_chat_tool)
+registry.register("rag_agent", build_rag_agent)
+registry.register("direct_rag", build_direct_rag)
+registry.register("research_agent", build_research_agent)
+registry.register("data_analysis_agent", build_data_analysis_agent)
+registry.register("supervisor", build_supervisor)
 
-def is_smalltalk(question: str) -> bool:
-    return any(kw in question.lower() for kw in smalltalk_keywords)
+def get_rag_agent():
+    return registry.get("rag_agent")
 
- === Answer validation: insufficient, empty, no numbers, etc. ===
+def get_general_chat_tool():
+    return registry.get("general_chat")
+
+def get_data_analysis_agent():
+    return registry.get("data_analysis_agent")
+
+# Optional background warm-up, e.g. WARMUP_COMPONENTS=rag_agent,general_chat (or "all")
+WARMUP_COMPONENTS = os.getenv("WARMUP_COMPONENTS", "")
+
+def start_warm_up(on_done=None):
+    if not WARMUP_COMPONENTS:
+        return None
+    names = None if WARMUP_COMPONENTS == "all" else [n.strip() for n in WARMUP_COMPONENTS.split(",") if n.strip()]
+    return registry.warm_up(names, background=True, on_done=on_done)
+
+# Old module attributes (supervisor_main.rag_agent, .tools, ...) still work, built on access
+def __getattr__(name):
+    if name in ("llm", "vectorstore", "tools", "rag_agent", "research_agent", "data_analysis_agent", "supervisor"):
+        return registry.get(name)
+    raise AttributeError(f"module 'supervisor_main' has no attribute '{name}'")
+
+# === Answer validation: insufficient, empty, no numbers, etc. ===
 def is_insufficient(answer: str, user_input: str = "") -> bool:
     if not answer or not isinstance(answer, str):
         return True
@@ -63,7 +142,10 @@ def is_insufficient(answer: str, user_input: str = "") -> bool:
             return True
     return len(answer.strip()) < 10
 
- === Year checking: add a note if year < current year ===
+# === Answer cache in front of the routing (exact question, then similar question embedding) ===
+answer_cache = AnswerCache(embed_fn=get_embeddings().embed_query)
+
+# === Year checking: add a note if year < current year ===
 def adjust_temporal_phrasing(user_input: str) -> str:
     from datetime import datetime
     current_year = datetime.now().year
@@ -75,78 +157,253 @@ def adjust_temporal_phrasing(user_input: str) -> str:
             return f"{user_input} (Note: We are in the year {current_year}, the figures for {year} should be published.)"
     return user_input
 
- === Logging: save question, answer, source, timestamp ===
-def log_to_file(user_input, answer, source):
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    insuff_flag = "❗" if is_insufficient(answer, user_input) else "✅"
-    with open("chat_log.txt", "a", encoding="utf-8") as f:
-        f.write(f"\n⏰ {timestamp}\n{insuff_flag} Question: {user_input}\nAnswer: {answer}\nSource: {source}\n")
-        f.write("-" * 60 + "\n")
+# === Logging: save question, answer, source, timestamp ===
+def log_to_file(user_input, answer, source, session=None, route=None, timings: dict = None, qa=None,
+                insufficient=None):
+    # Queued for the background writer (logs/interactions.jsonl); the caller passes the flags it already has
+    get_interaction_log().log(make_record("chat", user_input, answer, source, session=session, route=route,
+                                          timings=timings, qa=qa, insufficient=insufficient))
 
- === Function to check if the question contains a recent year ===
+# === Function to check if the question contains a recent year ===
 def contains_recent_year(user_input: str, min_year: int = 2024) -> bool:
     years = re.findall(r"\b(20\d{2})\b", user_input)
     return any(int(y) >= min_year for y in years)
 
- === Only when the file is run directly (not on import) ===
+# === Speculative mode: RAG agent and web search in parallel, first good answer wins ===
+speculation_budget = SpeculationBudget()
+
+def top_retrieval_score(question: str):
+    # The RAG path asks the same shared retriever for the same question and gets these hits back
+    try:
+        docs = registry.get("retriever").invoke(question)
+    except Exception:
+        return None
+    return top_relevance(docs) if docs else 0.0
+
+def wants_speculation(user_input: str) -> bool:
+    # The retrieval score only matters while the budget could still allow a speculative run
+    score_fn = top_retrieval_score if speculation_budget.has_room() else None
+    wanted = should_speculate(user_input, contains_recent_year(user_input, 2024), score_fn)
+    return speculation_budget.allow(wanted)
+
+def agent_answer(question: str, history: str, config=None) -> str:
+    with span("rag_agent"):
+        rag_result = call_with_backoff(RAG_AGENT, get_rag_agent().invoke, {"input": question, "history": history},
+                                       config=config)
+    return rag_result.get("output") if isinstance(rag_result, dict) else str(rag_result)
+
+def rag_answer(question: str, history: str, mode: str = None):
+    # history: ConversationMemory.as_prompt() (summary, last entities, recent turns)
+    mode = mode or RAG_MODE
+    # Every LLM call of this question (agent steps, RetrievalQA, direct generation) reports to the counter
+    counter = CallCounter()
+    config = {"callbacks": [counter]}
+    if mode == "direct":
+        answer_text, escalated = registry.get("direct_rag").answer(
+            question, history, validate=lambda answer: not is_insufficient(answer, question),
+            escalate=lambda q, h: agent_answer(q, h, config), config=config)
+        mode = "direct+agent" if escalated else "direct"
+    else:
+        answer_text = agent_answer(question, history, config)
+    rag_call_stats.record(mode, counter)
+    annotate(rag_mode=mode, llm_calls=counter.calls, llm_tokens=counter.tokens)
+    return answer_text, "RAG-Agent"
+
+def supervisor_answer(question: str, history: list):
+    # history: ConversationMemory.as_messages()
+    # Only for questions the router is unsure about: the supervisor LLM picks the agent
+    with span("supervisor"):
+        result = call_with_backoff(SUPERVISOR, registry.get("supervisor").invoke,
+                                   {"messages": history + [{"role": "user", "content": question}]})
+    messages = result.get("messages", []) if isinstance(result, dict) else []
+    answer_text = getattr(messages[-1], "content", "") if messages else str(result)
+    return answer_text, "Supervisor"
+
+# The smolagents CodeAgent keeps its run state on the instance: one analysis at a time
+analysis_lock = threading.Lock()
+
+def analysis_answer(question: str):
+    # Returns (answer, source, figure path or None); the figure is the one rendered for this question
+    chart = chart_for_question(question)
+    if chart:
+        return chart[0], "Data-Analysis-Agent", chart[1]
+    with analysis_lock, span("data_analysis"), get_chart_service().recording() as figures:
+        agent = get_data_analysis_agent()
+        # Same request shape with other companies/years: replay the stored code, no LLM call
+        answer_text = get_plan_cache().run(agent, question,
+                                           lambda q: call_with_backoff(DATA_ANALYSIS_AGENT, agent.run, q))
+    return str(answer_text), "Data-Analysis-Agent", (figures[-1] if figures else None)
+
+def general_chat_answer(question: str):
+    with span("general_chat"):
+        answer_text = call_with_backoff(GENERAL_CHAT, get_general_chat_tool().run, question)
+    return answer_text, "RAG-Agent (general_chat)"
+
+# === Streaming variants for the chat UI: ("token", text) items, then ("answer", text) ===
+def stream_rag_answer(question: str, history: str, timeout: float = None, parent=None):
+    return stream_agent_events(get_rag_agent(), {"input": question, "history": history}, timeout, parent)
+
+def stream_general_chat_answer(question: str, timeout: float = None, parent=None):
+    from rag_agnet_brandnew import GENERAL_CHAT_PROMPT
+    return stream_llm(registry.get("llm"), GENERAL_CHAT_PROMPT.format(question=question), timeout, parent)
+
+def speculative_answer(rag_input: str, user_input: str, history: str, timeout: float = None):
+    with span("speculative") as current:
+        answer_text, source, winner = run_speculative(
+            {
+                "RAG-Agent": lambda: rag_answer(rag_input, history),
+                "Web-Agent": lambda: ask_question_and_save_answer(user_input),
+            },
+            accept=lambda answer: not is_insufficient(answer, rag_input),
+            timeout=timeout,
+        )
+        current.set(winner=winner)
+    debug(f"\n[Speculative] {winner} delivered the answer.")
+    return answer_text, source
+
+# === Routing of one question: cache → facts → router → speculation → recent year → RAG (web fallback) ===
+def plan_route(user_input: str):
+    """The route of one question, shared by the CLI and the app. Returns (route, decision, hit):
+    `hit` is the cache entry or the facts answer, `decision` the router's RouteDecision (None for those two)."""
+    # Smalltalk is only looked up verbatim: a "hello" session never loads the embedding model
+    cached = answer_cache.get(user_input, semantic=not is_smalltalk(user_input))
+    if cached:
+        return "Cache", None, cached
+    # A chart request naming one metric and year still wants the chart, not the figure
+    facts_answer = None if asks_for_chart(user_input) else answer_from_facts(user_input)
+    if facts_answer:
+        # Direct metric lookup answered from the extracted tables, no LLM involved
+        return "Facts-Store", None, facts_answer
+    # Keywords, then the local intent classifier; only unsure questions pay for the supervisor LLM
+    decision = route_question(user_input)
+    if decision.route == "general_chat":
+        route = "general_chat"
+    elif decision.route == "data_analysis":
+        route = "Data-Analysis-Agent"
+    elif decision.route == "supervisor":
+        route = "Supervisor"
+    elif wants_speculation(user_input):
+        route = "RAG + Websuche"
+    elif decision.route == "web" or contains_recent_year(user_input, 2024):
+        route = "Web-Agent"
+    else:
+        route = "RAG-Agent"
+    return route, decision, None
+
+def answer_question(user_input: str, memory: ConversationMemory, session: str = "cli"):
+    """Answers one question like the CLI does and adds the turn to `memory`.
+    Returns (answer, source, qa, route)."""
+    started = time.perf_counter()
+    # One trace per question: nested stage spans end up in logs/traces.jsonl
+    with span("request", session=session) as trace:
+        trace.set(history_tokens=memory.tokens())
+        # "and in 2024?" → "and in 2024? (Apple, revenue, 2024)": from here on the question stands alone
+        user_input = memory.expand_followup(user_input)
+        route, decision, hit = plan_route(user_input)
+        cached = hit if route == "Cache" else None
+        if cached:
+            answer_text, source, warnings = cached.answer, cached.source, cached.qa
+        else:
+            if route == "Facts-Store":
+                answer_text, source = hit
+            elif route == "general_chat":
+                answer_text, source = general_chat_answer(user_input)
+            elif route == "Data-Analysis-Agent":
+                answer_text, source, figure = analysis_answer(user_input)
+                if figure and figure not in answer_text:
+                    answer_text = f"{answer_text}\nFigure: {figure}"
+            elif route == "Supervisor":
+                debug(f"\n[Note] Router unsure ({decision.confidence:.2f}) → Supervisor picks the agent...")
+                try:
+                    answer_text, source = supervisor_answer(user_input, memory.as_messages())
+                except Exception as e:
+                    debug(f"\n[Error] Supervisor failed ({e}) → Using RAG-Agent...")
+                    answer_text, source = rag_answer(user_input, memory.as_prompt())
+            elif route == "RAG + Websuche":
+                debug("\n[Note] Question likely needs the web → RAG-Agent and Web Agent run in parallel...")
+                answer_text, source = speculative_answer(user_input, user_input, memory.as_prompt())
+            elif route == "Web-Agent":
+                debug("\n[Note] Question needs current data → Using Web Agent...")
+                answer_text, source = ask_question_and_save_answer(user_input)
+            else:
+                try:
+                    answer_text, source = rag_answer(user_input, memory.as_prompt())
+
+                    # NEW: If answer is empty, None, or too short → Use Web Agent
+                    if not answer_text or not isinstance(answer_text, str) or len(answer_text.strip()) < 5:
+                        debug("\n[Note] RAG-Agent provided no answer → Using Web Agent...")
+                        answer_text, source = ask_question_and_save_answer(user_input)
+                    elif is_insufficient(answer_text, user_input):
+                        debug("\n[Note] RAG answer incomplete → Using Web Agent...")
+                        answer_text, source = ask_question_and_save_answer(user_input)
+
+                except Exception as e:
+                    debug(f"\n[Error] RAG-Agent failed ({e}) → Using Web Agent...")
+                    answer_text, source = ask_question_and_save_answer(user_input)
+
+            # QA/Ethics check of the answer
+            warnings = qa_ethics_agent.run(answer_text, [source])
+
+        # Insufficient answers are never cached
+        insufficient = False if cached else is_insufficient(answer_text, user_input)
+        # Charts are files on disk (LRU-evicted), so analysis answers are not cached
+        if not cached and route != "Data-Analysis-Agent":
+            answer_cache.put(user_input, answer_text, source, warnings, insufficient=insufficient,
+                             semantic=route != "general_chat")
+        trace.set(route=route)
+        log_to_file(user_input, answer_text, source, session=session, route=route,
+                    timings={"total": round(time.perf_counter() - started, 3)}, qa=warnings,
+                    insufficient=insufficient)
+
+    # Recent turns verbatim, older ones summarized in the background
+    memory.add_turn(user_input, answer_text)
+    return answer_text, source, warnings, route
+
+# === Only when the file is run directly (not on import) ===
 if __name__ == "__main__":
+    start_warm_up()
     print("\nSupervisor is ready. Enter a question (or 'exit' to quit):")
-    history = []   History for RAG context
+    memory = ConversationMemory()  # History for RAG context, within a token budget
 
     while True:
         user_input = input("\nQuestion: ").strip()
         if user_input.lower() in ["exit", "quit"]:
+            print(registry.startup_report())
+            print(metrics.format_report())
+            print(router.format_stats())
+            print(get_plan_cache().format_stats())
+            print(memory.format_stats())
+            print(format_usage())
+            print(rag_call_stats.format_stats())
+            if registry.is_built("direct_rag"):
+                print(registry.get("direct_rag").format_stats())
             break
 
-        if is_smalltalk(user_input):
-            general_chat_tool = tools[0]
-            answer_text = general_chat_tool.run(user_input)
-            source = "RAG-Agent (general_chat)"
-        elif contains_recent_year(user_input, 2024):
-            print("\n[Note] Question contains year 2024 or later → Using Web Agent...")
-            answer_text, source = ask_question_and_save_answer(user_input)
-        else:
-            try:
-                rag_result = rag_agent.invoke({"input": user_input, "history": history})
-                answer_text = rag_result.get("output") if isinstance(rag_result, dict) else str(rag_result)
-                source = "RAG-Agent"
-
-                 NEW: If answer is empty, None, or too short → Use Web Agent
-                if not answer_text or not isinstance(answer_text, str) or len(answer_text.strip()) < 5:
-                    print("\n[Note] RAG-Agent provided no answer → Using Web Agent...")
-                    answer_text, source = ask_question_and_save_answer(user_input)
-                elif is_insufficient(answer_text, user_input):
-                    print("\n[Note] RAG answer incomplete → Using Web Agent...")
-                    answer_text, source = ask_question_and_save_answer(user_input)
-
-            except Exception as e:
-                print("\n[Error] RAG-Agent failed → Using Web Agent...")
-                answer_text, source = ask_question_and_save_answer(user_input)
+        answer_text, source, warnings, route = answer_question(user_input, memory)
+        if route == "Cache":
+            print(f"\n[Cache] Answer served from cache ({source})")
 
         print("\nAnswer:")
         print(answer_text)
         print(f"Source: {source}")
 
-         Check if relevant numbers are present in the answer
+        # Check if relevant numbers are present in the answer
         number_keywords = ["how much", "revenue", "profit", "current", "numbers", "amount", "revenue"]
         if any(kw in user_input.lower() for kw in number_keywords):
             if not re.search(r"\d{4}|\d+[\.,]?\d*", answer_text):
                 print("\n⚠️ No current revenue figures could be found. Please check the official financial reports or the investor relations page of the company.")
 
-         QA/Ethics check of the answer
-        warnings = qa_ethics_agent.run(answer_text, [source])
         print("\n⚖️ QA/Ethics Check:")
         print(warnings)
 
-         Update history for the next iteration
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": answer_text})
-
- === Export for Gradio or external use ===
+# === Export for Gradio or external use ===
 __all__ = [
-    "rag_agent", "tools", "ask_question_and_save_answer",
+    "registry", "get_rag_agent", "get_general_chat_tool", "get_data_analysis_agent",
+    "start_warm_up", "ask_question_and_save_answer",
     "qa_ethics_agent", "is_smalltalk", "is_insufficient",
-    "adjust_temporal_phrasing", "log_to_file"
+    "adjust_temporal_phrasing", "log_to_file", "answer_cache", "answer_from_facts",
+    "wants_speculation", "speculative_answer", "rag_answer", "general_chat_answer",
+    "stream_rag_answer", "stream_general_chat_answer", "answer_question",
+    "route_question", "supervisor_answer", "contains_recent_year", "analysis_answer", "RAG_MODE", "plan_route"
 ]
 
@@ -0,0 +1,181 @@
+import os
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from financial_facts import parse_number
+
+# "recursive": every record through one RecursiveCharacterTextSplitter; "table": this module
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "recursive")
+# Row budget of a table chunk; the context and header lines come on top and rows are never cut
+TABLE_CHUNK_CHARS = int(os.getenv("TABLE_CHUNK_CHARS", "800"))
+PROSE_CHUNK_SIZE = int(os.getenv("PROSE_CHUNK_SIZE", "800"))
+PROSE_CHUNK_OVERLAP = int(os.getenv("PROSE_CHUNK_OVERLAP", "80"))
+# Prose chunks of one company sharing this much of their word 3-grams are boilerplate repeats
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.85"))
+HEADER_SCAN_ROWS = 4
+SHINGLE_WORDS = 3
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+_PRIME = (1 << 31) - 1
+
+_YEAR_CELL = re.compile(r"(?:19|20)\d{2}")
+_SCALE = re.compile(r"in (millions|billions|thousands)", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+_CURRENCY_CELLS = {"$", "€"}
+EMPTY_CELL = "-"
+
+
+# === 1. Cells: one canonical spelling per figure ("$ 1,234" / "1234" / "(1,234)" -> "1,234" / "-1,234") ===
+def normalize_cell(cell: str) -> str:
+    cell = " ".join((cell or "").split())
+    if _YEAR_CELL.fullmatch(cell):
+        return cell
+    value = parse_number(cell)
+    if value is None:
+        return cell
+    digits = cell.rstrip("%)").rpartition(".")[2] if "." in cell else ""
+    decimals = len(digits) if digits.isdigit() else 0
+    text = f"{value + 0.0:,.{decimals}f}"  # + 0.0 turns "(0)" into "0", not "-0"
+    return text + "%" if cell.endswith("%") else text
+
+def split_row(line: str) -> list:
+    # Label cell first, then the values without lone currency cells ("$" | "394,328"). An empty value
+    # cell stays as a placeholder so the figures behind it keep their year column ("Restructuring | - | 1,200")
+    cells = [cell.strip() for cell in line.split("|")]
+    values = []
+    for cell in cells[1:]:
+        if cell == "%" and values and values[-1] != EMPTY_CELL:
+            values[-1] += "%"
+        elif cell not in _CURRENCY_CELLS:
+            values.append(cell or EMPTY_CELL)
+    while values and values[-1] == EMPTY_CELL:
+        values.pop()
+    return [cells[0]] + values
+
+def is_header_row(cells: list) -> bool:
+    # Header rows hold labels and years ("Years ended" | "2023" | "2022"), no figures. A section label
+    # ("Operating expenses:") or a row without year cells is not one: it stays with the rows below it
+    if not any(cells) or cells[0].rstrip().endswith(":"):
+        return False
+    return (any(_YEAR_CELL.fullmatch(c) for c in cells[1:] if c)
+            and all(_YEAR_CELL.fullmatch(c) or parse_number(c) is None for c in cells if c))
+
+def has_figures(cells: list) -> bool:
+    return any(parse_number(c) is not None and not _YEAR_CELL.fullmatch(c) for c in cells[1:])
+
+
+# === 2. Near-duplicate prose: MinHash signatures, LSH bands for candidates, exact Jaccard to decide ===
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    words = _WORD.findall(text.lower())
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(max(1, len(words) - size + 1))}
+
+class NearDuplicateFilter:
+    def __init__(self, threshold: float = DEDUPE_THRESHOLD, permutations: int = MINHASH_PERMUTATIONS,
+                 bands: int = MINHASH_BANDS, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.rows = permutations // bands
+        self.a = rng.integers(1, _PRIME, size=permutations, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=permutations, dtype=np.uint64)
+        self._buckets = defaultdict(list)
+        self._kept = []
+
+    def signature(self, items: set) -> np.ndarray:
+        values = np.fromiter(items, dtype=np.uint64, count=len(items))
+        return ((np.outer(self.a, values) + self.b[:, None]) % _PRIME).min(axis=1)
+
+    def is_duplicate(self, text: str, scope: str = "") -> bool:
+        # Remembers every text it lets through, so the first of a group of repeats is kept
+        items = shingles(text)
+        signature = self.signature(items)
+        keys = [(scope, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(len(signature) // self.rows)]
+        candidates = {idx for key in keys for idx in self._buckets.get(key, ())}
+        for idx in candidates:
+            if len(items & self._kept[idx]) / len(items | self._kept[idx]) >= self.threshold:
+                return True
+        for key in keys:
+            self._buckets[key].append(len(self._kept))
+        self._kept.append(items)
+        return False
+
+
+# === 3. Chunker: row groups with context + header for tables, deduplicated splits for prose ===
+def context_line(metadata: dict) -> str:
+    parts = [metadata.get("company", ""), metadata.get("file", ""), f"page {metadata.get('page', '?')}"]
+    if "table_index" in metadata:
+        parts.append(f"table {metadata['table_index'] + 1}")
+    if "year" in metadata:
+        parts.append(f"fiscal year {metadata['year']}")
+    return " | ".join(str(part) for part in parts if part)
+
+class TableAwareChunker:
+    def __init__(self, table_chars: int = TABLE_CHUNK_CHARS, prose_size: int = PROSE_CHUNK_SIZE,
+                 prose_overlap: int = PROSE_CHUNK_OVERLAP, dedupe_threshold: float = DEDUPE_THRESHOLD):
+        self.table_chars = table_chars
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=prose_size, chunk_overlap=prose_overlap)
+        self.dedupe = NearDuplicateFilter(dedupe_threshold) if dedupe_threshold < 1 else None
+        self.stats = {"documents": 0, "tables": 0, "table_chunks": 0, "prose_chunks": 0, "duplicates": 0}
+
+    def split_table(self, doc: Document) -> list:
+        # The whole table is already in page_content, so the metadata does not carry it a second time
+        metadata = {k: v for k, v in doc.metadata.items() if k != "content"}
+        rows = [split_row(line) for line in doc.page_content.split("\n")]
+        rows = [(idx, cells) for idx, cells in enumerate(rows) if any(cells)]
+        header_count = 0
+        while header_count < min(HEADER_SCAN_ROWS, len(rows) - 1) and is_header_row(rows[header_count][1]):
+            header_count += 1
+        header = [" | ".join(cells) for _, cells in rows[:header_count]]
+        prefix = [context_line(metadata)]
+        scale = _SCALE.search(doc.page_content)
+        if scale and not any(_SCALE.search(line) for line in header):
+            prefix.append(f"(in {scale.group(1).lower()})")
+
+        groups, group, size = [], [], 0
+        for idx, cells in rows[header_count:]:
+            line = " | ".join(normalize_cell(c) if n else c for n, c in enumerate(cells))
+            if group and size + len(line) > self.table_chars and any(has_figures(item[2]) for item in group):
+                # A section label ("Operating expenses:") belongs to the rows below it
+                carry = [group.pop()] if len(group) > 1 and not has_figures(group[-1][2]) else []
+                groups.append(group)
+                group, size = carry, sum(len(item[1]) + 1 for item in carry)
+            group.append((idx, line, cells))
+            size += len(line) + 1
+        if group:
+            groups.append(group)
+
+        self.stats["tables"] += 1
+        self.stats["table_chunks"] += len(groups) or 1
+        if not groups:
+            return [Document(page_content="\n".join(prefix + header), metadata=metadata)]
+        return [Document(page_content="\n".join(prefix + header + [line for _, line, _ in group]),
+                         metadata=dict(metadata, row_start=group[0][0], row_end=group[-1][0]))
+                for group in groups]
+
+    def split_prose(self, doc: Document) -> list:
+        metadata = {k: v for k, v in doc.metadata.items() if k != "content"}
+        chunks = []
+        for text in self.splitter.split_text(doc.page_content):
+            # Forward-looking statements, cover pages, legal notes: once per company is enough
+            if self.dedupe and self.dedupe.is_duplicate(text, metadata.get("company_key", "")):
+                self.stats["duplicates"] += 1
+                continue
+            chunks.append(Document(page_content=text, metadata=dict(metadata)))
+        self.stats["prose_chunks"] += len(chunks)
+        return chunks
+
+    def split_documents(self, documents) -> list:
+        chunks = []
+        for doc in documents:
+            self.stats["documents"] += 1
+            chunks.extend(self.split_table(doc) if doc.metadata.get("type") == "table" else self.split_prose(doc))
+        return chunks
+
+    def format_stats(self) -> str:
+        s = self.stats
+        return (f"✂️ Table-aware chunking: {s['documents']} records -> {s['table_chunks']} table chunks "
+                f"from {s['tables']} tables, {s['prose_chunks']} prose chunks, "
+                f"{s['duplicates']} near-duplicate prose chunks dropped")
@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from answer_cache import AnswerCache
+
+@pytest.fixture
+def cache():
+    # Every question embeds to the same vector: only the entity check tells them apart
+    cache = AnswerCache(embed_fn=lambda question: [1.0, 0.0])
+    cache.put("What was Apple's revenue in 2022?", "394,328 million USD", "RAG-Agent")
+    return cache
+
+def test_semantic_hit_for_the_same_entities(cache):
+    assert cache.get("Apple revenue in 2022").answer == "394,328 million USD"
+
+@pytest.mark.parametrize("question", [
+    "What was Microsoft's revenue in 2022?",
+    "What was Apple's net income in 2022?",
+    "What was Apple's revenue in 2023?",
+    "What was the revenue of Apple and Microsoft in 2022?",
+])
+def test_no_semantic_hit_for_other_entities(cache, question):
+    assert cache.get(question) is None
@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from conversation_memory import ConversationMemory, extractive_summary
+
+@pytest.fixture
+def memory():
+    memory = ConversationMemory(summarizer=extractive_summary)
+    memory.add_turn("What was Apple's revenue in 2022?", "Apple's revenue was 394,328 million USD.")
+    return memory
+
+@pytest.mark.parametrize("question", [
+    "What was Samsung's revenue in 2023?",
+    "What is Asus's profit for the current year?",
+    "Who won the world cup in 2022?",
+])
+def test_standalone_questions_are_not_expanded(memory, question):
+    assert memory.expand_followup(question) == question
+
+@pytest.mark.parametrize("question, expected", [
+    ("and in the year 2024?", "and in the year 2024? (Apple, revenue, 2024)"),
+    ("what about the profit?", "what about the profit? (Apple, net income, 2022)"),
+    ("2023?", "2023? (Apple, revenue, 2023)"),
+])
+def test_followups_get_previous_context(memory, question, expected):
+    assert memory.expand_followup(question) == expected
+
+@pytest.mark.parametrize("question", [
+    "What about Samsung?",
+    "what about samsung?",
+    "and for tesla in 2023?",
+    "and the ceo?",
+])
+def test_unknown_words_block_the_previous_context(memory, question):
+    assert memory.expand_followup(question) == question
+
+def test_history_stats_stay_bounded(memory):
+    for turn in range(50):
+        memory.add_turn(f"question {turn}", "answer " * 50)
+    memory.flush()
+    tokens = memory.stats["history_tokens"]
+    assert set(tokens) == {"first", "last", "min", "max"}
+    assert tokens["min"] <= tokens["last"] <= tokens["max"]
@@ -0,0 +1,35 @@
+import os
+import sys
+import json
+import time
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+spec = importlib.util.spec_from_file_location("data_extract", os.path.join(ROOT, "data_ extract.py"))
+data_extract = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(data_extract)
+
+def crash_on_bad_pdf(shard):
+    # Runs in the worker: bad.pdf takes the whole process down, like a segfault in the PDF parser
+    company, file_path, filename, page_range = shard
+    if filename == "bad.pdf":
+        os._exit(1)
+    time.sleep(0.5)  # still in flight when the pool breaks
+    record = {"type": "text", "company": company, "file": filename, "page": 1, "content": filename}
+    return {"records": [record], "pages": 1, "error": None}
+
+def test_crashing_pdf_does_not_drop_healthy_shards(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    for name in ("a.pdf", "bad.pdf", "c.pdf", "d.pdf"):
+        (source / name).write_bytes(b"%PDF-1.4")
+    monkeypatch.setattr(data_extract, "_extract_shard", crash_on_bad_pdf)
+
+    output = tmp_path / "records.jsonl"
+    progress = data_extract.extract_directory_to_jsonl(str(source), str(output), workers=4, report_every=60)
+
+    with open(output, encoding="utf-8") as f:
+        files = [json.loads(line)["file"] for line in f]
+    assert files == ["a.pdf", "c.pdf", "d.pdf"]
+    assert len(progress.errors) == 1 and "bad.pdf" in progress.errors[0]
@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from financial_facts import parse_metric_question, facts_from_table
+
+@pytest.mark.parametrize("question, expected", [
+    ("What was Apple's revenue in 2023?", ("apple", "revenue", 2023)),
+    ("What was Microsoft's net income in 2022?", ("microsoft", "net_income", 2022)),
+    ("Wie hoch war der Umsatz von Apple 2023?", ("apple", "revenue", 2023)),
+])
+def test_single_metric_lookups_are_parsed(question, expected):
+    assert parse_metric_question(question) == expected
+
+@pytest.mark.parametrize("question", [
+    "What was Apple's revenue in Q3 2023?",
+    "What was Apple's revenue in the first quarter of 2023?",
+    "What is Apple's projected revenue for 2023?",
+    "What is Apple's revenue guidance for 2024?",
+    "What was Apple's H1 2023 revenue?",
+    "Wie hoch war der Umsatz von Apple im zweiten Quartal 2023?",
+    "Compare Apple and Microsoft revenue in 2023",
+    "What was Apple's revenue in 2022 and 2023?",
+])
+def test_quarters_outlooks_and_comparisons_are_not_lookups(question):
+    assert parse_metric_question(question) is None
+
+def table(*rows):
+    return {"content": "\n".join(" | ".join(row) for row in rows)}
+
+def values(facts):
+    return {(f["concept"], f["year"]): f["value"] for f in facts}
+
+def test_lone_currency_cells_do_not_shift_the_columns():
+    facts = facts_from_table(table(("(in millions)",), ("Years ended", "September 30, 2023", "September 24, 2022"),
+                                   ("Net sales", "$", "383,285", "$", "394,328")))
+    assert values(facts) == {("revenue", 2023): 383285.0, ("revenue", 2022): 394328.0}
+    assert {f["unit"] for f in facts} == {"USD millions"}
+
+def test_missing_value_does_not_take_the_next_periods_figure():
+    facts = facts_from_table(table(("", "2023", "2022"), ("Net income", "—", "96,995"),
+                                   ("Operating income", "", "1,200"), ("Total assets", "(1,234)", "")))
+    assert values(facts) == {("net_income", 2022): 96995.0, ("operating_income", 2022): 1200.0,
+                             ("total_assets", 2023): -1234.0}
+
+def test_quarter_headers_are_marked_as_quarters():
+    facts = facts_from_table(table(("Three months ended", "Q3 2023", "Q3 2022"), ("Total net sales", "81,797", "82,959")))
+    assert [(f["period"], f["period_type"]) for f in facts] == [("Q3 2023", "quarter"), ("Q3 2022", "quarter")]
+
+def test_rows_without_a_known_label_are_skipped():
+    assert facts_from_table(table(("", "2023"), ("Research and development", "29,915"))) == []
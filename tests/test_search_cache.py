@@ -0,0 +1,30 @@
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from search_cache import SearchCache, StubBackend, WebSearch
+
+@pytest.fixture
+def web(tmp_path):
+    web = WebSearch(StubBackend(latency=0), SearchCache(str(tmp_path / "search.db")))
+    web.search("Apple revenue 2023")
+    return web
+
+def test_related_results_for_the_same_company_and_year(web):
+    assert web.related("Apple revenue 2023 about")[0]["content"] == "Stub content 1 about Apple revenue 2023."
+
+@pytest.mark.parametrize("query", ["Microsoft revenue 2023", "Apple revenue 2022", "revenue 2023 about"])
+def test_no_related_results_for_other_entities(web, query):
+    assert web.related(query) is None
+
+def test_cache_file_of_the_old_layout_is_started_anew(tmp_path):
+    path = str(tmp_path / "search.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE searches (key TEXT PRIMARY KEY, query TEXT, results TEXT, created REAL)")
+    conn.commit()
+    conn.close()
+    web = WebSearch(StubBackend(latency=0), SearchCache(path))
+    web.search("Apple revenue 2023")
+    assert web.related("Apple revenue 2023 about") is not None
@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from langchain_core.documents import Document
+from table_chunker import TableAwareChunker, split_row
+
+@pytest.mark.parametrize("line, expected", [
+    ("Restructuring |  | 1,200", ["Restructuring", "-", "1,200"]),
+    ("Net sales | $ | 383,285 | $ | 394,328", ["Net sales", "383,285", "394,328"]),
+    ("Gross margin | 45 | % | 43 | %", ["Gross margin", "45%", "43%"]),
+    ("Operating expenses: |  | ", ["Operating expenses:"]),
+])
+def test_split_row_keeps_values_under_their_column(line, expected):
+    assert split_row(line) == expected
+
+def test_section_labels_are_carried_with_their_rows():
+    table = "\n".join(["Years ended | 2023 | 2022", "Operating expenses: |  | ", "Research | $ | 100 | $ | 90",
+                       "Sales |  | 40", "Other income: |  | ", "Interest | 5 | 4"])
+    chunks = TableAwareChunker(table_chars=40).split_table(
+        Document(page_content=table, metadata={"type": "table", "company": "Apple", "page": 1}))
+    bodies = [chunk.page_content.split("\n")[2:] for chunk in chunks]
+    assert all(chunk.page_content.split("\n")[1] == "Years ended | 2023 | 2022" for chunk in chunks)
+    assert bodies == [["Operating expenses:", "Research | 100 | 90"], ["Sales | - | 40"],
+                      ["Other income:", "Interest | 5 | 4"]]
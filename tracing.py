@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.callbacks import BaseCallbackHandler
+from interaction_log import InteractionLogger
+
+TRACE_PATH = os.getenv("TRACE_LOG", os.path.join("logs", "traces.jsonl"))
+# Only these root spans are written to TRACE_PATH; other parentless spans (startup, index builds,
+# benchmarks) still feed the metrics
+EXPORT_ROOTS = {"request"}
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+HISTOGRAM_WINDOW = 5000
+RECENT_TRACES = 200
+QUANTILES = (0.5, 0.95, 0.99)
+# AGENT_DEBUG=0 switches off the [DEBUG] prints and verbose chain/agent output (production)
+DEBUG = os.getenv("AGENT_DEBUG", "1") == "1"
+
+def debug(*args):
+    if DEBUG:
+        print(*args)
+
+
+# === 1. Spans: nested via a context variable, one tree per request ===
+_current = contextvars.ContextVar("current_span", default=None)
+_open_spans = {}  # span id -> Span, so LangChain callbacks can find their parent by id
+
+class Span:
+    def __init__(self, name: str, parent=None, **attributes):
+        self.id = os.urandom(8).hex()
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else self.id
+        self.attributes = dict(attributes)
+        self.children = []
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.error = None
+        if parent is not None:
+            parent.children.append(self)
+        _open_spans[self.id] = self
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: Exception = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _open_spans.pop(self.id, None)
+        metrics.observe(self)
+        if self.parent is None and self.name in EXPORT_ROOTS:
+            exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "start": round(self.started_at, 3),
+            "duration": None if self.duration is None else round(self.duration, 4),
+            "attributes": self.attributes,
+            "error": self.error,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+def current_span():
+    return _current.get()
+
+def start_span(name: str, parent=None, **attributes) -> Span:
+    # For spans that cannot be a `with` block (e.g. across the yields of an async generator)
+    return Span(name, parent if parent is not None else _current.get(), **attributes)
+
+@contextmanager
+def span(name: str, parent=None, **attributes):
+    current = start_span(name, parent, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+@contextmanager
+def activate(parent):
+    # Makes `parent` the current span, e.g. in a worker thread running part of a request
+    token = _current.set(parent)
+    try:
+        yield parent
+    finally:
+        _current.reset(token)
+
+def run_in_span(parent, fn, *args, **kwargs):
+    with activate(parent):
+        return fn(*args, **kwargs)
+
+def annotate(**attributes):
+    # Adds attributes (cache hits, sizes, ...) to the current span, if any
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+# === 2. Aggregation: per-span-name latency histograms, token and cache counters ===
+class Metrics:
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self.durations = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(int)
+        self.sums = defaultdict(float)
+        self.errors = defaultdict(int)
+        self.tokens = defaultdict(int)
+        self.cache = defaultdict(int)  # "<span>:hit" / "<span>:miss"
+        self._lock = threading.Lock()
+
+    def observe(self, finished: Span):
+        with self._lock:
+            self.durations[finished.name].append(finished.duration)
+            self.counts[finished.name] += 1
+            self.sums[finished.name] += finished.duration
+            if finished.error:
+                self.errors[finished.name] += 1
+            tokens = finished.attributes.get("total_tokens")
+            if tokens:
+                self.tokens[finished.attributes.get("model") or finished.name] += tokens
+            if "cache_hit" in finished.attributes:
+                self.cache[f"{finished.name}:{'hit' if finished.attributes['cache_hit'] else 'miss'}"] += 1
+
+    @staticmethod
+    def quantile(values, q):
+        values = sorted(values)
+        return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            spans = {
+                name: {
+                    "count": self.counts[name],
+                    "sum": round(self.sums[name], 4),
+                    "errors": self.errors[name],
+                    **{f"p{int(q * 100)}": round(self.quantile(values, q), 4) for q in QUANTILES},
+                }
+                for name, values in self.durations.items()
+            }
+            return {"spans": spans, "tokens": dict(self.tokens), "cache": dict(self.cache)}
+
+    def prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = ["# TYPE agent_span_seconds summary"]
+        for name, stats in sorted(snapshot["spans"].items()):
+            for q in QUANTILES:
+                lines.append(f'agent_span_seconds{{span="{name}",quantile="{q}"}} {stats[f"p{int(q * 100)}"]}')
+            lines.append(f'agent_span_seconds_count{{span="{name}"}} {stats["count"]}')
+            lines.append(f'agent_span_seconds_sum{{span="{name}"}} {stats["sum"]}')
+            lines.append(f'agent_span_errors_total{{span="{name}"}} {stats["errors"]}')
+        lines.append("# TYPE agent_llm_tokens_total counter")
+        for model, tokens in sorted(snapshot["tokens"].items()):
+            lines.append(f'agent_llm_tokens_total{{model="{model}"}} {tokens}')
+        lines.append("# TYPE agent_cache_lookups_total counter")
+        for key, count in sorted(snapshot["cache"].items()):
+            name, result = key.rsplit(":", 1)
+            lines.append(f'agent_cache_lookups_total{{span="{name}",result="{result}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def format_report(self) -> str:
+        lines = ["⏱️ Stage latencies (p50 / p95 / p99, count):"]
+        for name, stats in sorted(self.snapshot()["spans"].items(), key=lambda item: -item[1]["sum"]):
+            lines.append(f"  {name:<22} {stats['p50']:7.3f}s {stats['p95']:7.3f}s {stats['p99']:7.3f}s  {stats['count']:6d}")
+        return "\n".join(lines)
+
+metrics = Metrics()
+
+
+# === 3. Export: finished request trees to logs/traces.jsonl (background writer) ===
+class TraceExporter:
+    def __init__(self, path: str = TRACE_PATH):
+        self.writer = InteractionLogger(path)
+        self.recent = deque(maxlen=RECENT_TRACES)
+
+    def export(self, root: Span):
+        spans = list(root.walk())
+        record = {
+            "trace_id": root.trace_id,
+            "total_tokens": sum(s.attributes.get("total_tokens", 0) for s in spans if s.name == "llm"),
+            "llm_calls": sum(1 for s in spans if s.name == "llm"),
+            "cache_hits": sum(1 for s in spans if s.attributes.get("cache_hit")),
+            **root.to_dict(),
+        }
+        self.recent.append(record)
+        self.writer.log(record)
+
+exporter = TraceExporter()
+
+
+# === 4. LangChain callback: one span per LLM call, with token counts ===
+class TracingCallback(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self):
+        self.runs = {}  # LangChain run_id -> Span
+
+    def _start(self, run_id, parent_run_id, metadata, **attributes):
+        parent = self.runs.get(parent_run_id) or _current.get()
+        if parent is None and metadata and metadata.get("trace_span_id"):
+            parent = _open_spans.get(metadata["trace_span_id"])
+        self.runs[run_id] = Span("llm", parent, **attributes)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") or (serialized or {}).get("name")
+        self._start(run_id, parent_run_id, metadata, model=model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") or (serialized or {}).get("name")
+        self._start(run_id, parent_run_id, metadata, model=model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        current = self.runs.pop(run_id, None)
+        if current is None:
+            return
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                for key in ("input_tokens", "output_tokens", "total_tokens"):
+                    usage[key] = usage.get(key, 0) + metadata.get(key, 0)
+        current.set(**usage)
+        current.end()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        current = self.runs.pop(run_id, None)
+        if current is not None:
+            current.end(error=error)
+
+tracing_callback = TracingCallback()
+
+
+# === 5. Metrics endpoint next to the Gradio app (stdlib, background thread) ===
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(metrics.snapshot(), indent=2), "application/json"
+        elif self.path.startswith("/traces"):
+            body, content_type = json.dumps(list(exporter.recent)[-20:], ensure_ascii=False), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # no access log on stdout
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{port}/metrics (JSON: /metrics.json, recent traces: /traces)")
+    return server
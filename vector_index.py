@@ -0,0 +1,512 @@
+import os
+import json
+import argparse
+import threading
+from typing import Any, Iterable, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from hybrid_retrieval import CHROMA_DIR
+from tracing import span
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "vector_index")
+COLLECTION_NAME = "example_collection"
+# float16 halves the matrix, int8 quarters it (one scale per row); scores stay within ~1e-3 / ~1e-2
+VECTOR_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float16")
+# auto: HNSW if hnswlib is installed, else IVF, both only from ANN_MIN_VECTORS on; "exact" always scans
+VECTOR_ANN = os.getenv("VECTOR_INDEX_ANN", "auto")
+ANN_MIN_VECTORS = 20000
+IVF_PROBES = 8
+HNSW_EF = 64
+# Candidates fetched per requested hit before the metadata filter is applied
+ANN_OVERSAMPLE = 4
+# Filters that leave at most this many rows are scanned exactly (company + year filters usually do)
+EXACT_FILTER_ROWS = 20000
+SCAN_BLOCK = 8192
+# The extraction record's full "content" is the chunk text already, don't store it twice
+SKIP_METADATA = {"content"}
+
+def chroma_signature(chroma_dir: str = CHROMA_DIR):
+    path = os.path.join(chroma_dir, "chroma.sqlite3")
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def normalize_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+
+
+# === 1. Metadata column store: one code array per field, Chroma `where` filters as numpy masks ===
+_OPERATORS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$gt": lambda value, arg: value > arg,
+    "$gte": lambda value, arg: value >= arg,
+    "$lt": lambda value, arg: value < arg,
+    "$lte": lambda value, arg: value <= arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+}
+
+def _category_key(value):
+    # True and 1 are equal in Python but different metadata values
+    return type(value).__name__, value
+
+class MetadataColumns:
+    def __init__(self, codes: dict, categories: dict, count: int):
+        self.codes = codes            # field -> int32 array, -1 where the row has no such field
+        self.categories = categories  # field -> list of distinct values
+        self.count = count
+
+    @classmethod
+    def build(cls, metadatas: list) -> "MetadataColumns":
+        lookup, codes = {}, {}
+        for row, metadata in enumerate(metadatas):
+            for field, value in (metadata or {}).items():
+                if field in SKIP_METADATA or value is None:
+                    continue
+                if field not in codes:
+                    lookup[field] = {}
+                    codes[field] = np.full(len(metadatas), -1, dtype=np.int32)
+                codes[field][row] = lookup[field].setdefault(_category_key(value), len(lookup[field]))
+        categories = {field: [value for _, value in keys] for field, keys in lookup.items()}
+        return cls(codes, categories, len(metadatas))
+
+    def _field_mask(self, field: str, condition) -> np.ndarray:
+        if field not in self.codes:
+            return np.zeros(self.count, dtype=bool)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        allowed = []
+        for code, value in enumerate(self.categories[field]):
+            try:
+                if all(_OPERATORS[op](value, arg) for op, arg in condition.items()):
+                    allowed.append(code)
+            except TypeError:
+                pass  # e.g. "$gt" between a string and a number: no match, like Chroma
+        return np.isin(self.codes[field], allowed)
+
+    def mask(self, where: Optional[dict]):
+        # None: no filter (every row); otherwise a boolean row mask
+        if not where:
+            return None
+        masks = []
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._mask_or_all(clause) for clause in condition]
+                masks.append((np.logical_and if key == "$and" else np.logical_or).reduce(parts))
+            else:
+                masks.append(self._field_mask(key, condition))
+        return np.logical_and.reduce(masks)
+
+    def _mask_or_all(self, where: Optional[dict]) -> np.ndarray:
+        mask = self.mask(where)
+        return np.ones(self.count, dtype=bool) if mask is None else mask
+
+    def row(self, index: int) -> dict:
+        return {field: self.categories[field][codes[index]] for field, codes in self.codes.items() if codes[index] >= 0}
+
+    def save(self, directory: str) -> dict:
+        # Files are numbered, field names can be anything
+        for i, codes in enumerate(self.codes.values()):
+            np.save(os.path.join(directory, f"meta_{i}.npy"), codes)
+        return {"fields": list(self.codes), "categories": self.categories}
+
+    @classmethod
+    def load(cls, directory: str, meta: dict, count: int) -> "MetadataColumns":
+        codes = {field: np.load(os.path.join(directory, f"meta_{i}.npy"), mmap_mode="r")
+                 for i, field in enumerate(meta["fields"])}
+        return cls(codes, meta["categories"], count)
+
+
+# === 2. Optional ANN structures over the normalized matrix ===
+def _blocks(vectors, rows=None):
+    # float32 copies of SCAN_BLOCK rows at a time: numpy has no fast float16/int8 matrix product
+    total = len(vectors) if rows is None else len(rows)
+    for start in range(0, total, SCAN_BLOCK):
+        selection = slice(start, start + SCAN_BLOCK) if rows is None else rows[start:start + SCAN_BLOCK]
+        yield start, np.asarray(vectors[selection], dtype=np.float32)
+
+def build_ivf(vectors, lists: int = None, iterations: int = 8, sample: int = 50000, seed: int = 0):
+    # Spherical k-means on a sample; every row is then assigned to its nearest centroid
+    rng = np.random.default_rng(seed)
+    lists = lists or max(1, int(np.sqrt(len(vectors))))
+    picked = np.sort(rng.choice(len(vectors), size=min(sample, len(vectors)), replace=False))
+    training = normalize_rows(np.asarray(vectors[picked], dtype=np.float32))
+    centroids = training[rng.choice(len(training), size=lists, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(training @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, training)
+        empty = ~sums.any(axis=1)
+        sums[empty] = training[rng.choice(len(training), size=int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start, block in _blocks(vectors):
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind="stable").astype(np.int32)
+    offsets = np.searchsorted(assignment[order], np.arange(lists + 1)).astype(np.int64)
+    return centroids, order, offsets
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, centroids, order, offsets, probes: int = IVF_PROBES):
+        self.centroids, self.order, self.offsets, self.probes = centroids, order, offsets, probes
+
+    def candidates(self, query: np.ndarray, fetch: int) -> np.ndarray:
+        nearest = np.argsort(-(self.centroids @ query))[:self.probes]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in nearest])
+
+    def save(self, directory: str):
+        for name in ("centroids", "order", "offsets"):
+            np.save(os.path.join(directory, f"ivf_{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str) -> "IVFIndex":
+        return cls(*(np.load(os.path.join(directory, f"ivf_{name}.npy"), mmap_mode="r")
+                     for name in ("centroids", "order", "offsets")))
+
+class HNSWIndex:
+    kind = "hnsw"
+
+    def __init__(self, index):
+        self.index = index
+
+    @classmethod
+    def build(cls, vectors, m: int = 16, ef_construction: int = 200) -> "HNSWIndex":
+        import hnswlib
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=len(vectors), M=m, ef_construction=ef_construction)
+        for start, block in _blocks(vectors):
+            index.add_items(normalize_rows(block), np.arange(start, start + len(block)))
+        index.set_ef(HNSW_EF)
+        return cls(index)
+
+    def candidates(self, query: np.ndarray, fetch: int) -> np.ndarray:
+        fetch = min(fetch, self.index.get_current_count())
+        self.index.set_ef(max(HNSW_EF, fetch))
+        labels, _ = self.index.knn_query(query[None, :], k=fetch)
+        return labels[0].astype(np.int64)
+
+    def save(self, directory: str):
+        self.index.save_index(os.path.join(directory, "hnsw.bin"))
+
+    @classmethod
+    def load(cls, directory: str, dim: int, count: int) -> "HNSWIndex":
+        import hnswlib
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.load_index(os.path.join(directory, "hnsw.bin"), max_elements=count)
+        index.set_ef(HNSW_EF)
+        return cls(index)
+
+def ann_kind(requested: str, count: int) -> str:
+    if requested == "exact" or (requested == "auto" and count < ANN_MIN_VECTORS):
+        return "exact"
+    if requested in ("auto", "hnsw"):
+        try:
+            import hnswlib  # noqa: F401
+            return "hnsw"
+        except ImportError:
+            if requested == "hnsw":
+                print("⚠️ hnswlib not installed, using the IVF index instead.")
+    return "ivf"
+
+
+# === 3. Index on disk: memory-mapped matrix, chunk texts and metadata columns ===
+class VectorIndex:
+    def __init__(self, directory: str, meta: dict):
+        self.directory = directory
+        self.meta = meta
+        self.space = meta["space"]
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.scales = (np.load(os.path.join(directory, "scales.npy"), mmap_mode="r")
+                       if meta["dtype"] == "int8" else None)
+        self._offsets = np.load(os.path.join(directory, "text_offsets.npy"), mmap_mode="r")
+        self._texts = np.memmap(os.path.join(directory, "texts.bin"), dtype=np.uint8, mode="r") \
+            if self._offsets[-1] else np.zeros(0, dtype=np.uint8)
+        with open(os.path.join(directory, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.columns = MetadataColumns.load(directory, meta["metadata"], len(self.ids))
+        self.ann = None
+        if meta["ann"] == "ivf":
+            self.ann = IVFIndex.load(directory)
+        elif meta["ann"] == "hnsw":
+            try:
+                self.ann = HNSWIndex.load(directory, self.vectors.shape[1], len(self.ids))
+            except ImportError:
+                print("⚠️ hnswlib not installed, the vector index falls back to exact search.")
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "exact": 0, "ann": 0, "ann_fallbacks": 0}
+
+    @classmethod
+    def build(cls, directory: str, ids: list, texts: list, metadatas: list, vectors, dtype: str = VECTOR_DTYPE,
+              ann: str = VECTOR_ANN, space: str = "l2", source: dict = None) -> "VectorIndex":
+        if dtype not in ("float16", "int8", "float32"):
+            raise ValueError(f"dtype must be float16, int8 or float32, not {dtype!r}")
+        os.makedirs(directory, exist_ok=True)
+        # meta.json is written last and removed first: a half-written index is never loaded
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        vectors = normalize_rows(vectors).reshape(len(ids), -1)
+        if dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0 + 1e-12
+            np.save(os.path.join(directory, "vectors.npy"), np.round(vectors / scales[:, None]).astype(np.int8))
+            np.save(os.path.join(directory, "scales.npy"), scales.astype(np.float32))
+        else:
+            np.save(os.path.join(directory, "vectors.npy"), vectors.astype(dtype))
+        encoded = [(text or "").encode("utf-8") for text in texts]
+        with open(os.path.join(directory, "texts.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(os.path.join(directory, "text_offsets.npy"),
+                np.concatenate([[0], np.cumsum([len(e) for e in encoded])]).astype(np.int64))
+        with open(os.path.join(directory, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(list(ids), f)
+        columns = MetadataColumns.build(metadatas)
+
+        kind = ann_kind(ann, len(ids))
+        with span("vector_index_build", ann=kind, vectors=len(ids)):
+            if kind == "hnsw":
+                HNSWIndex.build(vectors).save(directory)
+            elif kind == "ivf":
+                IVFIndex(*build_ivf(vectors)).save(directory)
+        meta = {"count": len(ids), "dim": int(vectors.shape[1]) if len(ids) else 0, "dtype": dtype, "ann": kind,
+                "space": space, "source": source, "metadata": columns.save(directory)}
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_path + ".tmp", meta_path)
+        return cls(directory, meta)
+
+    @classmethod
+    def load(cls, directory: str = VECTOR_INDEX_DIR) -> "VectorIndex":
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            return cls(directory, json.load(f))
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Rows ---
+    def text(self, row: int) -> str:
+        return bytes(self._texts[self._offsets[row]:self._offsets[row + 1]]).decode("utf-8")
+
+    def document(self, row: int) -> Document:
+        return Document(page_content=self.text(row), metadata=self.columns.row(row), id=self.ids[row])
+
+    def dense_rows(self, rows) -> np.ndarray:
+        # Dequantized, unit-length vectors of the given rows
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        return vectors * self.scales[rows][:, None] if self.scales is not None else vectors
+
+    # --- Search: cosine similarity of unit vectors ---
+    def _similarities(self, query: np.ndarray, rows=None) -> np.ndarray:
+        total = len(self.ids) if rows is None else len(rows)
+        similarities = np.empty(total, dtype=np.float32)
+        for start, block in _blocks(self.vectors, rows):
+            similarities[start:start + len(block)] = block @ query
+        if self.scales is not None:
+            similarities *= self.scales if rows is None else self.scales[rows]
+        return similarities
+
+    def _top(self, query: np.ndarray, rows, k: int):
+        similarities = self._similarities(query, rows)
+        if k < len(similarities):
+            best = np.argpartition(-similarities, k)[:k]
+        else:
+            best = np.arange(len(similarities))
+        best = best[np.argsort(-similarities[best], kind="stable")]
+        rows = best if rows is None else rows[best]
+        return [(int(row), float(score)) for row, score in zip(rows, similarities[best])]
+
+    def search(self, query_vector, k: int = 4, where: Optional[dict] = None):
+        # Returns [(row, cosine similarity)], best first
+        query = normalize_rows(query_vector).reshape(-1)
+        mask = self.columns.mask(where)
+        selected = None if mask is None else np.flatnonzero(mask)
+        with span("vector_search", backend="mmap", ann=self.meta["ann"]) as current:
+            hits, method = None, "exact"
+            if self.ann is not None and (selected is None or len(selected) > EXACT_FILTER_ROWS):
+                candidates = self.ann.candidates(query, k * ANN_OVERSAMPLE if mask is not None else k * 2)
+                if mask is not None:
+                    candidates = candidates[mask[candidates]]
+                if len(candidates) >= k:
+                    # Candidates are re-scored from the stored matrix, so every method ranks alike
+                    hits, method = self._top(query, np.sort(candidates), k), "ann"
+                else:
+                    self._count("ann_fallbacks")
+            if hits is None:
+                hits = self._top(query, selected, k) if selected is None or len(selected) else []
+            current.set(method=method, hits=len(hits), filtered=selected is not None)
+        self._count("queries")
+        self._count(method)
+        return hits
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, ids: list = None, where: Optional[dict] = None, limit: int = None, offset: int = None,
+            include: Iterable[str] = ("documents", "metadatas")) -> dict:
+        # Same result shape as Chroma's collection.get (BM25Index.from_vectorstore reads it)
+        rows = np.arange(len(self.ids)) if ids is None else np.array(
+            [self._row_of[i] for i in ids if i in self._row_of], dtype=np.int64)
+        mask = self.columns.mask(where)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        rows = rows[(offset or 0):((offset or 0) + limit) if limit is not None else None]
+        result = {"ids": [self.ids[r] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [self.text(r) for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.columns.row(r) for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = self.dense_rows(rows) if len(rows) else np.zeros((0, self.meta["dim"]))
+        return result
+
+    def format_stats(self) -> str:
+        s = self.stats
+        return (f"🧮 Vector index: {len(self)} vectors ({self.meta['dtype']}, {self.meta['ann']}), "
+                f"{s['queries']} queries, {s['exact']} exact, {s['ann']} ANN, {s['ann_fallbacks']} ANN fallbacks")
+
+
+# === 4. LangChain vector store over the index (same retriever interface as Chroma) ===
+class VectorIndexStore(VectorStore):
+    def __init__(self, index: VectorIndex, embedding: Embeddings):
+        self.index = index
+        self.embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _distance(self, similarity: float) -> float:
+        # Same distance as the Chroma collection it was exported from, so relevance scores
+        # (and thresholds like hybrid_retrieval.LOW_RETRIEVAL_SCORE) keep their meaning
+        if self.index.space == "l2":
+            return 2.0 - 2.0 * similarity  # squared L2 of unit vectors
+        return 1.0 - similarity
+
+    def _select_relevance_score_fn(self):
+        if self.index.space == "cosine":
+            return self._cosine_relevance_score_fn
+        if self.index.space == "ip":
+            return self._max_inner_product_relevance_score_fn
+        return self._euclidean_relevance_score_fn
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None, **kwargs: Any):
+        return [(self.index.document(row), self._distance(similarity))
+                for row, similarity in self.index.search(embedding, k, filter)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                                     **kwargs: Any):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def get(self, ids: list = None, where: Optional[dict] = None, limit: int = None, offset: int = None,
+            include: Iterable[str] = ("documents", "metadatas")) -> dict:
+        return self.index.get(ids, where, limit, offset, include)
+
+    def get_by_ids(self, ids, /) -> List[Document]:
+        data = self.get(ids=list(ids))
+        return [Document(page_content=text, metadata=metadata, id=chunk_id)
+                for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        # The matrix is immutable on disk: adding rewrites the index (fine for occasional re-ingests)
+        texts = list(texts)
+        ids = list(ids) if ids else [f"chunk-{len(self.index) + i}" for i in range(len(texts))]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        old = self.index.get(include=("documents", "metadatas", "embeddings"))
+        meta = self.index.meta
+        self.index = VectorIndex.build(
+            self.index.directory, old["ids"] + ids, old["documents"] + texts,
+            old["metadatas"] + list(metadatas or [{} for _ in texts]),
+            np.vstack([old["embeddings"], vectors]) if len(old["ids"]) else vectors,
+            dtype=meta["dtype"], ann=kwargs.get("ann", VECTOR_ANN), space=meta["space"], source=None)
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, directory: str = VECTOR_INDEX_DIR, dtype: str = VECTOR_DTYPE,
+                   ann: str = VECTOR_ANN, **kwargs: Any) -> "VectorIndexStore":
+        ids = list(ids) if ids else [f"chunk-{i}" for i in range(len(texts))]
+        vectors = np.asarray(embedding.embed_documents(list(texts)), dtype=np.float32)
+        index = VectorIndex.build(directory, ids, list(texts), list(metadatas or [{} for _ in texts]), vectors,
+                                  dtype=dtype, ann=ann)
+        return cls(index, embedding)
+
+
+# === 5. Export from the existing Chroma DB ===
+def chroma_space(vectorstore) -> str:
+    # Distance of the collection, read like langchain_chroma does (Chroma's default is l2)
+    try:
+        configuration = vectorstore._collection.configuration
+        config = configuration.get("hnsw") or configuration.get("spann") or {}
+        return config.get("space") or "l2"
+    except Exception:
+        return "l2"
+
+def export_from_chroma(vectorstore, directory: str = VECTOR_INDEX_DIR, dtype: str = VECTOR_DTYPE,
+                       ann: str = VECTOR_ANN, batch_size: int = 5000, source: dict = None) -> VectorIndex:
+    collection = vectorstore._collection
+    ids, texts, metadatas, vectors = [], [], [], []
+    with span("vector_index_export", vectors=collection.count()):
+        for offset in range(0, collection.count(), batch_size):
+            data = collection.get(limit=batch_size, offset=offset,
+                                  include=["embeddings", "documents", "metadatas"])
+            ids += data["ids"]
+            texts += data["documents"]
+            metadatas += data["metadatas"]
+            vectors.append(np.asarray(data["embeddings"], dtype=np.float32))
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return VectorIndex.build(directory, ids, texts, metadatas, matrix, dtype=dtype, ann=ann,
+                                 space=chroma_space(vectorstore), source=source)
+
+def load_or_export(embeddings: Embeddings, directory: str = VECTOR_INDEX_DIR, chroma_dir: str = CHROMA_DIR,
+                   collection_name: str = COLLECTION_NAME) -> VectorIndexStore:
+    # Re-exported when the Chroma DB changed since the export (e.g. after data_chunkieren.py)
+    signature = chroma_signature(chroma_dir)
+    meta_path = os.path.join(directory, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            exported_from = json.load(f).get("source")
+        if signature is None or exported_from == signature:
+            with span("vector_index_load"):
+                return VectorIndexStore(VectorIndex.load(directory), embeddings)
+    if signature is None:
+        raise FileNotFoundError(f"Neither {meta_path} nor a Chroma DB in {chroma_dir} to export it from.")
+    from langchain_chroma import Chroma
+    chroma = Chroma(collection_name=collection_name, embedding_function=embeddings, persist_directory=chroma_dir)
+    return VectorIndexStore(export_from_chroma(chroma, directory, source=signature), embeddings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Chroma collection into the memory-mapped vector index.")
+    parser.add_argument("--chroma-dir", default=CHROMA_DIR)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--out", default=VECTOR_INDEX_DIR)
+    parser.add_argument("--dtype", choices=["float16", "int8", "float32"], default=VECTOR_DTYPE)
+    parser.add_argument("--ann", choices=["auto", "exact", "ivf", "hnsw"], default=VECTOR_ANN)
+    args = parser.parse_args()
+
+    from langchain_chroma import Chroma
+    from embedding_cache import get_embeddings
+    chroma = Chroma(collection_name=args.collection, embedding_function=get_embeddings(),
+                    persist_directory=args.chroma_dir)
+    index = export_from_chroma(chroma, args.out, args.dtype, args.ann, source=chroma_signature(args.chroma_dir))
+    size = sum(os.path.getsize(os.path.join(args.out, name)) for name in os.listdir(args.out))
+    print(f"✅ {len(index)} vectors ({index.meta['dtype']}, {index.meta['ann']}, {index.space}) "
+          f"exported to {args.out} ({size / 1024 / 1024:.1f} MB).")
@@ -1,61 +1,87 @@
-python
-from langchain_tavily import TavilySearch
-from langchain.chat_models import init_chat_model
-from langgraph.prebuilt import create_react_agent
 import os
+import threading
 from dotenv import load_dotenv
-from datetime import datetime
 from langchain.agents import tool
+from components import registry
+from search_cache import build_web_search
+from interaction_log import get_interaction_log, make_record
+from tracing import span
 
 # Load .env file
 load_dotenv()
 
+# One search layer per process: shared Tavily client, persistent TTL cache, coalesced requests
+# (WEB_SEARCH_BACKEND=stub for offline runs; benchmarks can registry.override("web_search", ...))
+registry.register("web_search", build_web_search)
+
 # Define web search tool as @tool
 @tool
 def web_search_tool(query: str):
     """Performs a web search and returns content and source (URL, if available)."""
-    search = TavilySearch(max_results=3)
-    web_search_results = search.invoke(query)
-    if "results" in web_search_results and len(web_search_results["results"]) > 0:
-        result = web_search_results["results"][0]
+    # All results stay in the cache; the answer is the best one
+    results = registry.get("web_search").search(query)
+    if results:
+        result = results[0]
         content = result.get("content", "")
         source = result.get("source") or result.get("url") or "Source unknown"
         return content, source
     else:
         return "No results found.", "Source unknown"
 
-# Initialize model
-llm = init_chat_model("gemini-2.0-flash", model_provider="google_genai")
+# Model and agent are created on first use, not at import time
+_llm = None
+_research_agent = None
+_lock = threading.Lock()
+
+def get_llm():
+    global _llm
+    with _lock:
+        if _llm is None:
+            from llm_pool import get_chat_model
+            # Initialize model (shared, rate-limited Gemini client)
+            _llm = get_chat_model()
+        return _llm
 
 # Function to save answer and source
 def store_answer_and_source(question, answer, source):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open("answers_and_sources.txt", "a", encoding="utf-8") as file:
-        file.write(f"Timestamp: {timestamp}\n")
-        file.write(f"Question: {question}\n")
-        file.write(f"Answer: {answer}\n")
-        file.write(f"Source: {source}\n")
-        file.write("\n" + "-"*50 + "\n")
+    # Queued for the background interaction log writer instead of appending to a text file per call
+    get_interaction_log().log(make_record("web", question, answer, source, route="Web-Agent"))
 
 # Create agent
-research_agent = create_react_agent(
-    model=llm,
-    tools=[web_search_tool],
-    prompt=(
-        "You are a research agent.\n\n"
-        "INSTRUCTIONS:\n"
-        "- Assist ONLY with research-related tasks, DO NOT do any math\n"
-        "- After you're done with your tasks, respond to the supervisor directly\n"
-        "- Respond ONLY with the results of your work, do NOT include ANY other text.\n"
-        "- After you find the answer, store the answer along with the source."
-    ),
-)
-research_agent.name = "research_agent"
+def get_research_agent():
+    global _research_agent
+    llm = get_llm()
+    with _lock:
+        if _research_agent is None:
+            from langgraph.prebuilt import create_react_agent
+            _research_agent = create_react_agent(
+                model=llm,
+                tools=[web_search_tool],
+                prompt=(
+                    "You are a research agent.\n\n"
+                    "INSTRUCTIONS:\n"
+                    "- Assist ONLY with research-related tasks, DO NOT do any math\n"
+                    "- After you're done with your tasks, respond to the supervisor directly\n"
+                    "- Respond ONLY with the results of your work, do NOT include ANY other text.\n"
+                    "- After you find the answer, store the answer along with the source."
+                ),
+            )
+            _research_agent.name = "research_agent"
+        return _research_agent
+
+# `from web_such_agent import research_agent` keeps working (builds the agent on access)
+def __getattr__(name):
+    if name == "llm":
+        return get_llm()
+    if name == "research_agent":
+        return get_research_agent()
+    raise AttributeError(f"module 'web_such_agent' has no attribute '{name}'")
 
 # Example: Ask question and save answer with source
 def ask_question_and_save_answer(question):
     # Execute web search
-    answer, source = web_search_tool.invoke(question)
+    with span("web_agent"):
+        answer, source = web_search_tool.invoke(question)
     
     # Save the answer
     store_answer_and_source(question, answer, source)